@@ -10,7 +10,7 @@ from langchain_community.vectorstores import FAISS
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from llm_clients import get_chat_model, get_embeddings, warm_up_in_background, is_offline_backend
 from dotenv import load_dotenv
 import json
 import threading
@@ -27,8 +27,9 @@ ADMIN_PASSWORD = "1234"  # 실제 사용시 더 복잡한 비밀번호로 변경
 
 # PDF 경로와 벡터 저장 디렉토리 설정
 JSON_PATH = "rag_input_sample1.json"
-VECTOR_DIR = "vectorstore"
-embeddings = OpenAIEmbeddings()
+# 오프라인 백엔드(해싱 임베딩)는 실제 인덱스를 덮어쓰지 않도록 별도 디렉토리 사용
+VECTOR_DIR = "vectorstore_offline" if is_offline_backend() else "vectorstore"
+embeddings = get_embeddings()
 
 # 관리자 인증 데코레이터
 def admin_required(f):
@@ -125,10 +126,8 @@ class ChatbotGuardrails:
     def check_welfare_relevance(self, question: str) -> Dict[str, Any]:
         """GPT를 사용하여 복지용구 관련성 검증"""
         try:
-            from langchain_openai import ChatOpenAI
-            
             # 빠른 응답을 위해 간단한 모델 사용
-            llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0, max_tokens=50)
+            llm = get_chat_model("gpt-3.5-turbo", temperature=0, max_tokens=50)
             
             relevance_prompt = f"""
 다음 질문이 노인복지용구와 관련이 있는지 판단해주세요.
@@ -170,10 +169,8 @@ class ChatbotGuardrails:
     def verify_and_correct_answer(self, question: str, answer: str) -> str:
         """답변을 검증하고 필요시 교정"""
         try:
-            from langchain_openai import ChatOpenAI
-            
             # 빠른 검증용 모델
-            llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0, max_tokens=150)
+            llm = get_chat_model("gpt-3.5-turbo", temperature=0, max_tokens=150)
             
             verify_prompt = f"""
 다음 답변에 명백한 오류가 있는지만 검증해주세요. 새로운 정보를 추가하지 마세요.
@@ -473,9 +470,7 @@ def init_vectorstore():
 def filter_relevant_context(question: str, retrieved_docs):
     """검색된 문서 중 질문과 실제로 관련있는 것만 필터링"""
     try:
-        from langchain_openai import ChatOpenAI
-        
-        llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0, max_tokens=100)
+        llm = get_chat_model("gpt-3.5-turbo", temperature=0, max_tokens=100)
         
         filtered_docs = []
         
@@ -630,7 +625,7 @@ def init_chain():
 #Answer:"""
     )
     
-    llm = ChatOpenAI(model_name="gpt-4o", temperature=0, model_kwargs={"max_completion_tokens": 2000} )
+    llm = get_chat_model("gpt-4o", temperature=0, model_kwargs={"max_completion_tokens": 2000} )
     
     def get_filtered_context(question):
         # 1단계: GPT로 질문을 검색 키워드로 정리
@@ -647,7 +642,7 @@ def init_chain():
 키워드:"""
 
         try:
-            llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0, max_tokens=50)
+            llm = get_chat_model("gpt-3.5-turbo", temperature=0, max_tokens=50)
             response = llm.invoke(search_prompt)
             keywords = response.content.strip()
             
@@ -678,6 +673,12 @@ def init_chain():
 # 전역 변수로 체인 저장
 chain = init_chain()
 
+# OpenAI 커넥션 풀 미리 채우기 (TLS 핸드셰이크를 다음 요청들에서 치르지 않도록)
+# import 때가 아니라 프로세스의 첫 요청에서 → gunicorn --preload 마스터가 커넥션을 열지 않음
+@app.before_request
+def _warm_up_worker():
+    warm_up_in_background()
+
 # 사용자별 마지막 질문 시간 추적
 user_last_question_time = {}
 
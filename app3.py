@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, stream_with_context
 import os
 import re
 import csv
@@ -6,17 +6,32 @@ from datetime import datetime, timedelta
 from typing import Dict, Any
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_community.vectorstores import FAISS
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_community.retrievers import BM25Retriever
-from langchain.retrievers import EnsembleRetriever
+from llm_clients import get_chat_model, get_embeddings, warm_up_in_background, is_offline_backend
+from bm25_index import CSR_AVAILABLE, BM25Index, CSRBM25Retriever, default_tokenize, get_tokenizer
+from hybrid_retriever import HybridRetriever, doc_key, is_decisive
+from embedding_cache import CachedQueryEmbeddings, ChunkEmbeddingStore
+from embed_scheduler import EmbeddingScheduler
+from faiss_store import ColumnarDocstore, load_vectorstore, save_vectorstore, ensure_writable
+from faiss_index import build_vectorstore, describe, set_search_params
 from dotenv import load_dotenv
 import json
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FuturesTimeoutError
+from openai import APITimeoutError
+from collections import OrderedDict
+import numpy as np
+import sqlite3
+import unicodedata
+import faiss
+import uuid
+from langchain_community.callbacks import get_openai_callback
+from langchain_core.callbacks import BaseCallbackHandler
+from contextlib import contextmanager
+import contextvars
 
 
 app = Flask(__name__)
@@ -32,16 +47,72 @@ ADMIN_PASSWORD = "1234"  # 실제 사용시 더 복잡한 비밀번호로 변경
 
 # PDF 경로와 벡터 저장 디렉토리 설정
 JSON_PATH = "rag_input_sample1.json"
-VECTOR_DIR = "vectorstore"
-embeddings = OpenAIEmbeddings()
+# 오프라인 백엔드(해싱 임베딩)는 실제 인덱스를 덮어쓰지 않도록 별도 디렉토리 사용
+VECTOR_DIR = "vectorstore_offline" if is_offline_backend() else "vectorstore"
+# index.faiss를 읽기 전용 mmap으로 열어 워커끼리 페이지 캐시로 공유 (0이면 힙으로 전부 읽음)
+FAISS_MMAP = os.getenv("FAISS_MMAP", "1") == "1"
+# 저장 시 index.pkl(pickle docstore)도 함께 씀 — 같은 디렉터리를 FAISS.load_local로 읽는 app.py~app2.py용
+FAISS_LEGACY_PICKLE = os.getenv("FAISS_LEGACY_PICKLE", "1") == "1"
+# 새로 만들 때의 FAISS 인덱스 종류: flat(전수 탐색, 기본) | ivf | ivfpq | hnsw | 팩토리 문자열 ("IVF1024,PQ64" 등)
+FAISS_INDEX = os.getenv("FAISS_INDEX", "flat")
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "0")) or None      # 0이면 4·√청크 수
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "0")) or None        # 0이면 차원을 나누는 64 이하 최댓값
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+# 질의 시점 조절값 (IVF: 훑을 클러스터 수, HNSW: 탐색 후보 수). 클수록 정확하고 느림
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "128"))
+# IVF/PQ 학습 결과는 전체 재구축(VECTOR_DIR 삭제) 뒤에도 재사용하도록 따로 저장
+FAISS_TRAINED_DIR = os.getenv("FAISS_TRAINED_DIR", f"{VECTOR_DIR}_trained")
+# 질의 임베딩 LRU 캐시 (FAISS 검색과 시맨틱 캐시가 공유, 같은 질문은 요청/사용자가 달라도 API 한 번)
+QUERY_EMBED_CACHE_MB = int(os.getenv("QUERY_EMBED_CACHE_MB", "64"))
+QUERY_EMBED_CACHE_PERSIST = os.getenv("QUERY_EMBED_CACHE_PERSIST", "1") == "1"
+QUERY_EMBED_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_embed_cache.db')
+# 청크 임베딩 캐시: hash(모델, 청크 본문) → 벡터. 재구축/데이터 추가 때 새로 생기거나 바뀐 청크만 API 호출
+CHUNK_EMBED_CACHE = os.getenv("CHUNK_EMBED_CACHE", "1") == "1"
+CHUNK_EMBED_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chunk_embed_cache.db')
+EMBED_COST_PER_1M_TOKENS = float(os.getenv("EMBED_COST_PER_1M_TOKENS", "0.10"))  # 절감액 표시용 (ada-002 기준)
+# 청크 임베딩 스케줄러: 토큰 수 기준으로 요청을 묶어 RPM/TPM 안에서 동시에, 429는 백오프 재시도
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_RPM = int(os.getenv("EMBED_RPM", "3000"))
+EMBED_TPM = int(os.getenv("EMBED_TPM", "1000000"))
+EMBED_MAX_TOKENS_PER_REQUEST = int(os.getenv("EMBED_MAX_TOKENS_PER_REQUEST", "100000"))
+EMBED_MAX_INPUTS_PER_REQUEST = int(os.getenv("EMBED_MAX_INPUTS_PER_REQUEST", "1000"))
+# 단계 예산이 걸린 OpenAI 호출의 SDK 재시도 횟수. 기본 2회면 타임아웃이 재시도마다 다시 걸려
+# 3초 예산이 ~9초가 되므로 0 (청크 임베딩 재시도는 EmbeddingScheduler가 따로 함)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "0"))
+BASE_EMBEDDING_PARAMS = {"request_timeout": 30, "max_retries": LLM_MAX_RETRIES}  # 질의 임베딩이 무한 대기하지 않도록
+_base_embeddings = get_embeddings(**BASE_EMBEDDING_PARAMS)
+
+
+def _embed_chunk_batch(texts):
+    # 전역을 호출 시점에 읽음 → fork 이후 워커가 바꿔 끼운 클라이언트를 씀 (_init_worker)
+    return _base_embeddings.embed_documents(texts)
+
+
+embed_scheduler = EmbeddingScheduler(
+    _embed_chunk_batch, model=getattr(_base_embeddings, "model", None),
+    max_tokens_per_request=EMBED_MAX_TOKENS_PER_REQUEST, max_inputs_per_request=EMBED_MAX_INPUTS_PER_REQUEST,
+    concurrency=EMBED_CONCURRENCY, rpm=EMBED_RPM, tpm=EMBED_TPM,
+)
+last_embed_build = {}   # 마지막 인덱스 구축/추가의 청크 임베딩 캐시 리포트
+embeddings = CachedQueryEmbeddings(
+    _base_embeddings,
+    max_bytes=QUERY_EMBED_CACHE_MB * 1024 * 1024,
+    path=QUERY_EMBED_CACHE_PATH if QUERY_EMBED_CACHE_PERSIST else None,
+    chunk_store=ChunkEmbeddingStore(CHUNK_EMBED_CACHE_PATH) if CHUNK_EMBED_CACHE else None,
+    cost_per_1m_tokens=EMBED_COST_PER_1M_TOKENS,
+    scheduler=embed_scheduler,
+)
 
 bm25_retriever = None
+bm25_index = None    # vectorstore/bm25.json.gz 에 저장되는 증분 BM25
 hybrid_retriever = None
 
 # === 전역 싱글톤 객체들 (위로 올리기) ===
 vectorstore = None
 retriever = None
 chain = None
+chunk_index = None   # group_key / 앞뒤 청크 인덱스 (init_vectorstore에서 생성)
 
 # 관리자 인증 데코레이터
 def admin_required(f):
@@ -52,6 +123,109 @@ def admin_required(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+# === 단계별 지연/토큰 메트릭 (/admin/metrics, Server-Timing) ===
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+class Histogram:
+    """라벨 하나를 가진 Prometheus 히스토그램 (프로세스 단위)"""
+    def __init__(self, name, help_text, label, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}  # 라벨 값 -> [버킷별 개수, 합계, 개수]
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = [[0] * len(self.buckets), 0.0, 0]
+                self._series[label_value] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_value, (counts, total, count) in sorted(self._series.items()):
+                label = f'{self.label}="{label_value}"'
+                for bound, c in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {c}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+                lines.append(f"{self.name}_sum{{{label}}} {total}")
+                lines.append(f"{self.name}_count{{{label}}} {count}")
+        return "\n".join(lines)
+
+stage_seconds = Histogram("rag_stage_seconds", "Wall time of each /ask pipeline stage", "stage", LATENCY_BUCKETS)
+request_seconds = Histogram("rag_request_seconds", "End-to-end request latency", "endpoint", LATENCY_BUCKETS)
+request_tokens = Histogram("rag_request_tokens", "OpenAI tokens used per request", "kind", TOKEN_BUCKETS)
+
+class RequestTimings:
+    """요청 하나의 단계별 누적 시간 (Server-Timing 헤더용)"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = OrderedDict()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def header(self):
+        with self._lock:
+            return ", ".join(f"{stage};dur={sec * 1000:.1f}" for stage, sec in self.stages.items())
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+def record_stage(stage, seconds):
+    stage_seconds.observe(stage, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+@contextmanager
+def stage_timer(stage):
+    """with stage_timer("bm25"): ... → 히스토그램 + 현재 요청의 Server-Timing에 기록"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+class StageTimingCallback(BaseCallbackHandler):
+    """LLM 호출 시작~끝 시간을 단계 메트릭으로 기록 (스트리밍 포함)"""
+    def __init__(self, stage):
+        self.stage = stage
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            record_stage(self.stage, time.perf_counter() - started)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.on_llm_end(None, run_id=run_id)
+
+def record_request(endpoint, seconds, cb=None):
+    request_seconds.observe(endpoint, seconds)
+    if cb is not None:
+        request_tokens.observe("prompt", cb.prompt_tokens)
+        request_tokens.observe("completion", cb.completion_tokens)
+
+def submit_with_context(pool, fn, *args):
+    """현재 요청의 contextvars(메트릭/토큰 콜백)를 이어받아 스레드풀에 제출"""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
 # 챗봇 가드레일 클래스
 class ChatbotGuardrails:
     def __init__(self):
@@ -93,8 +267,49 @@ class ChatbotGuardrails:
         self.user_last_questions = {}
         self.user_last_timestamps = {}
     
-    def validate_question(self, question: str, user_id: str = "default") -> Dict[str, Any]:
-        """질문 유효성 검증"""
+    def validate_question(self, question: str, user_id: str = "default", relevance_future=None,
+                          relevance_timeout=None) -> Dict[str, Any]:
+        """질문 유효성 검증 (relevance_future: 미리 띄워둔 check_welfare_relevance 결과 Future)"""
+        question = question.strip()
+        
+        # 1~3. 규칙 기반 검증 (LLM 호출 없음)
+        rule_check = self.check_rules(question)
+        if rule_check is not None:
+            return rule_check
+        
+        # 4. GPT 기반 관련성 검증
+        if relevance_future is not None:
+            try:
+                relevance_check = relevance_future.result(timeout=relevance_timeout)
+            except FuturesTimeoutError:
+                if relevance_future.cancel():
+                    # 대기열에서 시작도 못 함 → 통과로 치지 않고 여기서 직접 검증
+                    print("⏳ 관련성 검증이 시작되지 못함 → 직접 실행")
+                    relevance_check = self.check_welfare_relevance(question, STAGE_BUDGETS["relevance"])
+                else:
+                    # 실행 중: 예산은 작업 시작부터라 HTTP 타임아웃 안에 끝남
+                    try:
+                        relevance_check = relevance_future.result(timeout=STAGE_BUDGETS["relevance"])
+                    except FuturesTimeoutError:
+                        # 예산 초과 시 오류와 동일하게 안전하게 허용 (기존 RAG에서 처리)
+                        print("⏱️ 관련성 검증 시간 초과 → 통과 처리")
+                        relevance_check = {
+                            'is_relevant': True,
+                            'message': '검증 시간이 초과되었지만 진행합니다.'
+                        }
+        else:
+            relevance_check = self.check_welfare_relevance(question)
+        if not relevance_check['is_relevant']:
+            return {
+                'valid': False,
+                'message': relevance_check['message'],
+                'examples': self.get_random_examples(3)
+            }
+        
+        return {'valid': True, 'message': '질문이 유효합니다.'}
+    
+    def check_rules(self, question: str):
+        """규칙 기반 검증(길이/의미없는 단어/금지어). 통과하면 None"""
         question = question.strip()
         
         # 1. 길이 검증
@@ -124,24 +339,13 @@ class ChatbotGuardrails:
                     'examples': self.get_random_examples(3)
                 }
         
-        # 4. GPT 기반 관련성 검증
-        relevance_check = self.check_welfare_relevance(question)
-        if not relevance_check['is_relevant']:
-            return {
-                'valid': False,
-                'message': relevance_check['message'],
-                'examples': self.get_random_examples(3)
-            }
-        
-        return {'valid': True, 'message': '질문이 유효합니다.'}
+        return None
     
-    def check_welfare_relevance(self, question: str) -> Dict[str, Any]:
-        """GPT를 사용하여 복지용구 관련성 검증"""
+    def check_welfare_relevance(self, question: str, timeout=None) -> Dict[str, Any]:
+        """GPT를 사용하여 복지용구 관련성 검증 (timeout: OpenAI HTTP 요청 타임아웃, 초)"""
         try:
-            from langchain_openai import ChatOpenAI
-            
             # 빠른 응답을 위해 간단한 모델 사용
-            llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0, max_tokens=50)
+            llm = get_chat_model("gpt-3.5-turbo", temperature=0, max_tokens=50, max_retries=LLM_MAX_RETRIES)
             
             relevance_prompt = f"""
 다음 질문이 노인복지용구와 관련이 있는지 판단해주세요.
@@ -158,7 +362,8 @@ class ChatbotGuardrails:
 
 답변:"""
 
-            response = llm.invoke(relevance_prompt)
+            with stage_timer("relevance"):
+                response = llm.invoke(relevance_prompt, **timeout_kwargs(timeout))
             result = response.content.strip().upper()
             
             if "YES" in result:
@@ -183,10 +388,8 @@ class ChatbotGuardrails:
     def verify_and_correct_answer(self, question: str, answer: str) -> str:
         """답변을 검증하고 필요시 교정"""
         try:
-            from langchain_openai import ChatOpenAI
-            
             # 빠른 검증용 모델
-            llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0, max_tokens=150)
+            llm = get_chat_model("gpt-3.5-turbo", temperature=0, max_tokens=150)
             
             verify_prompt = f"""
 다음 답변에 명백한 오류가 있는지만 검증해주세요. 새로운 정보를 추가하지 마세요.
@@ -205,7 +408,8 @@ class ChatbotGuardrails:
 
 검증:"""
 
-            response = llm.invoke(verify_prompt)
+            with stage_timer("verification"):
+                response = llm.invoke(verify_prompt)
             result = response.content.strip()
             
             if result.startswith("BLOCK:"):
@@ -302,7 +506,7 @@ def save_chat_log(question, answer, is_fallback=False):
     # CSV 파일이 없으면 헤더와 함께 생성
     file_exists = os.path.exists(csv_path)
     
-    with open(csv_path, 'a', newline='', encoding='utf-8-sig') as file:
+    with stage_timer("log_write"), open(csv_path, 'a', newline='', encoding='utf-8-sig') as file:
         writer = csv.writer(file)
         if not file_exists:
             writer.writerow(['timestamp', 'question', 'answer', 'status', 'category'])
@@ -399,7 +603,7 @@ def read_chat_logs(limit=None, category=None):
 # init_vectorstore 함수 수정 (교체용)
 def init_vectorstore():
     
-    global vectorstore                     # ✅ 전역 사용 선언
+    global vectorstore, chunk_index        # ✅ 전역 사용 선언
 
     # ✅ 이미 메모리에 만들어져 있으면 그대로 재사용 (싱글톤 보장)
     if vectorstore is not None:
@@ -407,10 +611,17 @@ def init_vectorstore():
 
     if os.path.exists(VECTOR_DIR):
         # ✅ 디스크에서 '한 번만' 로드해서 전역에 담고 즉시 반환
-        vectorstore = FAISS.load_local(
-            VECTOR_DIR, embeddings, allow_dangerous_deserialization=True
-        )
-        print("✅ 기존 벡터스토어 로드 완료")
+        started = time.perf_counter()
+        vectorstore = load_vectorstore(VECTOR_DIR, embeddings, mmap=FAISS_MMAP)
+        print(f"✅ 기존 벡터스토어 로드 완료 ({'mmap' if vectorstore._mmap else 'heap'}, "
+              f"{time.perf_counter() - started:.2f}초)")
+        set_search_params(vectorstore.index, FAISS_NPROBE, FAISS_EF_SEARCH)
+        print(f"🔎 FAISS 인덱스: {describe(vectorstore.index)}")
+        # 재랭킹 특징이 없는 이전 인덱스면 시작할 때 한 번 채워 둠 (요청 경로에서 정규식 제거)
+        backfilled = backfill_chunk_features(vectorstore)
+        if backfilled:
+            print(f"🏷️ 재랭킹 특징 보충: {backfilled}개 청크 (다음 저장 시 디스크에 반영)")
+        chunk_index = ChunkIndex.build(vectorstore)
         return vectorstore                 # ✅ 여기서 바로 반환
 
     print("🛠️ 벡터스토어를 새로 생성합니다...")
@@ -426,9 +637,12 @@ def init_vectorstore():
     with open(json_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
-    # 문서 생성 (배치 처리)
+    # 문서 생성/분할 (배치 처리) → 임베딩은 전체 청크를 한 번에 스케줄러로
     vectorstore = None
     batch_size = 5  # 한 번에 5개씩 처리
+    build_stats = embeddings.begin_build()   # 청크 임베딩 캐시 적중/절감량 집계
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=120)
+    all_chunks = []
 
     for i in range(0, len(data), batch_size):
         batch = data[i:i+batch_size]
@@ -490,65 +704,88 @@ def init_vectorstore():
             )
             docs.append(doc)
 
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=120)
-        split_documents = text_splitter.split_documents(docs)
+        split_documents = split_and_link(docs, text_splitter)
+        all_chunks.extend(split_documents)
         print(f"✂️ 배치 분할 완료: {len(split_documents)} 청크")
 
-        try:
-            if vectorstore is None:
-                vectorstore = FAISS.from_documents(documents=split_documents, embedding=embeddings)
-                print(f"✅ 첫 번째 배치로 벡터스토어 생성")
-            else:
-                vectorstore.add_documents(split_documents)
-                print(f"✅ 배치 추가 완료")
-        except Exception as e:
-            print(f"❌ 배치 처리 오류: {e}")
-            if "max_tokens_per_request" in str(e):
-                print("🔄 청크 크기를 더 줄여서 재시도...")
-                smaller_splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=20)
-                split_documents = smaller_splitter.split_documents(docs)
-                if vectorstore is None:
-                    vectorstore = FAISS.from_documents(documents=split_documents, embedding=embeddings)
-                else:
-                    vectorstore.add_documents(split_documents)
-                print(f"✅ 작은 청크로 배치 처리 완료")
-            else:
-                raise e
-
-    print(f"📄 전체 JSON 로드 완료: {len(data)} 문서")
+    print(f"📄 전체 JSON 로드 완료: {len(data)} 문서, {len(all_chunks)} 청크")
+    # 요청당 토큰 한도에 맞게 스케줄러가 묶어 보내므로 청크 크기를 줄여 재시도하지 않음
+    try:
+        if all_chunks:
+            vectorstore = build_vectorstore(all_chunks, embeddings, chunk_ids(all_chunks),
+                                            kind=FAISS_INDEX, trained_dir=FAISS_TRAINED_DIR,
+                                            nlist=FAISS_NLIST, pq_m=FAISS_PQ_M, hnsw_m=FAISS_HNSW_M)
+            set_search_params(vectorstore.index, FAISS_NPROBE, FAISS_EF_SEARCH)
+            print(f"🔎 FAISS 인덱스: {describe(vectorstore.index)}")
+    finally:
+        embeddings.end_build(build_stats)
+    print(f"💰 청크 임베딩 캐시: {build_stats.summary()}")
+    last_embed_build.update(build_stats.report())
 
     if vectorstore:
-        vectorstore.save_local(VECTOR_DIR)
+        save_vectorstore(vectorstore, VECTOR_DIR, legacy_pickle=FAISS_LEGACY_PICKLE)
         print("✅ 벡터스토어 저장 완료")
     else:
         raise Exception("벡터스토어 생성 실패")
 
+    chunk_index = ChunkIndex.build(vectorstore)
     return vectorstore
 
 def rebuild_bm25_and_hybrid():
-    """FAISS 전체 문서로 BM25를 재생성하고, 하이브리드 리트리버를 갱신"""
-    global bm25_retriever, hybrid_retriever, retriever, vectorstore
-    try:
-        vs = init_vectorstore()
-        all_docs = _all_docs_from_faiss(vs)
-
-        # BM25 재생성
-        bm25_retriever = BM25Retriever.from_documents(all_docs)
-        bm25_retriever.k = 30
+    """BM25 컴팩션: 현재 FAISS 전체 청크로 BM25 인덱스를 처음부터 다시 만들어 저장
 
-        # 하이브리드 재구성
-        faiss_ret = vs.as_retriever(
-            search_type="mmr",
-            search_kwargs={"k": 25, "fetch_k": 60, "lambda_mult": 0.3}
-        )
-        hybrid_retriever = EnsembleRetriever(
-            retrievers=[bm25_retriever, faiss_ret],
-            weights=[0.45, 0.55]
-        )
-        retriever = hybrid_retriever
-        print("✅ BM25/하이브리드 리트리버 재구성 완료")
+    새 청크 추가는 add_documents_to_vectorstore에서 증분으로 반영되므로, 이 함수는
+    토크나이저를 바꿨거나 인덱스가 어긋났을 때 관리자가 명시적으로 부르는 정리 단계입니다.
+    """
+    try:
+        init_hybrid_retriever()
+        started = time.perf_counter()
+        bm25_index.compact(chunk_index.by_id.values())
+        bm25_index.save(VECTOR_DIR)
+        bm25_retriever.refresh()
+        print(f"✅ BM25 컴팩션 완료: {len(bm25_index)}개 청크 ({time.perf_counter() - started:.1f}초)")
+        return True
     except Exception as e:
         print(f"❌ BM25 재구성 오류: {e}")
+        return False
+
+def bm25_tokenizer():
+    """BM25 토크나이저 (기본 한국어: 조사 제거 + 글자 2-gram + SECTION_PATTERNS 복합어)"""
+    return get_tokenizer([k.strip("[]") for keys in SECTION_PATTERNS.values() for k in keys])
+
+def load_or_build_bm25():
+    """저장된 BM25 인덱스 로드. FAISS 청크와 다르면 차이만 추가/삭제, 없으면(토크나이저가 바뀌었어도) 새로 만들어 저장"""
+    tokenize = bm25_tokenizer()
+    # CSR 엔진을 쓰면 dict postings는 만들지 않음 (검색은 CSR 스냅샷, 증분 추가는 doc_terms로)
+    index = BM25Index.load(VECTOR_DIR, tokenize, keep_postings=not CSR_AVAILABLE)
+    ids = set(chunk_index.by_id)
+    if index is None:
+        index = BM25Index(tokenize=tokenize, keep_postings=not CSR_AVAILABLE)
+        index.add_documents(chunk_index.by_id.values())
+        index.save(VECTOR_DIR)
+        print(f"🛠️ BM25 인덱스 생성/저장: {len(index)}개 청크")
+        return index
+    stored = set(index.doc_len)
+    missing, stale = ids - stored, stored - ids
+    if missing or stale:
+        index.add_documents([chunk_index.by_id[c] for c in missing])
+        index.delete(stale)
+        index.save(VECTOR_DIR)
+        print(f"🔄 BM25 인덱스 동기화: +{len(missing)} / -{len(stale)}")
+    print(f"✅ BM25 인덱스 로드 완료: {len(index)}개 청크")
+    return index
+
+def backfill_chunk_features(vs):
+    """feat_flags가 없는 청크만 특징 계산 (컬럼형 docstore는 그 청크 본문만 읽고 레코드에 다시 기록)"""
+    store = vs.docstore
+    if not isinstance(store, ColumnarDocstore):
+        return annotate_chunk_features(_all_docs_from_faiss(vs), only_missing=True)
+    missing = [i for i in store if not store.has_metadata(i, "feat_flags")]
+    for i in missing:
+        d = store.search(i)
+        annotate_chunk_features([d])
+        store.update_metadata(i, d.metadata)
+    return len(missing)
 
 def _all_docs_from_faiss(vs):
     try:
@@ -557,9 +794,14 @@ def _all_docs_from_faiss(vs):
         ids = list(vs.index_to_docstore_id.values())
         return [vs.docstore.search(i) for i in ids]
 
+# 하이브리드 검색에서 BM25를 돌리는 스레드풀 (FAISS는 호출 스레드에서 동시에)
+# prefetch_pool 작업 안에서 다시 제출하므로 같은 풀을 쓰면 고갈 시 교착될 수 있어 따로 둠
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "8"))
+search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+
 def init_hybrid_retriever():
     """FAISS(의미) + BM25(키워드)를 합친 하이브리드 리트리버"""
-    global bm25_retriever, hybrid_retriever, retriever
+    global bm25_retriever, bm25_index, hybrid_retriever, retriever
     vs = init_vectorstore()
 
     # FAISS: 다양성 확보
@@ -568,48 +810,183 @@ def init_hybrid_retriever():
         search_kwargs={"k": 25, "fetch_k": 60, "lambda_mult": 0.3}
     )
 
-    # BM25: 정확 단어 매칭
+    # BM25: 정확 단어 매칭 (디스크에 저장된 인덱스를 로드, 매번 전체 토큰화하지 않음)
     if bm25_retriever is None:
-        bm25_retriever = BM25Retriever.from_documents(_all_docs_from_faiss(vs))
-        bm25_retriever.k = 30
-
-    # 하이브리드(가중 평균)
+        if bm25_index is None:
+            bm25_index = load_or_build_bm25()
+        # 질의는 CSR 행렬 곱 한 번 (인덱스가 바뀌면 다음 질의 때 스냅샷 재생성)
+        # 한국어 토크나이저로 어절 불일치가 줄어 k=30 → 20 (공백 분리일 때는 기존대로 30)
+        k = 30 if bm25_index.tokenize is default_tokenize else 20
+        bm25_retriever = CSRBM25Retriever(index=bm25_index, docs=chunk_index.by_id, k=k)
+
+    # 하이브리드(BM25·FAISS 동시 검색 → 가중 RRF, 점수/검색기별 순위 포함)
     if hybrid_retriever is None:
-        hybrid_retriever = EnsembleRetriever(
-            retrievers=[bm25_retriever, faiss_ret],
-            weights=[0.45, 0.55]
+        hybrid_retriever = HybridRetriever(
+            lexical=bm25_retriever, dense=faiss_ret,
+            weights=[0.45, 0.55], names=["bm25", "faiss_mmr"],
+            executor=search_pool, timer=stage_timer,
         )
 
     retriever = hybrid_retriever   # 전역 retriever 교체
     return retriever
 
-def bundle_siblings(top_docs, all_docs, max_extra=5):
-    """상위 문서와 같은 group_key(파일+섹션)인 청크를 이웃으로 더 붙여줌"""
+# === 청크 인덱스 (group_key / 같은 원문 안 앞뒤 청크) ===
+def split_and_link(docs, splitter):
+    """문서를 청크로 나누고 metadata에 청크 id와 같은 원문 안 이전/다음 청크 id, 재랭킹 특징을 기록"""
+    chunks = []
+    for doc in docs:
+        parts = splitter.split_documents([doc])
+        ids = [str(uuid.uuid4()) for _ in parts]
+        for i, c in enumerate(parts):
+            c.metadata["chunk_id"] = ids[i]
+            c.metadata["prev_chunk_id"] = ids[i - 1] if i > 0 else None
+            c.metadata["next_chunk_id"] = ids[i + 1] if i + 1 < len(ids) else None
+        chunks.extend(parts)
+    annotate_chunk_features(chunks)
+    return chunks
+
+def chunk_ids(chunks):
+    """FAISS docstore id = chunk_id 로 맞춰 저장"""
+    return [c.metadata["chunk_id"] for c in chunks]
+
+def _chunk_key(d):
+    return (d.metadata or {}).get("chunk_id") or id(d)
+
+class ChunkIndex:
+    """group_key → 청크 id 목록, 청크 id → 문서 (이전/다음 청크는 metadata에)
+
+    인덱싱 때 만든 id로 bundle_siblings가 전체 코퍼스를 선형 탐색하지 않고 딕셔너리 조회만 합니다.
+    chunk_id가 없는 이전 인덱스는 docstore id를 청크 id로 쓰고, 같은 원문(source)에서
+    연달아 저장된 청크끼리 앞뒤로 이어 줍니다.
+    컬럼형 docstore면 by_id가 docstore 자체(chunk_id = docstore id)라 본문은 조회할 때만 읽습니다.
+    """
+    def __init__(self):
+        self.by_id = {}      # chunk_id -> Document
+        self.by_group = {}   # group_key -> [chunk_id, ...] (저장 순서)
+
+    @classmethod
+    def build(cls, vs):
+        index = cls()
+        lazy = isinstance(vs.docstore, ColumnarDocstore)
+        if lazy:
+            index.by_id = vs.docstore
+        prev = prev_id = None
+        for pos in sorted(vs.index_to_docstore_id):
+            docstore_id = vs.index_to_docstore_id[pos]
+            d = None if lazy else vs.docstore.search(docstore_id)
+            m = vs.docstore.metadata(docstore_id) if lazy else getattr(d, "metadata", None)
+            if m is None:
+                continue
+            if "chunk_id" not in m:
+                m["chunk_id"] = docstore_id
+                same_source = prev is not None and \
+                    (prev.get("source"), prev.get("source_file")) == (m.get("source"), m.get("source_file"))
+                m["prev_chunk_id"] = prev["chunk_id"] if same_source else None
+                m["next_chunk_id"] = None
+                if same_source and prev.get("next_chunk_id") is None:
+                    prev["next_chunk_id"] = m["chunk_id"]
+                    if lazy:
+                        vs.docstore.update_metadata(prev_id, prev)
+                if lazy:
+                    # 컬럼형은 metadata가 매번 새 dict라 압축 레코드에 다시 기록
+                    vs.docstore.update_metadata(docstore_id, m)
+            if d is not None:
+                index.by_id[m["chunk_id"]] = d
+            index._group(m)
+            prev, prev_id = m, docstore_id
+        if lazy:
+            usage = vs.docstore.memory_usage()
+            detail = (f", 청크 metadata 힙 {sum(usage.values()) / 1e6:.1f} MB "
+                      f"(레코드 {usage['records'] / 1e6:.1f} MB, 청크 id/행 조회 {(usage['ids'] + usage['row']) / 1e6:.1f} MB)")
+        else:
+            detail = ""
+        print(f"🧩 청크 인덱스: {len(index.by_id)}개 청크, {len(index.by_group)}개 그룹{detail}")
+        return index
+
+    def _group(self, m):
+        key = m.get("group_key")
+        if key:
+            self.by_group.setdefault(key, []).append(m["chunk_id"])
+
+    def _add(self, d):
+        self.by_id[d.metadata["chunk_id"]] = d
+        self._group(d.metadata)
+
+    def add_chunks(self, chunks):
+        for d in chunks:
+            self._add(d)
+
+    def neighbours(self, d):
+        """같은 원문에서 바로 다음/이전 청크"""
+        m = d.metadata or {}
+        for key in ("next_chunk_id", "prev_chunk_id"):
+            n = self.by_id.get(m.get(key))
+            if n is not None:
+                yield n
+
+    def group_members(self, keys):
+        for key in keys:
+            for cid in self.by_group.get(key, ()):
+                yield self.by_id[cid]
+
+def bundle_siblings(top_docs, all_docs=None, max_extra=5):
+    """상위 문서에 같은 원문의 앞/뒤 청크, 같은 group_key(파일+섹션) 청크를 이웃으로 더 붙여줌
+
+    앞/뒤 청크는 전체 코퍼스에서 찾고, group_key 형제는 all_docs(보통 검색 결과) 안에서,
+    all_docs가 없으면 전체 코퍼스에서 찾습니다. 모두 청크 인덱스 조회라 코퍼스 크기와 무관.
+    """
     if not top_docs: return top_docs
-    keys = { (_doc_feats(d)["group_key"]) for d in top_docs if _doc_feats(d)["group_key"] }
-    if not keys: return top_docs
+    seen = {_chunk_key(d) for d in top_docs}
     extras = []
-    for d in all_docs:
-        if d in top_docs: continue
-        if _doc_feats(d)["group_key"] in keys:
-            extras.append(d)
-            if len(extras) >= max_extra: break
+
+    def take(d):
+        k = _chunk_key(d)
+        if k in seen:
+            return False
+        seen.add(k)
+        extras.append(d)
+        return len(extras) >= max_extra
+
+    index = chunk_index
+    if index is not None:
+        for d in top_docs:
+            for n in index.neighbours(d):
+                if take(n):
+                    return top_docs + extras
+
+    keys = {d.metadata.get("group_key") for d in top_docs if d.metadata.get("group_key")}
+    if keys:
+        if all_docs is not None:
+            pool = (d for d in all_docs if d.metadata.get("group_key") in keys)
+        else:
+            pool = index.group_members(keys) if index is not None else ()
+        for d in pool:
+            if take(d):
+                break
     return top_docs + extras
 
 # 체인 초기화
-def filter_relevant_context(question: str, retrieved_docs):
-    """LLM 호출 없이 빠르게 필터 + 최신/숫자 우선 정렬"""
+def filter_relevant_context(question: str, retrieved_docs, ctx=None, presorted=False):
+    """LLM 호출 없이 빠르게 필터 + 최신/숫자 우선 정렬 (ctx가 있으면 미리 계산한 문서 특징 재사용)
+
+    presorted: 입력이 이미 generic_rerank 순서면 필터 후 다시 정렬하지 않음 (필터는 순서를 유지)
+    """
+    with stage_timer("filter_context"):
+        return _filter_relevant_context(question, retrieved_docs, ctx, presorted)
+
+def _filter_relevant_context(question, retrieved_docs, ctx, presorted=False):
     try:
-        need = _needs(question)
+        need = ctx.need if ctx is not None else _needs(question)
         filtered = []
         for d in retrieved_docs:
-            t = (d.page_content or "")
+            f = ctx.feats(d) if ctx is not None else _doc_feats(d)
+            has_percent, has_money, has_days = f["has_percent_sign"], f["has_money"], f["has_days"]
             ok = True
-            if need["percent"] and "%" not in t:
+            if need["percent"] and not has_percent:
                 ok = False
-            if need["money"] and not re.search(r"\d{1,3}(?:,\d{3})*(?:\s*원)?", t):
+            if need["money"] and not has_money:
                 ok = False
-            if need["days"] and not re.search(r"\d+\s*일", t):
+            if need["days"] and not has_days:
                 ok = False
             if ok:
                 filtered.append(d)
@@ -617,7 +994,7 @@ def filter_relevant_context(question: str, retrieved_docs):
         if not filtered:
             filtered = retrieved_docs  # 아무것도 안 남으면 원본 유지
 
-        ranked = generic_rerank(question, filtered)   # 최신/숫자/도메인 힌트 반영
+        ranked = filtered if presorted else generic_rerank(question, filtered, ctx)   # 최신/숫자/도메인 힌트 반영
         return ranked[:10]
     except Exception as e:
         print(f"컨텍스트 필터링 오류: {e}")
@@ -733,50 +1110,598 @@ def _needs(question: str):
         "purchase": ("구입" in qn or "구매" in qn),
     }
 
-def _doc_feats(d):
+# === 인덱스 시점 재랭킹 특징 ===
+# 청크마다 정규식/날짜 파싱을 한 번만 돌려 metadata에 비트 플래그(feat_flags)와 최신 날짜 점수(date_score)로 저장.
+# 요청 시에는 정수 두 개를 읽어 NumPy로 점수만 계산.
+FEAT_BITS = OrderedDict([
+    ("has_percent", 1),
+    ("has_percent_sign", 2),
+    ("has_money", 4),
+    ("has_days", 8),
+    ("mentions_pilot", 16),
+    ("mentions_rental", 32),
+    ("mentions_purchase", 64),
+])
+_FEAT_BIT_VALUES = np.array(list(FEAT_BITS.values()), dtype=np.int64)
+
+def compute_chunk_features(d):
+    """청크 본문에서 (feat_flags, date_score) 계산 — 인덱싱 시점에 한 번만"""
     t = (d.page_content or "")
-    m = d.metadata or {}
-    return {
+    checks = {
         "has_percent": bool(re.search(r"\d{1,3}\s*%", t)),
+        "has_percent_sign": ("%" in t),
         "has_money":   bool(re.search(r"\d{1,3}(?:,\d{3})*(?:\s*원)?", t)),
         "has_days":    bool(re.search(r"\d+\s*일", t)),
         "mentions_pilot": ("예비급여" in t or "시범" in t),
         "mentions_rental": ("대여" in t),
         "mentions_purchase": ("구입" in t or "구매" in t),
-        "date_score": assign_date_priority(d)["priority_score"],
-        "source_file": m.get("source_file"),
-        "section_ids": set((m.get("section_ids") or [])),
-        "group_key": m.get("group_key"),
     }
+    flags = sum(bit for name, bit in FEAT_BITS.items() if checks[name])
+    return flags, int(assign_date_priority(d)["priority_score"])
 
-def generic_rerank(question, docs):
-    need = _needs(question)
-    scored = []
+def annotate_chunk_features(docs, only_missing=False):
+    """청크 metadata에 feat_flags/date_score 기록. 기록한 청크 수 반환"""
+    count = 0
     for d in docs:
-        f = _doc_feats(d); s = 0
-        s += f["date_score"]  # 최신 우선
-        if need["percent"] and f["has_percent"]: s += 700
-        if need["money"]   and f["has_money"]:   s += 500
-        if need["days"]    and f["has_days"]:    s += 400
-        if need["rental"]  and f["mentions_rental"]: s += 200
-        if need["purchase"] and f["mentions_purchase"]: s += 200
-        if not need["pilot"] and f["mentions_pilot"]: s -= 800  # 예비급여 혼선 방지
-        if f["source_file"] == "noin3_data.json": s += 300      # (선택) 가이드 표 우대
-        scored.append((s, d))
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [d for _, d in scored]
-
-def evidence_guard(question, top_docs):
-    need = _needs(question)
-    blob = "\n".join((d.page_content or "") for d in top_docs[:6])
-    if need["percent"] and not re.search(r"\d{1,3}\s*%", blob):
+        if d.metadata is None:
+            d.metadata = {}
+        if only_missing and "feat_flags" in d.metadata:
+            continue
+        d.metadata["feat_flags"], d.metadata["date_score"] = compute_chunk_features(d)
+        count += 1
+    return count
+
+def _chunk_features(d):
+    m = d.metadata
+    if m is None or "feat_flags" not in m:
+        # 특징이 없는 이전 인덱스의 청크 → 이번에 계산해 두고 이후로는 재사용
+        annotate_chunk_features([d])
+        m = d.metadata
+    return m["feat_flags"], m["date_score"]
+
+def _doc_feats(d):
+    flags, date_score = _chunk_features(d)
+    m = d.metadata
+    feats = {name: bool(flags & bit) for name, bit in FEAT_BITS.items()}
+    feats.update({
+        "date_score": date_score,
+        "source_file": m.get("source_file"),
+        "section_ids": set((m.get("section_ids") or [])),
+        "group_key": m.get("group_key"),
+    })
+    return feats
+
+def _rerank_weights(need):
+    """FEAT_BITS 순서의 가중치 (점수 = 최신 날짜 점수 + 질문이 요구하는 특징 가중치 합)"""
+    return np.array([
+        700 if need["percent"] else 0,        # has_percent
+        0,                                    # has_percent_sign
+        500 if need["money"] else 0,          # has_money
+        400 if need["days"] else 0,           # has_days
+        -800 if not need["pilot"] else 0,     # mentions_pilot (예비급여 혼선 방지)
+        200 if need["rental"] else 0,         # mentions_rental
+        200 if need["purchase"] else 0,       # mentions_purchase
+    ], dtype=np.int64)
+
+# 검색 신뢰도(가중 RRF 점수, 후보 중 최고 = 1.0)의 재랭킹 가중치: 1.0 ≈ 최신성 1년
+CONFIDENCE_WEIGHT = 365
+# 증거가드: 검색 신뢰도가 1위의 이 비율 이상인 문서의 수치만 근거로 인정
+EVIDENCE_MIN_CONFIDENCE = 0.4
+
+def rerank_order(need, docs, confidence=None):
+    """후보 전체 점수를 한 번에 계산해 점수 내림차순(동점은 원래 순서) 인덱스 반환"""
+    if not docs:
+        return []
+    flags = np.empty(len(docs), dtype=np.int64)
+    dates = np.empty(len(docs), dtype=np.int64)
+    noin3 = np.empty(len(docs), dtype=bool)
+    for i, d in enumerate(docs):
+        flags[i], dates[i] = _chunk_features(d)
+        noin3[i] = (d.metadata.get("source_file") == "noin3_data.json")
+    bits = (flags[:, None] & _FEAT_BIT_VALUES) != 0
+    scores = dates + bits @ _rerank_weights(need) + 300 * noin3   # (선택) 가이드 표 우대
+    if confidence is not None and confidence.max() > 0:
+        scores = scores + CONFIDENCE_WEIGHT * confidence / confidence.max()
+    return np.argsort(-scores, kind="stable")
+
+def generic_rerank(question, docs, ctx=None):
+    with stage_timer("rerank"):
+        need = ctx.need if ctx is not None else _needs(question)
+        confidence = np.array([ctx.confidence(d) for d in docs]) if ctx is not None else None
+        return [docs[i] for i in rerank_order(need, docs, confidence)]
+
+def evidence_guard(question, top_docs, ctx=None):
+    need = ctx.need if ctx is not None else _needs(question)
+    top_docs = top_docs[:6]
+    if ctx is not None:
+        # 검색 신뢰도가 낮은 문서(재랭킹으로만 올라온 문서)의 수치는 근거로 치지 않음
+        conf = [ctx.confidence(d) for d in top_docs]
+        best = max(conf, default=0.0)
+        if best > 0:
+            top_docs = [d for d, c in zip(top_docs, conf) if c >= EVIDENCE_MIN_CONFIDENCE * best]
+    # 인덱싱 때 계산해 둔 청크 특징으로 판단 (본문 정규식 재실행 없음)
+    feats = [(ctx.feats(d) if ctx is not None else _doc_feats(d)) for d in top_docs]
+    has_percent = any(f["has_percent"] for f in feats)
+    has_money = any(f["has_money"] for f in feats)
+    has_days = any(f["has_days"] for f in feats)
+    if need["percent"] and not has_percent:
         return False, "문서에서 퍼센트(%) 수치를 확인하지 못했습니다."
-    if need["money"] and not re.search(r"\d{1,3}(?:,\d{3})*(?:\s*원)?", blob):
+    if need["money"] and not has_money:
         return False, "문서에서 금액/비용 수치를 확인하지 못했습니다."
-    if need["days"] and not re.search(r"\d+\s*일", blob):
+    if need["days"] and not has_days:
         return False, "문서에서 기간/일수 표현을 확인하지 못했습니다."
     return True, ""
 
+class RetrievalContext:
+    """요청 단위 검색 컨텍스트
+
+    같은 질의는 한 번만 검색하고(동시에 들어온 요청은 먼저 시작한 검색 결과를 기다림),
+    문서 특징(_doc_feats)도 문서당 한 번만 풀어 둡니다.
+    가드레일 우회 검사, 재랭킹, 증거가드, bundle_siblings, filter_relevant_context가 모두 공유합니다.
+    """
+    def __init__(self, question: str):
+        self.question = question
+        self.need = _needs(question)
+        self._lock = threading.Lock()
+        self._queries = {}   # 질의 -> Future(하이브리드 검색 결과)
+        self._lexical = {}   # 질의 -> BM25 결과 (증거가드 재도전용)
+        self._hits = {}      # 질의 -> [ScoredDoc] (가중 RRF 점수, 검색기별 순위/원점수)
+        self._confidence = {}  # 청크 키 -> 이 요청의 검색들 중 가장 높은 RRF 점수
+        self._feats = {}     # id(doc) -> (doc, 특징)  doc 참조를 같이 들고 있어 id 재사용 방지
+
+    def retrieve(self, query: str):
+        with self._lock:
+            future = self._queries.get(query)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._queries[query] = future
+        if not owner:
+            return future.result()
+        try:
+            docs = self._search(query)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        future.set_result(docs)
+        return docs
+
+    def _search(self, query: str):
+        hybrid = retriever
+        if isinstance(hybrid, HybridRetriever):
+            # BM25 결과를 따로 보관 → 증거가드 재도전 시 재검색 불필요
+            lexical, dense = hybrid.search_components(query)
+            hits = hybrid.fuse(lexical, dense)
+            with self._lock:
+                self._lexical[query] = [d for d, _ in lexical]
+                self._hits[query] = hits
+                for h in hits:
+                    key = doc_key(h.doc)
+                    if h.score > self._confidence.get(key, 0.0):
+                        self._confidence[key] = h.score
+            return [h.doc for h in hits]
+        with stage_timer("hybrid_search"):
+            return hybrid.get_relevant_documents(query)
+
+    def lexical(self, query: str):
+        """질의의 BM25 결과 (하이브리드 검색 때 받아 둔 것을 재사용)"""
+        self.retrieve(query)
+        with self._lock:
+            docs = self._lexical.get(query)
+        if docs is None:
+            with stage_timer("bm25"):
+                docs = bm25_retriever.get_relevant_documents(query)
+        return docs
+
+    def hits(self, query: str):
+        """질의의 [ScoredDoc] (하이브리드가 아니면 빈 목록)"""
+        self.retrieve(query)
+        with self._lock:
+            return self._hits.get(query, [])
+
+    def confidence(self, d) -> float:
+        """이 요청에서 문서가 받은 가장 높은 가중 RRF 점수 (검색되지 않은 문서는 0)"""
+        return self._confidence.get(doc_key(d), 0.0)
+
+    def is_decisive(self, query: str) -> bool:
+        return is_decisive(self.hits(query))
+
+    def feats(self, d):
+        hit = self._feats.get(id(d))
+        if hit is None:
+            hit = (d, _doc_feats(d))
+            self._feats[id(d)] = hit
+        return hit[1]
+
+    def rerank(self, docs):
+        return generic_rerank(self.question, docs, self)
+
+
+def extract_search_keywords(question: str, timeout=None) -> str:
+    """gpt-3.5로 질문에서 검색 키워드 3~5개 추출 (timeout: OpenAI HTTP 요청 타임아웃, 초)"""
+    search_prompt = f"""
+사용자 질문: "{question}"
+
+이 질문에 답하기 위해 벡터스토어에서 찾아야 할 핵심 키워드 3-5개를 추출해주세요.
+키워드는 쉼표로 구분하고, 한국어로 작성해주세요.
+
+예시:
+질문: "8월 신규 급여결정신청 진행절차 진행과정알려줘"
+키워드: 급여결정신청, 신청절차, 진행과정, 8월, 신규
+
+키워드:"""
+
+    llm = get_chat_model("gpt-3.5-turbo", temperature=0, max_tokens=50, max_retries=LLM_MAX_RETRIES)
+    with stage_timer("keywords"):
+        response = llm.invoke(search_prompt, **timeout_kwargs(timeout))
+    return response.content.strip()
+
+def unpack_chain_input(chain_input):
+    """체인 입력은 질문 문자열 또는 {"question", "prefetch", "deadline"} dict"""
+    if isinstance(chain_input, dict):
+        return chain_input.get("question", ""), chain_input.get("prefetch"), chain_input.get("deadline")
+    return chain_input, None, None
+
+# === 요청 데드라인 / 단계별 예산 ===
+REQUEST_TIMEOUT = 60.0
+# 요청 시작 시점 기준 단계별 마감(초). 넘기면 해당 단계를 건너뛰거나 요청을 중단
+STAGE_BUDGETS = {
+    "relevance": 3.0,    # gpt-3.5 관련성 검증 (초과 시 통과 처리)
+    "keywords": 2.0,     # gpt-3.5 키워드 추출 (초과 시 원 질문으로 검색)
+    "retrieval": 15.0,   # 하이브리드 검색 + 재랭킹
+    "generation": REQUEST_TIMEOUT,  # gpt-4o 답변 생성
+}
+
+class DeadlineExceeded(Exception):
+    """요청 데드라인 초과"""
+
+class Deadline:
+    """요청 단위 데드라인. 각 단계는 STAGE_BUDGETS 마감까지만 기다림"""
+    def __init__(self, total: float = REQUEST_TIMEOUT):
+        self.started = time.monotonic()
+        self.expires_at = self.started + total
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def budget(self, stage: str) -> float:
+        """해당 단계 마감까지 남은 시간(초). 전체 데드라인을 넘지 않음"""
+        stage_end = self.started + STAGE_BUDGETS.get(stage, REQUEST_TIMEOUT)
+        return max(0.0, min(stage_end, self.expires_at) - time.monotonic())
+
+    def check(self, stage: str = ""):
+        if self.expired():
+            raise DeadlineExceeded(stage)
+
+def timeout_kwargs(timeout):
+    """OpenAI 요청 타임아웃 인자 (None은 '무제한'이 되므로 아예 넘기지 않음)
+
+    SDK 재시도마다 이 타임아웃이 새로 걸리므로, 예산이 걸린 모델은 max_retries=LLM_MAX_RETRIES로 만듦
+    """
+    if timeout is None:
+        return {}
+    return {"timeout": max(timeout, 0.1)}
+
+def is_timeout_error(e: Exception) -> bool:
+    return isinstance(e, (DeadlineExceeded, FuturesTimeoutError, APITimeoutError))
+
+# === 인덱스 세대 ===
+def current_index_version() -> str:
+    """디스크 벡터스토어의 세대(index.faiss mtime+크기). 다른 워커가 갱신해도 바뀜"""
+    try:
+        st = os.stat(os.path.join(VECTOR_DIR, "index.faiss"))
+        return f"{st.st_mtime_ns}-{st.st_size}"
+    except OSError:
+        return "none"
+
+# === 시맨틱 답변 캐시 ===
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", str(6 * 3600)))  # 초
+
+class SemanticAnswerCache:
+    """질문 임베딩의 최근접 캐시 질문이 임계값 이상이면 저장된 답변을 재사용
+
+    - 작은 FAISS 내적 인덱스(정규화 벡터 → 코사인 유사도)
+    - TTL 만료 + 최대 개수 초과 시 LRU 제거
+    - 인덱스 세대(current_index_version)가 바뀌면 전체 무효화
+    """
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl_seconds=SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._index = None
+        self._entries = OrderedDict()  # entry_id -> entry (오래 안 쓴 순서)
+        self._next_id = 0
+        self._index_version = None
+        self.lookups = 0
+        self.hits = 0
+        self.latency_saved = 0.0
+        self.tokens_saved = 0
+
+    def embed(self, question: str):
+        with stage_timer("question_embedding"):
+            vec = np.asarray(embeddings.embed_query(question), dtype="float32").reshape(1, -1)
+        faiss.normalize_L2(vec)
+        return vec
+
+    def lookup(self, question: str, vec=None):
+        """(히트한 entry 또는 None, 질문 벡터) 반환"""
+        started = time.monotonic()
+        if vec is None:
+            vec = self.embed(question)
+        with self._lock:
+            self.lookups += 1
+            self._sync_version()
+            self._evict_expired()
+            if self._index is None or self._index.ntotal == 0:
+                return None, vec
+            scores, ids = self._index.search(vec, 1)
+            score, entry_id = float(scores[0][0]), int(ids[0][0])
+            entry = self._entries.get(entry_id)
+            if entry is None or score < self.threshold:
+                return None, vec
+            self._entries.move_to_end(entry_id)
+            entry['hits'] += 1
+            self.hits += 1
+            self.latency_saved += max(0.0, entry['latency'] - (time.monotonic() - started))
+            self.tokens_saved += entry['tokens']
+            return dict(entry, similarity=score), vec
+
+    def store(self, question: str, answer: str, vec, latency: float, tokens: int):
+        with self._lock:
+            self._sync_version()
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(vec.shape[1]))
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(vec, np.array([entry_id], dtype="int64"))
+            self._entries[entry_id] = {
+                'question': question,
+                'answer': answer,
+                'created': time.time(),
+                'latency': latency,
+                'tokens': tokens,
+                'hits': 0,
+            }
+            while len(self._entries) > self.max_entries:
+                old_id, _ = self._entries.popitem(last=False)
+                self._index.remove_ids(np.array([old_id], dtype="int64"))
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': round(self.hits / self.lookups * 100, 1) if self.lookups else 0.0,
+                'latency_saved_sec': round(self.latency_saved, 1),
+                'tokens_saved': self.tokens_saved,
+                'threshold': self.threshold,
+            }
+
+    def _sync_version(self):
+        version = current_index_version()
+        if version != self._index_version:
+            if self._entries:
+                print("🧹 인덱스 세대 변경 → 시맨틱 캐시 무효화")
+            self._reset()
+            self._index_version = version
+
+    def _evict_expired(self):
+        now = time.time()
+        expired = [i for i, e in self._entries.items() if now - e['created'] > self.ttl_seconds]
+        if expired:
+            for i in expired:
+                del self._entries[i]
+            self._index.remove_ids(np.array(expired, dtype="int64"))
+
+    def _reset(self):
+        self._index = None
+        self._entries.clear()
+
+semantic_cache = SemanticAnswerCache()
+
+# === 정확 일치 답변 캐시 (SQLite, 워커 간 공유/재시작 후 유지) ===
+EXACT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'answer_cache.db')
+EXACT_CACHE_TTL = int(os.getenv("EXACT_CACHE_TTL", str(24 * 3600)))  # 초
+
+def normalize_question(question: str) -> str:
+    """캐시 키용 정규화: 전각/호환 문자 통일, 소문자, 공백·문장부호 제거(띄어쓰기 차이 무시)"""
+    q = unicodedata.normalize("NFKC", question or "").lower()
+    return re.sub(r"[^\w%]|_", "", q)  # '%'는 의미가 있어 유지
+
+class ExactAnswerCache:
+    """정규화된 질문 + 인덱스 세대를 키로 하는 정확 일치 캐시 (가드레일 LLM보다 앞단)
+
+    get은 읽기만 함: 적중/미스 횟수는 프로세스 메모리에 모았다가 쓰기 경로(put/purge_stale)나
+    관리자 통계 조회 때 한 번에 DB에 더함 → 조회마다 워커끼리 SQLite 쓰기 잠금을 다투지 않음
+    """
+    def __init__(self, path=EXACT_CACHE_PATH, ttl_seconds=EXACT_CACHE_TTL):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._counts_lock = threading.Lock()
+        self._counts_pid = os.getpid()
+        self._hits = 0
+        self._misses = 0
+        self._entry_hits: Dict[tuple, int] = {}   # (key, index_version) -> 아직 DB에 안 더한 적중 수
+        conn = self._conn()
+        conn.execute("""CREATE TABLE IF NOT EXISTS answers (
+            key TEXT NOT NULL,
+            index_version TEXT NOT NULL,
+            question TEXT,
+            answer TEXT,
+            created REAL,
+            hits INTEGER DEFAULT 0,
+            PRIMARY KEY (key, index_version))""")
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+        conn.execute("INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0)")
+        conn.commit()
+
+    def _conn(self):
+        # sqlite 연결은 스레드별로 하나씩 (gunicorn 워커끼리는 파일 잠금으로 공유)
+        conn = getattr(self._local, 'conn', None)
+        # gunicorn --preload: 마스터에서 연 연결은 fork 이후 쓰지 않고 워커에서 새로 엶
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, question: str):
+        key = normalize_question(question)
+        if not key:
+            return None
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT answer, created FROM answers WHERE key = ? AND index_version = ?",
+            (key, current_index_version())
+        ).fetchone()
+        hit = bool(row) and time.time() - row[1] <= self.ttl_seconds
+        self._count(hit, (key, current_index_version()))
+        return row[0] if hit else None
+
+    def _count(self, hit, entry):
+        with self._counts_lock:
+            if self._counts_pid != os.getpid():
+                # fork 이후: 마스터에서 세던 값은 워커마다 다시 더하지 않음
+                self._counts_pid = os.getpid()
+                self._hits, self._misses, self._entry_hits = 0, 0, {}
+            if hit:
+                self._hits += 1
+                self._entry_hits[entry] = self._entry_hits.get(entry, 0) + 1
+            else:
+                self._misses += 1
+
+    def _flush_counts(self, conn):
+        """메모리에 모은 적중/미스 횟수를 DB에 더함 (호출한 쪽이 commit)"""
+        with self._counts_lock:
+            if self._counts_pid != os.getpid():
+                self._counts_pid = os.getpid()
+                self._hits, self._misses, self._entry_hits = 0, 0, {}
+            hits, misses, entry_hits = self._hits, self._misses, self._entry_hits
+            self._hits, self._misses, self._entry_hits = 0, 0, {}
+        if not (hits or misses):
+            return
+        conn.executemany("UPDATE counters SET value = value + ? WHERE name = ?",
+                         [(hits, 'hits'), (misses, 'misses')])
+        conn.executemany("UPDATE answers SET hits = hits + ? WHERE key = ? AND index_version = ?",
+                         [(n, key, version) for (key, version), n in entry_hits.items()])
+
+    def put(self, question: str, answer: str):
+        key = normalize_question(question)
+        if not key:
+            return
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO answers (key, index_version, question, answer, created, hits) "
+            "VALUES (?, ?, ?, ?, ?, 0)",
+            (key, current_index_version(), question, answer, time.time())
+        )
+        self._flush_counts(conn)
+        conn.commit()
+
+    def purge_stale(self):
+        """현재 세대가 아니거나 만료된 항목 삭제"""
+        conn = self._conn()
+        self._flush_counts(conn)
+        conn.execute("DELETE FROM answers WHERE index_version != ? OR created < ?",
+                     (current_index_version(), time.time() - self.ttl_seconds))
+        conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """DB 합계 (다른 워커가 아직 더하지 않은 횟수는 그 워커의 다음 put 때 반영)"""
+        conn = self._conn()
+        self._flush_counts(conn)
+        conn.commit()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries = conn.execute("SELECT COUNT(*) FROM answers WHERE index_version = ?",
+                               (current_index_version(),)).fetchone()[0]
+        hits, misses = counters.get('hits', 0), counters.get('misses', 0)
+        lookups = hits + misses
+        return {
+            'entries': entries,
+            'lookups': lookups,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups * 100, 1) if lookups else 0.0,
+        }
+
+exact_cache = ExactAnswerCache()
+
+def lookup_exact_cache(question):
+    try:
+        return exact_cache.get(question)
+    except Exception as e:
+        print(f"정확 일치 캐시 조회 오류: {e}")
+        return None
+
+def store_answer_caches(question, answer, vec, latency, tokens):
+    """생성된 답변을 정확 일치/시맨틱 캐시에 모두 저장"""
+    try:
+        exact_cache.put(question, answer)
+    except Exception as e:
+        print(f"정확 일치 캐시 저장 오류: {e}")
+    store_semantic_cache(question, answer, vec, latency, tokens)
+
+def lookup_semantic_cache(question, prefetch=None):
+    """캐시 조회 실패는 무시하고 일반 경로로 진행. (entry 또는 None, 질문 벡터 또는 None)"""
+    try:
+        vec = None
+        if prefetch and prefetch.get('question_vec') is not None:
+            vec = prefetch['question_vec'].result()
+        return semantic_cache.lookup(question, vec)
+    except Exception as e:
+        print(f"시맨틱 캐시 조회 오류: {e}")
+        return None, None
+
+def store_semantic_cache(question, answer, vec, latency, tokens):
+    if vec is None:
+        return
+    try:
+        semantic_cache.store(question, answer, vec, latency, tokens)
+    except Exception as e:
+        print(f"시맨틱 캐시 저장 오류: {e}")
+
+# === 요청 파이프라인: 관련성 검증 / 키워드 추출 / 원 질문 검색 동시 실행 ===
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "8"))
+prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+# 관련성 검증은 요청당 하나라 따로: 키워드/검색 작업 뒤에 줄 서서 예산을 대기열에서 다 쓰지 않게
+RELEVANCE_WORKERS = int(os.getenv("RELEVANCE_WORKERS", str(PREFETCH_WORKERS)))
+relevance_pool = ThreadPoolExecutor(max_workers=RELEVANCE_WORKERS, thread_name_prefix="relevance")
+
+def _check_relevance_task(question: str, deadline: Deadline):
+    # 예산은 작업이 실제로 시작된 시점부터 (대기열에서 기다린 시간은 깎지 않음)
+    return guardrails.check_welfare_relevance(question, min(STAGE_BUDGETS["relevance"], deadline.remaining()))
+
+def start_prefetch(question: str, deadline: Deadline, rctx: RetrievalContext):
+    """가드레일 관련성 LLM, 키워드 LLM, 원 질문 검색을 스레드풀에서 동시에 시작"""
+    return {
+        'relevance': submit_with_context(relevance_pool, _check_relevance_task, question, deadline),
+        'keywords': submit_with_context(
+            prefetch_pool, extract_search_keywords, question, deadline.budget("keywords")),
+        'plain_docs': submit_with_context(prefetch_pool, rctx.retrieve, question),
+        'question_vec': submit_with_context(prefetch_pool, semantic_cache.embed, question),
+    }
+
+def cancel_prefetch(prefetch):
+    """질문이 거절되면 투기적으로 띄운 작업을 취소(이미 실행 중이면 결과만 버림)"""
+    if not prefetch:
+        return
+    for future in prefetch.values():
+        if isinstance(future, Future):
+            future.cancel()
 
 def init_chain():
     global vectorstore, retriever, chain
@@ -856,62 +1781,105 @@ def init_chain():
 #Answer:"""
     )
     
-    llm = ChatOpenAI(model_name="gpt-4o", temperature=0, model_kwargs={"max_completion_tokens": 2000} )
+    def generation_llm():
+        # 호출 시점에 레지스트리에서 찾음 → fork 이후 워커는 자기 커넥션 풀의 클라이언트를 씀
+        # (init_chain은 --preload 마스터에서 import 때 돌므로 여기서 만들어 잡아 두지 않음)
+        llm = get_chat_model("gpt-4o", temperature=0, stream_usage=True, max_retries=LLM_MAX_RETRIES,
+                             model_kwargs={"max_completion_tokens": 2000})
+        return llm.with_config(callbacks=[StageTimingCallback("generation")])
     
-    def get_filtered_context(question):
-        # 1단계: GPT로 질문을 검색 키워드로 정리
-        search_prompt = f"""
-사용자 질문: "{question}"
-
-이 질문에 답하기 위해 벡터스토어에서 찾아야 할 핵심 키워드 3-5개를 추출해주세요.
-키워드는 쉼표로 구분하고, 한국어로 작성해주세요.
-
-예시:
-질문: "8월 신규 급여결정신청 진행절차 진행과정알려줘"
-키워드: 급여결정신청, 신청절차, 진행과정, 8월, 신규
-
-키워드:"""
+    def get_filtered_context(chain_input):
+        question, prefetch, deadline = unpack_chain_input(chain_input)
+        # 요청 단위 검색 컨텍스트 (가드레일 단계에서 만든 것이 있으면 그대로 이어 씀)
+        rctx = (prefetch or {}).get('retrieval') or RetrievalContext(question)
 
         try:
-            llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0, max_tokens=50)
-            response = llm.invoke(search_prompt)
-            keywords = response.content.strip()
+            # 0단계: 원 질문 검색에서 BM25·FAISS가 같은 문서를 1위로 찾았고 수치 근거도 있으면
+            # 키워드 추출 LLM을 기다리지 않고 바로 그 결과로 진행
+            if prefetch and prefetch.get('plain_docs') is not None:
+                try:
+                    plain = prefetch['plain_docs'].result(timeout=deadline.budget("retrieval") if deadline else None)
+                except Exception:
+                    plain = None
+                if plain and rctx.is_decisive(question):
+                    docs = generic_rerank(question, plain, rctx)
+                    if evidence_guard(question, docs, rctx)[0]:
+                        print("🎯 원 질문 검색 결과가 확정적 → 키워드 확장 생략")
+                        if prefetch.get('keywords') is not None:
+                            prefetch['keywords'].cancel()
+                        return "\n\n".join(doc.page_content for doc in filter_relevant_context(question, docs, rctx, presorted=True))
+
+            # 1단계: GPT로 질문을 검색 키워드로 정리 (미리 띄워둔 결과가 있으면 재사용)
+            keyword_budget = deadline.budget("keywords") if deadline else None
+            try:
+                if prefetch and prefetch.get('keywords') is not None:
+                    keywords = prefetch['keywords'].result(timeout=keyword_budget)
+                else:
+                    keywords = extract_search_keywords(question, keyword_budget)
+            except (FuturesTimeoutError, APITimeoutError):
+                # 키워드 확장은 선택 단계: 예산 초과 시 원 질문으로 진행
+                print("⏱️ 키워드 추출 시간 초과 → 원 질문으로 검색")
+                keywords = ""
             
             # 2단계: 키워드로 벡터 검색 강화
-            enhanced_question = question + " " + keywords
-            docs = retriever.get_relevant_documents(enhanced_question)
+            if deadline: deadline.check("retrieval")
+            enhanced_question = (question + " " + keywords).strip()
+            docs = rctx.retrieve(enhanced_question)
 
             # ✅ (추가) 범용 재랭킹
-            docs = generic_rerank(question, docs)
+            docs = generic_rerank(question, docs, rctx)
             
             # ✅ (추가) 증거가드: %/원/일수 등 수치가 실제로 있는지 확인
-            ok, msg = evidence_guard(question, docs)
-            if not ok:
-                # 키워드(BM25) 결과를 더 섞어서 재도전
+            ok, msg = evidence_guard(question, docs, rctx)
+            if not ok and bm25_index is not None and bm25_index.tokenize is default_tokenize:
+                # 공백 분리 BM25일 때만: 키워드(BM25) 결과를 더 섞어서 재도전 (하이브리드 검색 때 받아 둔 BM25 결과 재사용)
+                # 한국어 토크나이저면 BM25 결과가 이미 앙상블에 제대로 반영되어 재도전하지 않음
                 try:
-                    extra = bm25_retriever.get_relevant_documents(enhanced_question)
-                    docs = generic_rerank(question, (extra + docs)[:80])
+                    extra = rctx.lexical(enhanced_question)
+                    docs = generic_rerank(question, (extra + docs)[:80], rctx)
                 except Exception:
                     pass
 
-            # 3단계: 관련성 필터링 및 날짜 정렬(기존 함수)
-            filtered = filter_relevant_context(question, docs)
+            # 3단계: 관련성 필터링 (docs는 위에서 이미 재랭킹됨)
+            filtered = filter_relevant_context(question, docs, rctx, presorted=True)
             return "\n\n".join([doc.page_content for doc in filtered])
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"키워드 추출 오류: {e}")
-            # 오류 시 기존 방식으로 진행
-            docs = retriever.get_relevant_documents(question)
-            docs = generic_rerank(question, docs)  # ✅ (추가)
+            if deadline: deadline.check("retrieval")
+            # 오류 시 기존 방식으로 진행 (원 질문 검색 결과가 이미 있으면 재사용)
+            docs = None
+            if prefetch and prefetch.get('plain_docs') is not None:
+                try:
+                    docs = prefetch['plain_docs'].result(
+                        timeout=deadline.budget("retrieval") if deadline else None)
+                except Exception:
+                    docs = None
+            if docs is None:
+                docs = rctx.retrieve(question)
+            docs = generic_rerank(question, docs, rctx)  # ✅ (추가)
             docs = bundle_siblings(docs[:6], docs)
-            filtered = filter_relevant_context(question, docs)
+            filtered = filter_relevant_context(question, docs, rctx)
             return "\n\n".join([doc.page_content for doc in filtered])
     
+    def generate_with_budget(inputs):
+        # 생성 단계 HTTP 타임아웃 = 남은 요청 시간 → 초과 시 OpenAI 요청 자체가 끊김
+        deadline = inputs.get("deadline")
+        llm = generation_llm()
+        if deadline is None:
+            return prompt | llm | StrOutputParser()
+        deadline.check("generation")
+        return prompt | llm.bind(**timeout_kwargs(deadline.budget("generation"))) | StrOutputParser()
+
     chain = (
-        {"context": get_filtered_context, "question": RunnablePassthrough()}
-        | prompt
-        | llm
-        | StrOutputParser()
+        {
+            "context": get_filtered_context,
+            "question": lambda x: unpack_chain_input(x)[0],
+            "deadline": lambda x: unpack_chain_input(x)[2],
+        }
+        | RunnableLambda(generate_with_budget)
     )
     
     return chain
@@ -919,6 +1887,23 @@ def init_chain():
 # 전역 변수로 체인 저장
 chain = init_chain()
 
+_worker_pid = None
+
+
+@app.before_request
+def _init_worker():
+    """프로세스(gunicorn 워커)의 첫 요청에서 한 번: OpenAI 클라이언트 교체 + 커넥션 풀 워밍업
+
+    --preload면 import는 마스터에서 일어나므로, 마스터의 커넥션 풀을 fork 너머로 쓰지 않고
+    워커마다 자기 풀을 채움 (마스터는 워밍업하지 않음)
+    """
+    global _worker_pid, _base_embeddings
+    if _worker_pid == os.getpid():
+        return
+    _worker_pid = os.getpid()
+    _base_embeddings = embeddings.base = get_embeddings(**BASE_EMBEDDING_PARAMS)
+    warm_up_in_background()
+
 # 사용자별 마지막 질문 시간 추적
 user_last_question_time = {}
 
@@ -973,6 +1958,48 @@ def admin_api_logs():
     logs = read_chat_logs(limit=100, category=category)
     return jsonify({'logs': logs})
 
+@app.route('/admin/api/cache')
+@admin_required
+def admin_api_cache():
+    try:
+        exact = exact_cache.stats()
+    except Exception as e:
+        exact = {'error': str(e)}
+    return jsonify({'semantic': semantic_cache.stats(), 'exact': exact, 'query_embedding': embeddings.stats()})
+
+@app.route('/admin/api/faiss', methods=['GET', 'POST'])
+@admin_required
+def admin_api_faiss():
+    """FAISS 인덱스 요약. POST {"nprobe": n, "efSearch": n}이면 이 워커의 질의 시점 조절값 변경"""
+    vs = init_vectorstore()
+    applied = {}
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        applied = set_search_params(vs.index, data.get('nprobe'), data.get('efSearch'))
+        if applied:
+            semantic_cache.clear()   # 검색 결과가 달라질 수 있음
+    return jsonify({'index': describe(vs.index), 'applied': applied})
+
+@app.route('/admin/api/bm25/compact', methods=['POST'])
+@admin_required
+def admin_compact_bm25():
+    """BM25 인덱스 전체 재구축 (명시적 컴팩션)"""
+    ok = rebuild_bm25_and_hybrid()
+    return jsonify({'success': ok, 'chunks': len(bm25_index) if bm25_index is not None else 0})
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    """Prometheus 텍스트 포맷 메트릭 (관리자 세션 또는 METRICS_TOKEN Bearer 인증)"""
+    metrics_token = os.getenv("METRICS_TOKEN")
+    bearer = request.headers.get('Authorization', '')
+    authorized = session.get('admin_logged_in') or (
+        metrics_token and bearer == f"Bearer {metrics_token}")
+    if not authorized:
+        return Response("unauthorized\n", status=401, mimetype="text/plain")
+    body = "\n".join(h.render() for h in (stage_seconds, request_seconds, request_tokens))
+    body += "\n" + embeddings.render_metrics() + "\n"
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
 @app.route('/admin/api/feedback')
 @admin_required
 def admin_api_feedback():
@@ -984,39 +2011,57 @@ def admin_api_feedback():
     
     return jsonify({'feedback_logs': feedback_logs})
 
-@app.route('/ask', methods=['POST'])
-def ask():
-    data = request.get_json()
-    question = data.get('question', '').strip()
-    user_id = data.get('user_id', 'web_user')
-    
-    if not question:
-        return jsonify({'answer': '질문을 입력해주세요.', 'is_fallback': True, 'success': False})
-    
+def precheck_question(question, user_id, deadline):
+    """쿨다운/정확 일치 캐시/가드레일 검증 (/ask, /ask/stream 공용)
+
+    (바로 돌려줄 응답 dict(차단 또는 캐시 히트) 또는 None, 체인에 넘길 prefetch dict 또는 None) 반환
+    """
     # 5초 쿨다운 체크
     current_time = datetime.now()
     if user_id in user_last_question_time:
         time_diff = (current_time - user_last_question_time[user_id]).total_seconds()
         if time_diff < 5:
             remaining_time = 5 - time_diff
-            return jsonify({
+            return {
                 'answer': f'잠시 후 다시 질문해주세요. ({remaining_time:.1f}초 남음)',
                 'is_fallback': True,
                 'success': False,
                 'cooldown': True,
                 'remaining_time': remaining_time
-            })
+            }, None
     
     # 마지막 질문 시간 업데이트
     user_last_question_time[user_id] = current_time
     
+    # 정확 일치 캐시: 같은 질문(띄어쓰기/문장부호 무시)은 LLM 호출 없이 바로 응답
+    cached_answer = lookup_exact_cache(question)
+    if cached_answer is not None:
+        print(f"♻️ 정확 일치 캐시 히트: {question}")
+        save_chat_log(question, cached_answer, is_fallback=False)
+        return {'question': question, 'answer': cached_answer, 'success': True, 'cached': True}, None
+    
+    # 요청 단위 검색 컨텍스트: 여기서 받은 검색 결과/문서 특징을 체인까지 이어 씀
+    rctx = RetrievalContext(question)
+    prefetch = {'retrieval': rctx}
+    
+    # 규칙 검증을 통과한 질문만 LLM 관련성 검증/키워드 추출/원 질문 검색을 동시에 시작
+    if guardrails.check_rules(question) is None:
+        prefetch.update(start_prefetch(question, deadline, rctx))
+    
     # 가드레일 검증
-    validation = guardrails.validate_question(question, user_id)
+    validation = guardrails.validate_question(
+        question, user_id,
+        relevance_future=prefetch.get('relevance'),
+        relevance_timeout=deadline.budget("relevance")
+    )
     if not validation['valid']:
         # ✅ (추가) 벡터스토어 히트가 있으면 우회 허용
         try:
-            docs = retriever.get_relevant_documents(question)
-            docs = generic_rerank(question, docs)
+            if 'plain_docs' in prefetch:
+                docs = prefetch['plain_docs'].result(timeout=deadline.budget("retrieval"))
+            else:
+                docs = rctx.retrieve(question)
+            docs = generic_rerank(question, docs, rctx)
             ok_dom, _ = domain_guard(question, docs)
             if ok_dom and len(docs) > 0:
                 print("ℹ️ Guardrails 비통과지만, 벡터 히트 + 도메인 증거 확인 → 제한적 우회 진행")
@@ -1031,8 +2076,9 @@ def ask():
                     response['examples'] = validation['examples']
                 if validation.get('is_duplicate', False):
                     response['is_duplicate'] = True
+                cancel_prefetch(prefetch)
                 save_chat_log(question, validation['message'], is_fallback=True)
-                return jsonify(response)
+                return response, None
            
         except Exception as e:
             print(f"우회 검사 오류: {e}")
@@ -1041,42 +2087,192 @@ def ask():
                 'is_fallback': True,
                 'success': False
             }
+            cancel_prefetch(prefetch)
             save_chat_log(question, validation['message'], is_fallback=True)
-            return jsonify(response)
+            return response, None
+
+    return None, prefetch
 
+@app.route('/ask', methods=['POST'])
+def ask():
+    data = request.get_json()
+    question = data.get('question', '').strip()
+    user_id = data.get('user_id', 'web_user')
     
-    # 60초 타임아웃 설정
-    timeout_flag = {'timed_out': False}
+    # 60초 요청 데드라인 (검증 → 키워드 → 검색 → 생성 전 단계에 전파)
+    deadline = Deadline(REQUEST_TIMEOUT)
+    if not question:
+        record_request("ask", time.monotonic() - deadline.started)
+        return jsonify({'answer': '질문을 입력해주세요.', 'is_fallback': True, 'success': False})
     
-    def timeout_callback():
-        timeout_flag['timed_out'] = True
+    timings = RequestTimings()
+    token = _request_timings.set(timings)
+    try:
+        # 프리페치 스레드의 LLM 호출까지 포함한 요청 전체 토큰 집계
+        with get_openai_callback() as cb:
+            payload = answer_question(question, user_id, deadline, cb)
+    finally:
+        _request_timings.reset(token)
     
-    timer = threading.Timer(60.0, timeout_callback)
-    timer.start()
+    elapsed = time.monotonic() - deadline.started
+    record_request("ask", elapsed, cb)
+    response = jsonify(payload)
+    timings.add("total", elapsed)
+    response.headers['Server-Timing'] = timings.header()
+    return response
+
+def answer_question(question, user_id, deadline, cb):
+    """/ask 본문: 사전 검증 → 캐시 → RAG 체인, 응답 JSON(dict) 반환"""
+    early, prefetch = precheck_question(question, user_id, deadline)
+    if early is not None:
+        return early
+    
+    # 시맨틱 캐시: 비슷한 질문의 답변이 있으면 검색/생성 생략
+    cached, question_vec = lookup_semantic_cache(question, prefetch)
+    if cached:
+        cancel_prefetch(prefetch)
+        print(f"♻️ 시맨틱 캐시 히트 ({cached['similarity']:.3f}): {cached['question']}")
+        save_chat_log(question, cached['answer'], is_fallback=False)
+        return {'question': question, 'answer': cached['answer'], 'success': True, 'cached': True}
     
     try:
         # RAG 체인 실행
-        answer = chain.invoke(question)
-        
-        # 성공 시 타이머 취소
-        timer.cancel()
+        answer = chain.invoke({'question': question, 'prefetch': prefetch, 'deadline': deadline})
         
-        if timeout_flag['timed_out']:
-            return jsonify({
-                'answer': '답변 생성 시간이 60초를 초과했습니다. 질문을 더 구체적으로 해주세요.',
+        store_answer_caches(question, answer, question_vec,
+                            time.monotonic() - deadline.started, cb.total_tokens)
+        save_chat_log(question, answer, is_fallback=False)
+        return {'question': question, 'answer': answer, 'success': True}
+    except Exception as e:
+        if is_timeout_error(e):
+            cancel_prefetch(prefetch)
+            print(f"⏱️ 요청 데드라인 초과: {e!r}")
+            timeout_msg = '답변 생성 시간이 60초를 초과했습니다. 질문을 더 구체적으로 해주세요.'
+            save_chat_log(question, timeout_msg, is_fallback=True)   # /ask/stream과 같이 관리자 로그에 남김
+            return {
+                'answer': timeout_msg,
                 'is_fallback': True,
                 'success': False,
                 'timeout': True
-            })
-        
-        save_chat_log(question, answer, is_fallback=False)
-        return jsonify({'question': question, 'answer': answer, 'success': True})
-    except Exception as e:
-        timer.cancel()
+            }
         print(f"Error: {e}")
         fallback_msg = guardrails.get_fallback_response('search_error')
         save_chat_log(question, fallback_msg, is_fallback=True)
-        return jsonify({'answer': fallback_msg, 'is_fallback': True, 'success': False})
+        return {'answer': fallback_msg, 'is_fallback': True, 'success': False}
+
+def sse_event(event, payload):
+    """Server-Sent Events 한 프레임 직렬화"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def iterate_in_context(ctx, gen):
+    """제너레이터의 각 단계를 같은 contextvars 컨텍스트(ctx)에서 실행
+
+    스트리밍 응답은 요청 함수가 반환된 뒤 한 조각씩 실행되므로, 요청 단위 변수(_request_timings,
+    토큰 콜백)를 요청마다 복사한 컨텍스트에 두고 매 단계 그 안에서 돌림
+    """
+    try:
+        while True:
+            try:
+                item = ctx.run(next, gen)
+            except StopIteration:
+                return
+            yield item
+    finally:
+        ctx.run(gen.close)
+
+@app.route('/ask/stream', methods=['POST'])
+def ask_stream():
+    """/ask의 스트리밍 버전: 토큰이 생성되는 대로 SSE로 흘려보냄"""
+    data = request.get_json()
+    question = data.get('question', '').strip()
+    user_id = data.get('user_id', 'web_user')
+
+    def generate():
+        # 60초 요청 데드라인: 청크 사이마다 확인, 초과 시 스트림(=OpenAI 연결)을 닫음
+        deadline = Deadline(REQUEST_TIMEOUT)
+        timings = RequestTimings()
+        _request_timings.set(timings)   # iterate_in_context가 준 이 요청 전용 컨텍스트
+        cb = None
+
+        def final(event, payload):
+            # 헤더는 이미 나갔으므로 Server-Timing 값은 마지막 이벤트에 실어 보냄
+            timings.add("total", time.monotonic() - deadline.started)
+            return sse_event(event, {**payload, 'server_timing': timings.header()})
+
+        try:
+            if not question:
+                yield final('fallback', {'answer': '질문을 입력해주세요.', 'is_fallback': True, 'success': False})
+                return
+
+            early, prefetch = precheck_question(question, user_id, deadline)
+            if early is not None:
+                if early.get('success'):
+                    # 캐시 히트: 전체 답변을 한 번에 전송
+                    yield sse_event('token', {'content': early['answer']})
+                    yield final('done', early)
+                else:
+                    yield final('fallback', early)
+                return
+
+            cached, question_vec = lookup_semantic_cache(question, prefetch)
+            if cached:
+                cancel_prefetch(prefetch)
+                print(f"♻️ 시맨틱 캐시 히트 ({cached['similarity']:.3f}): {cached['question']}")
+                save_chat_log(question, cached['answer'], is_fallback=False)
+                yield sse_event('token', {'content': cached['answer']})
+                yield final('done', {'question': question, 'answer': cached['answer'], 'success': True, 'cached': True})
+                return
+
+            timeout_msg = '답변 생성 시간이 60초를 초과했습니다. 질문을 더 구체적으로 해주세요.'
+            parts = []
+            try:
+                with get_openai_callback() as cb:
+                    stream = chain.stream({'question': question, 'prefetch': prefetch, 'deadline': deadline})
+                    try:
+                        for token in stream:
+                            if not token:
+                                continue
+                            parts.append(token)
+                            yield sse_event('token', {'content': token})
+                            deadline.check("generation")
+                    finally:
+                        stream.close()
+
+                # ✅ 로그/피드백은 조립된 전체 답변 기준
+                answer = "".join(parts)
+                store_answer_caches(question, answer, question_vec,
+                                    time.monotonic() - deadline.started, cb.total_tokens)
+                save_chat_log(question, answer, is_fallback=False)
+                yield final('done', {'question': question, 'answer': answer, 'success': True})
+            except GeneratorExit:
+                # 클라이언트가 연결을 끊음 → 생성 중단
+                print("ℹ️ 스트리밍 클라이언트 연결 종료")
+                raise
+            except Exception as e:
+                if is_timeout_error(e):
+                    cancel_prefetch(prefetch)
+                    print(f"⏱️ 요청 데드라인 초과: {e!r}")
+                    save_chat_log(question, timeout_msg, is_fallback=True)
+                    yield final('fallback', {
+                        'answer': timeout_msg,
+                        'is_fallback': True,
+                        'success': False,
+                        'timeout': True
+                    })
+                    return
+                print(f"Error: {e}")
+                fallback_msg = guardrails.get_fallback_response('search_error')
+                save_chat_log(question, fallback_msg, is_fallback=True)
+                yield final('fallback', {'answer': fallback_msg, 'is_fallback': True, 'success': False})
+        finally:
+            # 빈 질문/가드레일 거절/캐시 히트/생성/오류 모든 경로를 /ask와 같은 히스토그램에 기록
+            record_request("ask_stream", time.monotonic() - deadline.started, cb)
+
+    return Response(
+        stream_with_context(iterate_in_context(contextvars.copy_context(), generate())),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/feedback', methods=['POST'])
 def feedback():
@@ -1113,31 +2309,39 @@ def add_documents_to_vectorstore(new_documents):
     global vectorstore
     # 항상 같은 인스턴스를 확보 (디스크에서 새로 로드하지 말 것!)
     vectorstore = init_vectorstore()
+    init_hybrid_retriever()   # bm25_index 확보
 
-    # 배치 처리 추가
-    batch_size = 5
-    total_chunks = 0
-
-    for i in range(0, len(new_documents), batch_size):
-        batch = new_documents[i:i+batch_size]
-        print(f"📦 배치 {i//batch_size + 1}/{(len(new_documents)-1)//batch_size + 1} 처리 중... ({len(batch)}개 문서)")
+    # 텍스트 분할
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=120)
+    split_documents = split_and_link(new_documents, text_splitter)
+    total_chunks = len(split_documents)
+    print(f"✂️ {len(new_documents)}개 문서 → {total_chunks}개 청크")
 
-        # 텍스트 분할
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=120)
-        split_documents = text_splitter.split_documents(batch)
-
-        # ✅ FAISS에만 증분 추가
-        vectorstore.add_documents(split_documents)
-        total_chunks += len(split_documents)
-        print(f"✅ 배치 {i//batch_size + 1} 추가 완료 ({len(split_documents)}개 청크)")
-
-    # 저장
-    vectorstore.save_local(VECTOR_DIR)
+    # ✅ FAISS에 증분 추가 (임베딩은 스케줄러가 토큰 기준 묶음으로 동시에), 청크 인덱스/BM25도 같이
+    build_stats = embeddings.begin_build()   # 청크 임베딩 캐시 적중/절감량 집계
+    try:
+        if split_documents:
+            ensure_writable(vectorstore)   # mmap(읽기 전용)으로 열었으면 이 워커만 힙으로 복사
+            vectorstore.add_documents(split_documents, ids=chunk_ids(split_documents))
+    finally:
+        embeddings.end_build(build_stats)
+    chunk_index.add_chunks(split_documents)
+    bm25_index.add_documents(split_documents)
+    print(f"💰 청크 임베딩 캐시: {build_stats.summary()}")
+    last_embed_build.update(build_stats.report())
+
+    # 저장 (BM25는 새 청크의 postings만 추가된 상태로 저장, FAISS는 임시 파일 → 교체)
+    save_vectorstore(vectorstore, VECTOR_DIR, legacy_pickle=FAISS_LEGACY_PICKLE)
+    bm25_index.save(VECTOR_DIR)
+    if bm25_retriever is not None:
+        bm25_retriever.refresh()   # CSR 스냅샷을 여기서 한 번 (요청 경로에서 재생성하지 않게)
     print(f"✅ 벡터스토어에 총 {total_chunks}개 청크 추가 완료")
 
-    # ✅ BM25/하이브리드 리트리버 재구성 (증분 반영)
-    rebuild_bm25_and_hybrid()
+    # 인덱스가 바뀌었으니 이전 답변 캐시 무효화
+    semantic_cache.clear()
+    exact_cache.purge_stale()
 
+    # BM25/하이브리드 리트리버는 같은 인덱스 객체를 보고 있어 재구성 불필요
     return True
 
 
@@ -1272,7 +2476,7 @@ def admin_add_data():
 def admin_rebuild_vectorstore():
     """벡터스토어를 완전히 재구축"""
     try:
-        global vectorstore
+        global vectorstore, bm25_retriever, bm25_index, hybrid_retriever
         
         # 기존 벡터스토어 삭제
         if os.path.exists(VECTOR_DIR):
@@ -1280,14 +2484,21 @@ def admin_rebuild_vectorstore():
             shutil.rmtree(VECTOR_DIR)
             print("🗑️ 기존 벡터스토어 삭제")
         
-        # 새로 생성
+        # 새로 생성 (메모리 싱글톤도 비워야 디스크에서 다시 만듦)
+        vectorstore = None
+        bm25_retriever = None
+        bm25_index = None
+        hybrid_retriever = None
         vectorstore = init_vectorstore()
+        semantic_cache.clear()
+        exact_cache.purge_stale()
         
         # 체인도 새로 초기화
         global chain
         chain = init_chain()
         
-        return jsonify({'success': True, 'message': '벡터스토어가 재구축되었습니다'})
+        return jsonify({'success': True, 'message': '벡터스토어가 재구축되었습니다',
+                        'embedding_cache': dict(last_embed_build)})
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -0,0 +1,163 @@
+"""FAISS 근사 검색(IVF/IVF-PQ/HNSW) 재현율 vs 지연 벤치마크 (flat 기준)
+
+우리 청크 벡터로 인덱스 종류 × 질의 시점 조절값(nprobe / efSearch)마다
+  - 구축 시간(학습 + 추가), 직렬화 크기,
+  - 질의당 지연 p50/p95 (질의 하나씩, k개),
+  - flat(전수 탐색) 상위 k개 대비 recall@10, recall@k
+를 잽니다. k 기본값 60은 app3 FAISS MMR의 fetch_k(MMR이 고르는 후보 수)와 같습니다.
+
+벡터: 기본은 app3 벡터스토어의 청크를 app3.embeddings로 다시 임베딩(청크 임베딩 캐시에서 읽으므로
+보통 API 호출 없음), --scale N이면 합성 코퍼스 N배. 질의는 chat_log.csv 질문(없으면 예시 질문).
+
+사용 예:
+    python bench/ann_bench.py                                  # 현재 인덱스 청크, flat/ivf/ivfpq/hnsw
+    LLM_BACKEND=offline python bench/ann_bench.py --scale 100 --kinds ivf hnsw
+    python bench/ann_bench.py --nprobe 4 16 64 --ef-search 32 128 --k 25
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, "bench", "results")
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "bench"))
+
+KINDS = ("ivf", "ivfpq", "hnsw")
+
+
+def load_vectors(app3, scale, seed):
+    """(청크 벡터 행렬, 설명)"""
+    import numpy as np
+    if scale:
+        from bm25_bench import _NoSplit
+        from synth_corpus import generate_chunks
+        chunks = app3.split_and_link(generate_chunks(scale, app3.infer_section_ids, seed=seed), _NoSplit())
+        source = f"synthetic x{scale}"
+    else:
+        chunks = app3._all_docs_from_faiss(app3.init_vectorstore())
+        source = app3.VECTOR_DIR
+    started = time.perf_counter()
+    vectors = np.asarray(app3.embeddings.embed_documents([c.page_content for c in chunks]), dtype="float32")
+    print(f"📚 {source}: 청크 {len(chunks)}개, {vectors.shape[1]}차원 ({time.perf_counter() - started:.1f}초)")
+    return vectors, source
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def measure(index, queries, k):
+    """(질의별 상위 k id 목록, 지연 ms 목록) — 질의 하나씩 (서빙과 같은 조건)"""
+    ids, latencies = [], []
+    index.search(queries[:1], k)  # 워밍업
+    for i in range(len(queries)):
+        started = time.perf_counter()
+        _, found = index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        ids.append([int(x) for x in found[0] if x >= 0])
+    return ids, latencies
+
+
+def recall(found, exact, k):
+    hits = [len(set(f[:k]) & set(e[:k])) / len(e[:k]) for f, e in zip(found, exact) if e]
+    return round(sum(hits) / len(hits), 4) if hits else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAISS 인덱스 종류별 재현율/지연 비교")
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    parser.add_argument("--scale", type=int, default=0, help="0이면 현재 벡터스토어 청크, N이면 합성 코퍼스 N배")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=60)
+    parser.add_argument("--nprobe", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--ef-search", nargs="+", type=int, default=[16, 32, 64, 128, 256])
+    parser.add_argument("--nlist", type=int, default=None, help="기본 4·√청크 수")
+    parser.add_argument("--pq-m", type=int, default=None)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=1, help="faiss OpenMP 스레드 (서빙 워커와 맞추려면 1)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    os.chdir(ROOT_DIR)
+    import faiss
+    import numpy as np
+    import app3
+    from bm25_bench import load_queries
+    from faiss_index import describe, factory_string, set_search_params, train_index
+
+    faiss.omp_set_num_threads(args.threads)
+    vectors, source = load_vectors(app3, args.scale, args.seed)
+    questions = load_queries(args.queries)
+    queries = np.asarray([app3.embeddings.embed_query(q) for q in questions], dtype="float32")
+    k = min(args.k, len(vectors))
+
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    exact, flat_lat = measure(flat, queries, k)
+    rows = [{
+        "kind": "flat", "factory": "Flat", "param": None, "build_s": 0.0,
+        "bytes": int(vectors.nbytes),
+        "query_ms_p50": round(percentile(flat_lat, 0.5), 3), "query_ms_p95": round(percentile(flat_lat, 0.95), 3),
+        "recall@10": 1.0, f"recall@{k}": 1.0,
+    }]
+    print(f"\n  {'인덱스':<22} {'조절값':<14} {'구축(s)':>8} {'크기(MB)':>9} {'p50(ms)':>9} {'p95(ms)':>9} "
+          f"{'R@10':>7} {f'R@{k}':>7}")
+    _print_row(rows[0], k)
+
+    for kind in args.kinds:
+        spec = factory_string(kind, len(vectors), vectors.shape[1], nlist=args.nlist,
+                              pq_m=args.pq_m, hnsw_m=args.hnsw_m)
+        started = time.perf_counter()
+        index = train_index(spec, vectors, seed=args.seed)
+        index.add(vectors)
+        build_s = time.perf_counter() - started
+        size = len(faiss.serialize_index(index))
+        info = describe(index)
+        if "nlist" in info:
+            settings = [("nprobe", n) for n in args.nprobe if n <= info["nlist"]]
+        else:
+            settings = [("efSearch", n) for n in args.ef_search]
+        for name, value in settings:
+            set_search_params(index, **({"nprobe": value} if name == "nprobe" else {"ef_search": value}))
+            found, latencies = measure(index, queries, k)
+            row = {
+                "kind": kind, "factory": spec, "param": {name: value}, "build_s": round(build_s, 2),
+                "bytes": size,
+                "query_ms_p50": round(percentile(latencies, 0.5), 3),
+                "query_ms_p95": round(percentile(latencies, 0.95), 3),
+                "recall@10": recall(found, exact, 10), f"recall@{k}": recall(found, exact, k),
+            }
+            rows.append(row)
+            _print_row(row, k)
+
+    result = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "source": source,
+        "chunks": int(len(vectors)),
+        "dim": int(vectors.shape[1]),
+        "queries": len(questions),
+        "k": k,
+        "threads": args.threads,
+        "results": rows,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"ann_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 저장: {out}")
+
+
+def _print_row(row, k):
+    param = ",".join(f"{n}={v}" for n, v in (row["param"] or {}).items()) or "-"
+    print(f"  {row['factory']:<22} {param:<14} {row['build_s']:>8.2f} {row['bytes'] / 1e6:>9.1f} "
+          f"{row['query_ms_p50']:>9.3f} {row['query_ms_p95']:>9.3f} {row['recall@10']:>7} {row[f'recall@{k}']:>7}")
+
+
+if __name__ == "__main__":
+    main()
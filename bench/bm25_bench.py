@@ -0,0 +1,170 @@
+"""BM25 엔진 비교 벤치마크: rank_bm25(BM25Retriever) vs BM25Index(postings) vs CSR 행렬
+
+합성 코퍼스 배수별로
+  - 인덱스 구축 시간 (CSR은 BM25Index + 행렬 스냅샷),
+  - 질의당 지연 p50/p95 (k=30, app2/app3 앙상블 설정과 같음),
+  - 상위 k개가 BM25Index 결과와 얼마나 겹치는지 (같은 점수식인지 확인용)
+를 잽니다. 질의는 chat_log.csv 질문을 쓰고, 없으면 micro_bench의 예시 질문을 씁니다.
+
+사용 예:
+    python bench/bm25_bench.py                      # 코퍼스 1x/10x/100x
+    python bench/bm25_bench.py --scales 1000 --skip rank_bm25 --queries 500
+    BM25_TOKENIZER=whitespace python bench/bm25_bench.py   # 공백 분리 토크나이저로 비교
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, "bench", "results")
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "bench"))
+
+ENGINES = ("rank_bm25", "bm25_index", "csr")
+
+
+def load_queries(limit):
+    from micro_bench import QUESTIONS
+    questions = []
+    path = os.path.join(ROOT_DIR, "chat_log.csv")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                q = (row.get("question") or "").strip()
+                if q and q not in questions:
+                    questions.append(q)
+    questions = questions or list(QUESTIONS)
+    while len(questions) < limit:
+        questions.extend(questions[:limit - len(questions)])
+    return questions[:limit]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def build_engines(chunks, k, skip, tokenize):
+    """엔진 이름 -> (구축 시간 ms, 질의 함수: query -> [chunk_id])"""
+    from bm25_index import BM25Index, CSRBM25
+
+    engines = {}
+    if "rank_bm25" not in skip:
+        from langchain_community.retrievers import BM25Retriever
+        started = time.perf_counter()
+        retriever = BM25Retriever.from_documents(chunks, preprocess_func=tokenize)
+        retriever.k = k
+        built = (time.perf_counter() - started) * 1000
+        engines["rank_bm25"] = (built, lambda q: [d.metadata["chunk_id"] for d in retriever.get_relevant_documents(q)])
+
+    started = time.perf_counter()
+    index = BM25Index(tokenize=tokenize)
+    index.add_documents(chunks)
+    index_ms = (time.perf_counter() - started) * 1000
+    if "bm25_index" not in skip:
+        engines["bm25_index"] = (index_ms, lambda q: [cid for cid, _ in index.search(q, k)])
+    if "csr" not in skip:
+        started = time.perf_counter()
+        csr = CSRBM25(index)
+        engines["csr"] = (index_ms + (time.perf_counter() - started) * 1000,
+                          lambda q: [cid for cid, _ in csr.search(q, k)])
+    return index, engines
+
+
+def measure_insert(index, chunks, tokenize, count=10):
+    """청크 count개 추가 후 CSR 엔진 갱신 비용: delta 반영(synced) vs 스냅샷 재생성 (ms)"""
+    from bm25_index import CSRBM25
+    engine = CSRBM25(index)
+    new = [(f"bench-new-{i}", c.page_content) for i, c in enumerate(chunks[:count])]
+    started = time.perf_counter()
+    for cid, text in new:
+        index.add(cid, text)
+    add_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    engine.synced(index)
+    sync_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    CSRBM25(index)
+    rebuild_ms = (time.perf_counter() - started) * 1000
+    index.delete([cid for cid, _ in new])
+    return {"insert_chunks": count, "insert_add_ms": round(add_ms, 2),
+            "insert_sync_ms": round(sync_ms, 2), "snapshot_rebuild_ms": round(rebuild_ms, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 엔진 구축/질의 비교")
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 10, 100], help="합성 코퍼스 배수")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=30)
+    parser.add_argument("--skip", nargs="+", choices=ENGINES, default=[], help="제외할 엔진 (1000x에서 rank_bm25는 느림)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    os.environ.setdefault("LLM_BACKEND", "offline")
+    os.chdir(ROOT_DIR)
+    import app3
+    from bm25_index import tokenizer_name
+    from synth_corpus import generate_chunks
+
+    queries = load_queries(args.queries)
+    tokenize = app3.bm25_tokenizer()
+    print(f"🔤 토크나이저: {tokenizer_name(tokenize)}")
+    rows = []
+    for scale in args.scales:
+        chunks = app3.split_and_link(generate_chunks(scale, app3.infer_section_ids, seed=args.seed), _NoSplit())
+        print(f"\n📚 코퍼스 x{scale}: 청크 {len(chunks)}개, 질의 {len(queries)}개")
+        index, engines = build_engines(chunks, args.k, set(args.skip), tokenize)
+        reference = {q: set(cid for cid, _ in index.search(q, args.k)) for q in queries}
+        for name, (built_ms, search) in engines.items():
+            search(queries[0])  # 워밍업
+            latencies, overlaps = [], []
+            for q in queries:
+                started = time.perf_counter()
+                hits = search(q)
+                latencies.append((time.perf_counter() - started) * 1000)
+                if reference[q]:
+                    overlaps.append(len(reference[q] & set(hits)) / len(reference[q]))
+            row = {
+                "engine": name, "scale": scale, "chunks": len(chunks),
+                "build_ms": round(built_ms, 1),
+                "query_ms_p50": round(percentile(latencies, 0.5), 3),
+                "query_ms_p95": round(percentile(latencies, 0.95), 3),
+                "overlap_vs_bm25_index": round(sum(overlaps) / len(overlaps), 4) if overlaps else None,
+            }
+            rows.append(row)
+            print(f"  {name:<11} 구축 {row['build_ms']:>9.1f} ms  질의 p50 {row['query_ms_p50']:>8.3f} ms "
+                  f"p95 {row['query_ms_p95']:>8.3f} ms  겹침 {row['overlap_vs_bm25_index']}")
+        if "csr" in engines:
+            cost = measure_insert(index, chunks, tokenize)
+            next(r for r in rows if r["engine"] == "csr" and r["scale"] == scale).update(cost)
+            print(f"  csr 청크 {cost['insert_chunks']}개 추가: 토큰화 {cost['insert_add_ms']:.1f} ms + "
+                  f"delta 반영 {cost['insert_sync_ms']:.2f} ms (스냅샷 재생성이면 {cost['snapshot_rebuild_ms']:.1f} ms)")
+
+    result = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "k": args.k,
+        "tokenizer": tokenizer_name(tokenize),
+        "queries": len(queries),
+        "results": rows,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"bm25_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 저장: {out}")
+
+
+class _NoSplit:
+    """generate_chunks가 이미 잘라 둔 청크에 chunk_id만 붙이기 위한 분할기"""
+
+    def split_documents(self, docs):
+        return docs
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""chat_log.csv / feedback_log.csv의 실제 질문을 /ask(또는 /ask/stream)에 다시 쏘는 부하 테스트
+
+급여결정신청 공고 직후 같은 트래픽 급증에 대비해 워커 수를 정할 때 씁니다.
+실제 OpenAI 백엔드로도, LLM_BACKEND=offline(offline_llm.py)으로 띄운 서버로도 돌릴 수 있습니다.
+
+사용 예:
+    # 서버: LLM_BACKEND=offline OFFLINE_LLM_LATENCY=0.8 python app3.py
+    python bench/loadtest.py --url http://localhost:5000 --concurrency 16 --rate 5 --duration 60
+    python bench/loadtest.py --stream --concurrency 8 --requests 200 --compare bench/results/이전결과.json
+
+결과:
+    p50/p95/p99 지연, 처리량, 오류/폴백/쿨다운 비율, (스트리밍이면) 첫 토큰까지 시간,
+    Server-Timing 헤더의 단계별 평균, /admin/metrics 차이로 구한 요청당 토큰/비용
+    → bench/results/loadtest_YYYYmmdd_HHMMSS.json 으로 저장
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import re
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, "bench", "results")
+
+# gpt-4o 기준 1K 토큰당 달러 (--prompt-price / --completion-price로 변경)
+DEFAULT_PROMPT_PRICE = 0.0025
+DEFAULT_COMPLETION_PRICE = 0.01
+
+
+def load_questions(paths):
+    """CSV들의 question 컬럼 (등장 빈도 그대로 유지 → 실제 분포로 재생)"""
+    questions = []
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"⚠️ 파일 없음, 건너뜀: {path}")
+            continue
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                q = (row.get("question") or "").strip()
+                if q:
+                    questions.append(q)
+        print(f"📄 {os.path.basename(path)}: 누적 질문 {len(questions)}개")
+    return questions
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def parse_server_timing(header):
+    """'bm25;dur=4.1, generation;dur=812.0' → {'bm25': 4.1, ...} (ms)"""
+    stages = {}
+    for part in (header or "").split(","):
+        m = re.match(r"\s*([\w\-]+);dur=([\d.]+)", part)
+        if m:
+            stages[m.group(1)] = float(m.group(2))
+    return stages
+
+
+def scrape_tokens(base_url, token):
+    """/admin/metrics의 rag_request_tokens 합계 (prompt, completion). 없으면 None"""
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    try:
+        res = requests.get(f"{base_url}/admin/metrics", headers=headers, timeout=10)
+        if res.status_code != 200:
+            return None
+    except requests.RequestException:
+        return None
+    totals = {}
+    for kind in ("prompt", "completion"):
+        m = re.search(rf'rag_request_tokens_sum\{{kind="{kind}"\}} ([\d.e+]+)', res.text)
+        totals[kind] = float(m.group(1)) if m else 0.0
+    return totals
+
+
+def classify(payload):
+    if payload.get("cooldown"):
+        return "cooldown"
+    if payload.get("timeout"):
+        return "timeout"
+    if payload.get("success"):
+        return "cached" if payload.get("cached") else "success"
+    return "fallback"
+
+
+def ask_once(session, base_url, question, user_id, timeout, started=None):
+    """started: 지연을 잴 기준 시각 (개방형이면 예정 도착 시각, 없으면 지금)"""
+    started = started or time.perf_counter()
+    res = session.post(f"{base_url}/ask", json={"question": question, "user_id": user_id}, timeout=timeout)
+    latency = time.perf_counter() - started
+    res.raise_for_status()
+    return {"latency": latency, "ttft": None, "outcome": classify(res.json()),
+            "stages": parse_server_timing(res.headers.get("Server-Timing"))}
+
+
+def ask_stream_once(session, base_url, question, user_id, timeout, started=None):
+    started = started or time.perf_counter()
+    ttft = None
+    payload = {}
+    with session.post(f"{base_url}/ask/stream", json={"question": question, "user_id": user_id},
+                      timeout=timeout, stream=True) as res:
+        res.raise_for_status()
+        event = None
+        for line in res.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                if event == "token" and ttft is None:
+                    ttft = time.perf_counter() - started
+                elif event in ("done", "fallback"):
+                    payload = json.loads(line[5:].strip())
+    return {"latency": time.perf_counter() - started, "ttft": ttft,
+            "outcome": classify(payload) if payload else "error", "stages": {}}
+
+
+def run(args):
+    questions = load_questions(args.source)
+    if not questions:
+        raise SystemExit("❌ 재생할 질문이 없습니다.")
+    rng = random.Random(args.seed)
+    base_url = args.url.rstrip("/")
+    do_request = ask_stream_once if args.stream else ask_once
+
+    results = []
+    lock = threading.Lock()
+    local = threading.local()
+    counter = iter(range(10 ** 9))
+
+    def worker(i, question, scheduled=None):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        # 서버의 5초 쿨다운은 user_id 단위 → --users로 가상 사용자 수 제한 (0이면 요청마다 새 사용자)
+        user_id = f"loadtest_{i % args.users if args.users else i}"
+        # 개방형: 예정 도착 시각부터 잼 → 워커가 밀려 큐에서 기다린 시간도 지연에 포함 (coordinated omission 방지)
+        queue_wait = time.perf_counter() - scheduled if scheduled is not None else 0.0
+        try:
+            r = do_request(local.session, base_url, question, user_id, args.timeout, started=scheduled)
+        except Exception as e:
+            r = {"latency": None, "ttft": None, "outcome": "error", "stages": {}, "error": repr(e)}
+        r["queue_wait"] = queue_wait
+        with lock:
+            results.append(r)
+
+    tokens_before = scrape_tokens(base_url, args.metrics_token)
+    print(f"🚀 부하 시작: {base_url} ({'stream' if args.stream else 'ask'}), 동시성 {args.concurrency}, "
+          f"도착률 {args.rate or '최대'}/s, {args.duration}s / 최대 {args.requests or '∞'}건")
+
+    started = time.perf_counter()
+    submitted = 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        pending = set()
+        next_at = started
+        while True:
+            now = time.perf_counter()
+            if now - started >= args.duration or (args.requests and submitted >= args.requests):
+                break
+            pending = {f for f in pending if not f.done()}
+            scheduled = None
+            if args.rate:
+                # 개방형(open-loop) 부하: 포아송 도착, 서버가 느려져도 요청은 계속 들어옴
+                if now < next_at:
+                    time.sleep(min(next_at - now, 0.05))
+                    continue
+                scheduled = next_at
+                next_at += rng.expovariate(args.rate)
+            else:
+                # 폐쇄형(closed-loop): 동시성만큼 꽉 채워서 최대 처리량 측정
+                if len(pending) >= args.concurrency:
+                    time.sleep(0.005)
+                    continue
+            i = next(counter)
+            question = questions[rng.randrange(len(questions))] if args.shuffle else questions[i % len(questions)]
+            pending.add(pool.submit(worker, i, question, scheduled))
+            submitted += 1
+    elapsed = time.perf_counter() - started
+    tokens_after = scrape_tokens(base_url, args.metrics_token)
+
+    return summarize(args, results, elapsed, tokens_before, tokens_after)
+
+
+def summarize(args, results, elapsed, tokens_before, tokens_after):
+    outcomes = defaultdict(int)
+    for r in results:
+        outcomes[r["outcome"]] += 1
+    n = len(results)
+    ok = [r for r in results if r["latency"] is not None]
+    lat = [r["latency"] for r in ok]
+    answered = [r["latency"] for r in ok if r["outcome"] in ("success", "cached")]
+    ttft = [r["ttft"] for r in ok if r["ttft"] is not None]
+
+    stage_sums, stage_counts = defaultdict(float), defaultdict(int)
+    for r in ok:
+        for stage, ms in r["stages"].items():
+            stage_sums[stage] += ms
+            stage_counts[stage] += 1
+
+    summary = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("metrics_token", "compare")},
+        "requests": n,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(n / elapsed, 3) if elapsed else None,
+        "outcomes": dict(outcomes),
+        "error_rate": round(outcomes["error"] / n, 4) if n else None,
+        "fallback_rate": round((outcomes["fallback"] + outcomes["timeout"]) / n, 4) if n else None,
+        "cooldown_rejections": outcomes["cooldown"],
+        "latency_seconds": {f"p{p}": _round(percentile(lat, p)) for p in (50, 95, 99)},
+        "answered_latency_seconds": {f"p{p}": _round(percentile(answered, p)) for p in (50, 95, 99)},
+        "ttft_seconds": {f"p{p}": _round(percentile(ttft, p)) for p in (50, 95, 99)} if ttft else None,
+        "mean_latency_seconds": _round(statistics.mean(lat)) if lat else None,
+        # 개방형에서 도착 후 워커를 기다린 시간 (지연에 포함됨). 크면 --concurrency가 부족한 것
+        "queue_wait_seconds": {f"p{p}": _round(percentile([r.get("queue_wait", 0.0) for r in results], p))
+                               for p in (50, 95, 99)} if args.rate else None,
+        "stage_mean_ms": {s: round(stage_sums[s] / stage_counts[s], 1) for s in stage_sums},
+        "tokens": None,
+    }
+    if tokens_before and tokens_after and n:
+        prompt = tokens_after["prompt"] - tokens_before["prompt"]
+        completion = tokens_after["completion"] - tokens_before["completion"]
+        summary["tokens"] = {
+            "prompt_per_request": round(prompt / n, 1),
+            "completion_per_request": round(completion / n, 1),
+            "usd_per_request": round((prompt * args.prompt_price + completion * args.completion_price) / 1000 / n, 6),
+        }
+    return summary
+
+
+def _round(v):
+    return round(v, 4) if v is not None else None
+
+
+def print_summary(summary, previous=None):
+    print("\n📊 결과")
+    keys = [("throughput_rps", "처리량(req/s)"), ("error_rate", "오류율"), ("fallback_rate", "폴백율"),
+            ("cooldown_rejections", "쿨다운 거절")]
+    for key, label in keys:
+        line = f"  {label}: {summary[key]}"
+        if previous and previous.get(key) is not None and summary[key] is not None:
+            line += f"  (이전 {previous[key]})"
+        print(line)
+    for p in ("p50", "p95", "p99"):
+        cur = summary["latency_seconds"][p]
+        line = f"  지연 {p}: {cur}s"
+        prev = (previous or {}).get("latency_seconds", {}).get(p)
+        if prev and cur is not None:
+            line += f"  (이전 {prev}s, {((cur - prev) / prev) * 100:+.1f}%)"
+        print(line)
+    if summary.get("queue_wait_seconds"):
+        print(f"  큐 대기 p50/p95: {summary['queue_wait_seconds']['p50']}s / {summary['queue_wait_seconds']['p95']}s "
+              f"(지연에 포함)")
+    if summary["ttft_seconds"]:
+        print(f"  첫 토큰 p50/p95: {summary['ttft_seconds']['p50']}s / {summary['ttft_seconds']['p95']}s")
+    if summary["stage_mean_ms"]:
+        print("  단계별 평균(ms): " + ", ".join(f"{s}={ms}" for s, ms in summary["stage_mean_ms"].items()))
+    if summary["tokens"]:
+        t = summary["tokens"]
+        print(f"  토큰/요청: prompt {t['prompt_per_request']}, completion {t['completion_per_request']}, "
+              f"${t['usd_per_request']}")
+    else:
+        print("  토큰: /admin/metrics에 접근할 수 없어 생략 (--metrics-token 또는 METRICS_TOKEN)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="실제 질문 재생 부하 테스트")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--source", nargs="+",
+                        default=[os.path.join(ROOT_DIR, "chat_log.csv"), os.path.join(ROOT_DIR, "feedback_log.csv")])
+    parser.add_argument("--stream", action="store_true", help="/ask/stream(SSE)으로 요청")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=0, help="초당 도착 요청 수 (0이면 폐쇄형 최대 부하)")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--requests", type=int, default=0, help="최대 요청 수 (0이면 duration까지)")
+    parser.add_argument("--users", type=int, default=0, help="가상 사용자 수 (0이면 요청마다 새 user_id)")
+    parser.add_argument("--timeout", type=float, default=90)
+    parser.add_argument("--shuffle", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--metrics-token", default=os.getenv("METRICS_TOKEN"))
+    parser.add_argument("--prompt-price", type=float, default=DEFAULT_PROMPT_PRICE)
+    parser.add_argument("--completion-price", type=float, default=DEFAULT_COMPLETION_PRICE)
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--compare", default=None, help="이전 결과 JSON과 비교")
+    args = parser.parse_args()
+
+    summary = run(args)
+    previous = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    print_summary(summary, previous)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"loadtest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"💾 저장: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""재랭킹/문서 특징 핫 함수 마이크로 벤치마크 (합성 코퍼스, 후보 수별)
+
+매 요청마다 청크 전문에 정규식을 돌리는 함수들이 후보 수/코퍼스 크기에 따라 어떻게
+늘어나는지 재고, 커밋 사이의 회귀를 잡기 위한 스크립트입니다.
+pytest-benchmark와 같은 방식(보정된 반복 횟수로 여러 라운드 → min/median/mean/stddev)으로
+재되, 저장소에 pytest 설정이 없어 단독 스크립트로 둡니다.
+
+대상: compute_chunk_features, _doc_feats, assign_date_priority, infer_section_ids, generic_rerank(ctx 없음/있음),
+      bundle_siblings, filter_relevant_context
+
+--memory: 시간 대신 청크 metadata의 청크당 힙 바이트를 tracemalloc으로 잽니다. 컬럼형 docstore 로드와
+같은 JSONL 줄에서 (1) 청크마다 metadata dict(pickle docstore와 같은 모양), (2) ChunkRecords를 만들고
+둘 다 index_to_docstore_id와 ChunkIndex.by_group까지 포함합니다. ChunkRecords.nbytes() 추정치도 같이 남깁니다.
+
+사용 예:
+    python bench/micro_bench.py                       # 코퍼스 1x/10x, 후보 10/25/80/250
+    python bench/micro_bench.py --scales 100 --sizes 80 1000 5000
+    python bench/micro_bench.py --compare bench/results/micro_abc1234.json --threshold 0.15
+    python bench/micro_bench.py --memory --scales 1 10 100
+
+app3를 import하므로 기본으로 LLM_BACKEND=offline을 켭니다(인덱스는 vectorstore_offline/).
+결과는 bench/results/micro_<커밋>_<시각>.json에 저장되고, --compare 기준 대비
+중앙값이 threshold 이상 느려진 항목이 있으면 종료 코드 1로 끝납니다.
+"""
+import argparse
+import gc
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, "bench", "results")
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "bench"))
+
+QUESTIONS = [
+    "복지용구 대여시 본인부담률 알려줘",           # percent
+    "전동침대 급여가격은 얼마인가요?",              # money
+    "급여결정신청 서류 제출 기한은 며칠인가요?",     # days
+    "복지용구 품목은 뭐뭐있어?",                   # 조건 없음
+]
+
+
+def git_commit():
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet"], cwd=ROOT_DIR) != 0
+        return sha + ("-dirty" if dirty else "")
+    except Exception:
+        return "unknown"
+
+
+def measure(fn, rounds, min_time):
+    """반복 횟수를 한 라운드가 min_time 이상 되도록 보정한 뒤 라운드별 1회 평균 시간(초)"""
+    fn()  # 워밍업
+    iterations = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or iterations >= 1_000_000:
+            break
+        iterations *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        samples.append((time.perf_counter() - started) / iterations)
+    return {
+        "min_ms": round(min(samples) * 1000, 4),
+        "median_ms": round(statistics.median(samples) * 1000, 4),
+        "mean_ms": round(statistics.mean(samples) * 1000, 4),
+        "stddev_ms": round(statistics.stdev(samples) * 1000, 4) if len(samples) > 1 else 0.0,
+        "rounds": rounds,
+        "iterations": iterations,
+    }
+
+
+def benchmarks(app3, candidates, corpus):
+    """(이름, 호출 함수) 목록. 질문은 호출마다 돌려 가며 사용"""
+    qs = itertools.cycle(QUESTIONS)
+    return [
+        # 인덱싱 시점 비용 (청크당 한 번) / 요청 시점 조회 비용
+        ("compute_chunk_features", lambda: [app3.compute_chunk_features(d) for d in candidates]),
+        ("_doc_feats", lambda: [app3._doc_feats(d) for d in candidates]),
+        ("assign_date_priority", lambda: [app3.assign_date_priority(d) for d in candidates]),
+        ("infer_section_ids", lambda: [app3.infer_section_ids(d.page_content) for d in candidates]),
+        ("generic_rerank", lambda: app3.generic_rerank(next(qs), candidates)),
+        # 요청마다 새 RetrievalContext → 문서 특징 캐시가 비어 있는 실제 요청 조건
+        ("generic_rerank_ctx", lambda: app3.generic_rerank(q := next(qs), candidates, app3.RetrievalContext(q))),
+        ("bundle_siblings", lambda: app3.bundle_siblings(candidates[:6], corpus)),
+        ("filter_relevant_context", lambda: app3.filter_relevant_context(next(qs), candidates)),
+    ]
+
+
+def meta_lines(app3, corpus):
+    """write_columnar의 meta.jsonl과 같은 줄 (청크 id는 split_and_link가 붙인 uuid)"""
+    from bm25_bench import _NoSplit
+    chunks = app3.split_and_link(corpus, _NoSplit())
+    return [json.dumps({"pos": pos, "id": c.metadata["chunk_id"], "metadata": c.metadata}, ensure_ascii=False)
+            for pos, c in enumerate(chunks)]
+
+
+def load_dict_metadata(lines):
+    """pickle docstore 경로: 청크마다 metadata dict"""
+    index_to_docstore_id, metadata, by_group = {}, {}, {}
+    for line in lines:
+        row = json.loads(line)
+        index_to_docstore_id[row["pos"]] = row["id"]
+        metadata[row["id"]] = row["metadata"]
+        by_group.setdefault(row["metadata"].get("group_key"), []).append(row["id"])
+    return index_to_docstore_id, metadata, by_group
+
+
+def load_chunk_records(lines):
+    """컬럼형 docstore 경로: ColumnarDocstore._open_files + ChunkIndex.build와 같은 객체"""
+    from chunk_records import ChunkRecords
+    index_to_docstore_id, records, by_group = {}, ChunkRecords(), {}
+    for line in lines:
+        row = json.loads(line)
+        index_to_docstore_id[row["pos"]] = row["id"]
+        records.append(row["id"], row["metadata"])
+    records.finish()
+    for row, doc_id in enumerate(records.ids):
+        by_group.setdefault(records.strings.get(int(records.records["group_key"][row])), []).append(doc_id)
+    return index_to_docstore_id, records, by_group
+
+
+def traced_bytes(build, lines):
+    """build(lines)가 남긴 객체의 힙 바이트 (입력 줄과 중간 객체는 제외)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build(lines)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+def memory_results(app3, corpus, scale):
+    lines = meta_lines(app3, corpus)
+    n = len(lines)
+    rows = []
+    for name, build in (("dict_metadata", load_dict_metadata), ("chunk_records", load_chunk_records)):
+        result, size = traced_bytes(build, lines)
+        row = {"name": name, "scale": scale, "chunks": n, "bytes_per_chunk": round(size / n, 1)}
+        if name == "chunk_records":
+            usage = result[1].memory_usage()
+            row["reported_bytes_per_chunk"] = round(sum(usage.values()) / n, 1)
+            row["reported"] = {k: round(v / n, 1) for k, v in usage.items()}
+        rows.append(row)
+        print(f"  {name:<16} 청크당 {row['bytes_per_chunk']:>8.1f} B"
+              + (f" (nbytes 추정 {row['reported_bytes_per_chunk']:.1f} B: "
+                 + ", ".join(f"{k} {v:.1f}" for k, v in row["reported"].items()) + ")" if "reported" in row else ""))
+        del result
+    return rows
+
+
+def compare(results, baseline, threshold):
+    base = {(r["name"], r["scale"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\n🔍 기준 대비 ({baseline.get('commit')})")
+    for r in results:
+        b = base.get((r["name"], r["scale"], r["size"]))
+        if not b:
+            continue
+        change = (r["median_ms"] - b["median_ms"]) / b["median_ms"] if b["median_ms"] else 0.0
+        mark = "🔺" if change > threshold else ("🔻" if change < -threshold else "  ")
+        print(f"  {mark} {r['name']:<24} x{r['scale']:<5} n={r['size']:<6} "
+              f"{b['median_ms']:>10.3f} → {r['median_ms']:>10.3f} ms ({change * 100:+.1f}%)")
+        if change > threshold:
+            regressions.append(r)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="재랭킹/특징 함수 마이크로 벤치마크")
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 10], help="합성 코퍼스 배수")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 25, 80, 250], help="후보 문서 수")
+    parser.add_argument("--only", nargs="+", default=None, help="일부 함수만")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05, help="라운드당 최소 측정 시간(초)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", default=None, help="기준 결과 JSON")
+    parser.add_argument("--threshold", type=float, default=0.10, help="회귀로 볼 중앙값 증가율")
+    parser.add_argument("--memory", action="store_true", help="시간 대신 청크 metadata 청크당 힙 바이트")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    os.environ.setdefault("LLM_BACKEND", "offline")
+    os.chdir(ROOT_DIR)
+    import app3
+    from synth_corpus import generate_chunks
+
+    results, memory = [], []
+    for scale in args.scales:
+        corpus = generate_chunks(scale, app3.infer_section_ids, seed=args.seed)
+        print(f"\n📚 코퍼스 x{scale}: 청크 {len(corpus)}개")
+        if args.memory:
+            memory.extend(memory_results(app3, corpus, scale))
+            continue
+        rng = random.Random(args.seed)
+        for size in args.sizes:
+            if size > len(corpus):
+                print(f"  ⏭️ 후보 {size}개 > 코퍼스, 건너뜀")
+                continue
+            candidates = rng.sample(corpus, size)
+            for name, fn in benchmarks(app3, candidates, corpus):
+                if args.only and name not in args.only:
+                    continue
+                stats = measure(fn, args.rounds, args.min_time)
+                results.append({"name": name, "scale": scale, "size": size, **stats})
+                print(f"  {name:<24} n={size:<6} median {stats['median_ms']:>10.3f} ms "
+                      f"(min {stats['min_ms']:.3f}, ±{stats['stddev_ms']:.3f})")
+
+    commit = git_commit()
+    summary = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    if args.memory:
+        summary["memory"] = memory
+    out = args.out or os.path.join(RESULTS_DIR, f"{'micro_mem' if args.memory else 'micro'}_{commit}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 저장: {out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"❌ 회귀 {len(regressions)}건 (중앙값 +{args.threshold * 100:.0f}% 초과)")
+            sys.exit(1)
+        print("✅ 회귀 없음")
+
+
+if __name__ == "__main__":
+    main()
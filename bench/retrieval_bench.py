@@ -0,0 +1,229 @@
+"""app.py ~ app3.py 검색 전략 품질/지연 비교 벤치마크
+
+네 앱의 검색 전략을 같은 인덱스(app3의 벡터스토어)에서 따로따로 돌려 비교합니다.
+    app       FAISS 유사도 k=15
+    app1      FAISS MMR k=25, fetch_k=80, lambda=0.2
+    app2      app2.py 설정 그대로: CSRBM25Retriever(get_tokenizer(), 한국어 k=20 / 공백 k=30)
+              + FAISS MMR(k=25, fetch_k=60, lambda=0.3) EnsembleRetriever(0.45/0.55)
+    app3      app2 앙상블 → generic_rerank → filter_relevant_context (본 경로)
+    app3_bundle  app3 + bundle_siblings(상위 6개) (키워드 추출 실패 시 경로)
+
+정답셋: feedback_log.csv에서 '좋아요'를 받은 답변마다, 답변 내용과 많이 겹치는 인덱스 청크를
+"근거 청크"로 표시합니다(청크 토큰 중 답변에 나온 비율 ≥ --support-threshold).
+근거 청크를 못 찾은 질문(잡담 등)은 빠집니다. 만든 정답셋은 bench/results/golden_set.json에
+저장해 다음 실행에도 그대로 씁니다(--rebuild-golden으로 다시 생성).
+
+키워드 추출 LLM은 빼고 원 질문으로만 검색하므로, 실제 OpenAI 임베딩이든
+LLM_BACKEND=offline이든 검색 단계만 공정하게 비교됩니다.
+
+사용 예:
+    python bench/retrieval_bench.py
+    LLM_BACKEND=offline python bench/retrieval_bench.py --strategies app2 app3 --repeat 3
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, "bench", "results")
+sys.path.insert(0, ROOT_DIR)
+
+_TOKEN_RE = re.compile(r"[0-9A-Za-z가-힣%]+")
+CONTEXT_DOCS = 10  # 모든 앱이 프롬프트에 최대 10개 문서를 넣음
+STRATEGIES = ("app", "app1", "app2", "app3", "app3_bundle")
+
+
+def chunk_id(doc) -> str:
+    """인덱스를 다시 만들어도 같은 청크면 같은 id (docstore id는 재구축마다 바뀜)"""
+    return hashlib.sha1((doc.page_content or "").encode("utf-8")).hexdigest()[:16]
+
+
+def content_tokens(text):
+    return {t for t in _TOKEN_RE.findall((text or "").lower()) if len(t) >= 2 or t.isdigit()}
+
+
+def count_tokens_fn():
+    """tiktoken이 있으면 gpt-4o 토크나이저, 없으면 대략치"""
+    try:
+        import tiktoken
+        enc = tiktoken.encoding_for_model("gpt-4o")
+        return lambda text: len(enc.encode(text))
+    except Exception:
+        from offline_llm import estimate_tokens
+        return estimate_tokens
+
+
+# === 정답셋 ===
+def build_golden_set(all_docs, feedback_path, threshold, max_support):
+    liked = {}
+    with open(feedback_path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            if row.get("feedback_type") == "like" and row.get("question", "").strip():
+                liked[row["question"].strip()] = row.get("answer", "")  # 같은 질문은 마지막 답변
+
+    chunk_tokens = [(chunk_id(d), content_tokens(d.page_content)) for d in all_docs]
+    golden = []
+    for question, answer in liked.items():
+        answer_tokens = content_tokens(answer)
+        scored = []
+        for cid, toks in chunk_tokens:
+            if len(toks) < 5:
+                continue
+            support = len(toks & answer_tokens) / len(toks)
+            if support >= threshold:
+                scored.append((support, cid))
+        if not scored:
+            continue
+        scored.sort(reverse=True)
+        golden.append({
+            "question": question,
+            "supporting_chunks": [cid for _, cid in scored[:max_support]],
+            "support": [round(s, 3) for s, _ in scored[:max_support]],
+        })
+    return golden
+
+
+def load_or_build_golden(args, all_docs):
+    path = args.golden
+    if os.path.exists(path) and not args.rebuild_golden:
+        with open(path, "r", encoding="utf-8") as f:
+            golden = json.load(f)
+        print(f"📄 정답셋 로드: {path} ({len(golden)}문항)")
+        return golden
+    golden = build_golden_set(all_docs, args.feedback, args.support_threshold, args.max_support)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(golden, f, ensure_ascii=False, indent=2)
+    print(f"💾 정답셋 생성: {path} ({len(golden)}문항)")
+    return golden
+
+
+# === 전략 ===
+def build_app2_ensemble(app3, vs):
+    """app2.py의 init_hybrid_retriever와 같은 구성 (app3의 HybridRetriever/복합어 토크나이저와 별개)"""
+    from langchain.retrievers import EnsembleRetriever
+    from bm25_index import CSRBM25Retriever, default_tokenize, get_tokenizer
+
+    tokenize = get_tokenizer()
+    bm25 = CSRBM25Retriever.from_documents(
+        app3._all_docs_from_faiss(vs), k=30 if tokenize is default_tokenize else 20, tokenize=tokenize)
+    faiss_ret = vs.as_retriever(search_type="mmr", search_kwargs={"k": 25, "fetch_k": 60, "lambda_mult": 0.3})
+    return EnsembleRetriever(retrievers=[bm25, faiss_ret], weights=[0.45, 0.55])
+
+
+def build_strategies(app3):
+    vs = app3.init_vectorstore()
+    app3.init_hybrid_retriever()
+    plain = vs.as_retriever(search_kwargs={"k": 15})
+    mmr = vs.as_retriever(search_type="mmr", search_kwargs={"k": 25, "fetch_k": 80, "lambda_mult": 0.2})
+    app2_ensemble = build_app2_ensemble(app3, vs)
+
+    def app3_main(q):
+        rctx = app3.RetrievalContext(q)
+        docs = app3.generic_rerank(q, rctx.retrieve(q), rctx)
+        return app3.filter_relevant_context(q, docs, rctx)
+
+    def app3_bundle(q):
+        rctx = app3.RetrievalContext(q)
+        docs = app3.generic_rerank(q, rctx.retrieve(q), rctx)
+        docs = app3.bundle_siblings(docs[:6], docs)
+        return app3.filter_relevant_context(q, docs, rctx)
+
+    return {
+        "app": plain.get_relevant_documents,
+        "app1": mmr.get_relevant_documents,
+        "app2": app2_ensemble.get_relevant_documents,
+        "app3": app3_main,
+        "app3_bundle": app3_bundle,
+    }
+
+
+def evaluate(name, retrieve, golden, ks, repeat, count_tokens):
+    recalls = {k: [] for k in ks}
+    ctx_recalls, rr, latencies, ctx_tokens = [], [], [], []
+    for item in golden:
+        relevant = set(item["supporting_chunks"])
+        for _ in range(repeat):
+            started = time.perf_counter()
+            docs = retrieve(item["question"])
+            latencies.append((time.perf_counter() - started) * 1000)
+        ranked = []
+        for d in docs:
+            cid = chunk_id(d)
+            if cid not in ranked:
+                ranked.append(cid)
+        for k in ks:
+            recalls[k].append(len(relevant & set(ranked[:k])) / len(relevant))
+        context = docs[:CONTEXT_DOCS]
+        ctx_recalls.append(len(relevant & {chunk_id(d) for d in context}) / len(relevant))
+        first = next((i for i, cid in enumerate(ranked, 1) if cid in relevant), None)
+        rr.append(1.0 / first if first else 0.0)
+        ctx_tokens.append(count_tokens("\n\n".join(d.page_content for d in context)))
+
+    latencies.sort()
+    return {
+        "strategy": name,
+        **{f"recall@{k}": round(statistics.mean(recalls[k]), 4) for k in ks},
+        "context_recall": round(statistics.mean(ctx_recalls), 4),
+        "mrr": round(statistics.mean(rr), 4),
+        "latency_ms_p50": round(latencies[len(latencies) // 2], 2),
+        "latency_ms_p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+        "context_tokens_mean": round(statistics.mean(ctx_tokens), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="검색 전략 품질/지연 비교")
+    parser.add_argument("--feedback", default=os.path.join(ROOT_DIR, "feedback_log.csv"))
+    parser.add_argument("--golden", default=os.path.join(RESULTS_DIR, "golden_set.json"))
+    parser.add_argument("--rebuild-golden", action="store_true")
+    parser.add_argument("--support-threshold", type=float, default=0.5)
+    parser.add_argument("--max-support", type=int, default=5)
+    parser.add_argument("--strategies", nargs="+", choices=STRATEGIES, default=list(STRATEGIES))
+    parser.add_argument("--k", nargs="+", type=int, default=[5, 10, 20])
+    parser.add_argument("--repeat", type=int, default=1, help="지연 측정 반복 횟수")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    # app3 모듈이 만드는 인덱스/검색기/재랭킹 함수를 그대로 사용 (같은 인덱스에서 비교)
+    os.chdir(ROOT_DIR)
+    import app3
+
+    all_docs = app3._all_docs_from_faiss(app3.init_vectorstore())
+    golden = load_or_build_golden(args, all_docs)
+    if not golden:
+        raise SystemExit("❌ 근거 청크가 있는 '좋아요' 답변이 없습니다. --support-threshold를 낮춰 보세요.")
+
+    strategies = build_strategies(app3)
+    count_tokens = count_tokens_fn()
+    rows = []
+    for name in args.strategies:
+        # 첫 호출 워밍업(임베딩 클라이언트/BM25 캐시) 후 측정
+        strategies[name](golden[0]["question"])
+        row = evaluate(name, strategies[name], golden, args.k, args.repeat, count_tokens)
+        rows.append(row)
+        print(f"✅ {name}: " + ", ".join(f"{k}={v}" for k, v in row.items() if k != "strategy"))
+
+    result = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "backend": os.getenv("LLM_BACKEND", "openai"),
+        "index_docs": len(all_docs),
+        "golden_questions": len(golden),
+        "results": rows,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"retrieval_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"💾 저장: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""rag_input_sample.json / rag_input_sample1.json을 10x/100x/1000x로 불린 합성 코퍼스 생성기
+
+실제 공지/법령 문서를 원본으로 삼아, 복제본마다
+  - 날짜(2025-07-01 / 2025.7.1 / 2025년 7월 1일 / 20250701 / ’25.7.1 형식 섞어서),
+  - % / 원 / 일 수치,
+  - 문단 순서
+를 바꾸고 복지용구 안내 문장 몇 개를 덧붙입니다. 정규식 기반 특징 추출(_doc_feats,
+assign_date_priority, infer_section_ids 등)이 실제와 비슷한 분포를 보도록 하기 위함입니다.
+출력은 원본과 같은 스키마(title, url, date, content, attachments[file_name, text])라
+init_vectorstore / add_new_data_from_json에 그대로 넣을 수 있습니다.
+
+사용 예:
+    python bench/synth_corpus.py --scale 100 --out bench/results/synth_x100.json
+"""
+import argparse
+import json
+import os
+import random
+import re
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SOURCES = [os.path.join(ROOT_DIR, "rag_input_sample.json"), os.path.join(ROOT_DIR, "rag_input_sample1.json")]
+
+ITEMS = ["수동휠체어", "전동침대", "욕창예방매트리스", "욕창예방방석", "성인용보행기", "안전손잡이",
+         "미끄럼방지매트", "이동변기", "목욕의자", "지팡이", "자세변환용구", "경사로", "배회감지기"]
+
+TEMPLATES = [
+    "{item} {mode} 시 본인부담률은 {pct}%이며, 기초생활수급자는 {pct2}%를 부담합니다.",
+    "복지용구 연 한도액은 {money}원이고, {item}의 급여가격은 {money2}원입니다.",
+    "{date}부터 {days}일 이내에 급여결정신청 서류를 제출해야 합니다.",
+    "{item} 대여 기간은 최대 {days}일이며, 내구연한 경과 후 재대여할 수 있습니다.",
+    "신청 절차: 접수 → 서류 심사 → 제품 심사 → 결과 통보({days}일 이내)",
+    "예비급여 시범사업 품목의 본인부담률은 {pct}%로 한시 적용됩니다.",
+]
+
+_DATE_RE = re.compile(r"(20\d{2})([.\-/년]\s*)(\d{1,2})([.\-/월]\s*)(\d{1,2})(일?)")
+_PCT_RE = re.compile(r"(\d{1,3})(\s*%)")
+_MONEY_RE = re.compile(r"(\d{1,3}(?:,\d{3})+)(\s*원)")
+_DAYS_RE = re.compile(r"(\d{1,3})(\s*일)(?!부)")
+
+
+def random_date(rng):
+    y, m, d = rng.randint(2019, 2025), rng.randint(1, 12), rng.randint(1, 28)
+    fmt = rng.randrange(5)
+    if fmt == 0:
+        return f"{y}-{m:02d}-{d:02d}"
+    if fmt == 1:
+        return f"{y}.{m}.{d}"
+    if fmt == 2:
+        return f"{y}년 {m}월 {d}일"
+    if fmt == 3:
+        return f"{y}{m:02d}{d:02d}"
+    return f"’{y % 100:02d}.{m}.{d}"
+
+
+def random_money(rng):
+    return f"{rng.randint(1, 2000) * 1000:,}"
+
+
+def mutate_text(text, rng):
+    """숫자/날짜만 바꾸고 문장 구조는 그대로 유지"""
+    text = _DATE_RE.sub(lambda m: random_date(rng), text)
+    text = _PCT_RE.sub(lambda m: f"{rng.choice([0, 6, 9, 15, 40, 60, 100])}{m.group(2)}", text)
+    text = _MONEY_RE.sub(lambda m: f"{random_money(rng)}{m.group(2)}", text)
+    text = _DAYS_RE.sub(lambda m: f"{rng.randint(1, 120)}{m.group(2)}", text)
+    paras = text.split("\n\n")
+    if len(paras) > 2:
+        cut = rng.randrange(1, len(paras))
+        paras = paras[cut:] + paras[:cut]
+    return "\n\n".join(paras)
+
+
+def template_sentences(rng, count):
+    out = []
+    for _ in range(count):
+        out.append(rng.choice(TEMPLATES).format(
+            item=rng.choice(ITEMS), mode=rng.choice(["대여", "구입"]),
+            pct=rng.choice([6, 9, 15]), pct2=rng.choice([0, 6]),
+            money=random_money(rng), money2=random_money(rng),
+            date=random_date(rng), days=rng.randint(7, 120)))
+    return "\n".join(out)
+
+
+def load_sources(paths=None):
+    items = []
+    for path in paths or DEFAULT_SOURCES:
+        with open(path, "r", encoding="utf-8") as f:
+            items.extend(json.load(f))
+    return items
+
+
+def generate_items(scale, seed=0, sources=None):
+    """원본 문서 × scale개 합성 문서를 하나씩 생성 (1000x도 메모리에 다 올리지 않음)"""
+    base = load_sources(sources)
+    for replica in range(scale):
+        for idx, item in enumerate(base):
+            rng = random.Random(f"{seed}:{replica}:{idx}")
+            if replica == 0:
+                yield dict(item, date=random_date(rng))
+                continue
+            yield {
+                "title": f"{item.get('title', '')} ({replica}차)",
+                "url": f"{item.get('url', '')}&replica={replica}",
+                "date": random_date(rng),
+                "content": mutate_text(item.get("content") or "", rng) + "\n\n" + template_sentences(rng, rng.randint(1, 3)),
+                "attachments": [
+                    {"file_name": f"{random_date(rng).replace(' ', '')}_{a.get('file_name', '')}",
+                     "text": mutate_text(a.get("text") or "", rng)}
+                    for a in (item.get("attachments") or [])
+                ],
+            }
+
+
+def item_to_document(item, source_file, infer_section_ids):
+    """init_vectorstore와 같은 본문/메타데이터 구성 (임베딩 없이)"""
+    content = f"제목: {item['title']}\n\nURL: {item['url']}\n\n"
+    doc_date = None
+    m = re.search(r"(20\d{2})[.\-/]?\s*(\d{1,2})[.\-/]?\s*(\d{1,2})", str(item.get("date") or ""))
+    if m:
+        y, mo, d = m.groups()
+        doc_date = f"{int(y):04d}-{int(mo):02d}-{int(d):02d}"
+        content += f"문서일자: {doc_date}\n\n"
+    content += f"내용: {item.get('content') or ''}\n\n"
+    section_ids = set(infer_section_ids(content)) | set(infer_section_ids(item.get("title", "")))
+    for a in item.get("attachments") or []:
+        content += f"첨부파일: {a['file_name']}\n\n파일내용: {a.get('text') or ''}\n\n"
+        section_ids.update(infer_section_ids(a.get("file_name", "")))
+    section_ids = list(section_ids)
+    return Document(page_content=content, metadata={
+        "source": item.get("title", ""),
+        "doc_date": doc_date,
+        "source_file": source_file,
+        "section_ids": section_ids,
+        "group_key": f"{source_file}:{','.join(sorted(section_ids))}",
+    })
+
+
+def generate_chunks(scale, infer_section_ids, seed=0, limit=None):
+    """합성 문서를 init_vectorstore와 같은 크기(1000/120)로 잘라 청크 리스트로"""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=120)
+    chunks = []
+    for item in generate_items(scale, seed):
+        chunks.extend(splitter.split_documents([item_to_document(item, "synthetic.json", infer_section_ids)]))
+        if limit and len(chunks) >= limit:
+            return chunks[:limit]
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="합성 코퍼스 생성")
+    parser.add_argument("--scale", type=int, default=10, help="원본 대비 배수 (10, 100, 1000 …)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    out = args.out or os.path.join(ROOT_DIR, "bench", "results", f"synth_x{args.scale}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    count = 0
+    # 1000x는 GB 단위라 배열을 한 줄씩 흘려 씀
+    with open(out, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for item in generate_items(args.scale, args.seed):
+            if count:
+                f.write(",\n")
+            f.write(json.dumps(item, ensure_ascii=False))
+            count += 1
+        f.write("\n]\n")
+    print(f"💾 합성 문서 {count}개 저장: {out}")
+
+
+if __name__ == "__main__":
+    main()
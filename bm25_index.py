@@ -0,0 +1,416 @@
+"""디스크에 저장되는 증분 BM25 인덱스 (app3.py)
+
+BM25Retriever.from_documents는 프로세스 시작 때마다, 그리고 admin add_data 때마다
+전체 코퍼스를 다시 토큰화해 인덱스를 만듭니다. 여기서는
+  - 청크별 단어 빈도(forward index)를 vectorstore/bm25.json.gz에 저장해 시작 시 토큰화 없이 로드,
+  - 새 청크는 postings에 추가, 삭제는 postings에서 빼며 df/문서 수/평균 길이를 그때그때 갱신,
+  - 전체 재구축은 compact()로만 (명시적인 정리 단계)
+합니다. 점수는 질의 단어의 postings만 훑어 계산하므로 코퍼스 전체를 돌지 않습니다.
+
+CSRBM25Retriever는 같은 인덱스의 단어 빈도를 SciPy CSR 행렬(단어 × 청크)로 스냅샷해 질의 단어
+행만 잘라 BM25 가중치를 계산합니다. 스냅샷 이후 추가/삭제된 청크는 작은 delta로 따로 들고 있다가
+delta가 커지거나 compact()하면 스냅샷을 다시 만들므로, 데이터 추가가 코퍼스 크기만큼 걸리지 않습니다.
+CSR 엔진을 쓰는 동안에는 dict postings를 버려(drop_postings) 코퍼스를 두 벌(doc_terms + CSR)만 듭니다.
+SciPy가 없으면 postings 검색으로 동작합니다.
+"""
+import gzip
+import heapq
+import json
+import math
+import os
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+from pydantic import Field
+
+try:
+    import scipy.sparse as sp
+except ImportError:  # SciPy 없으면 CSR 엔진 대신 postings 검색
+    sp = None
+
+CSR_AVAILABLE = sp is not None
+
+BM25_FILENAME = "bm25.json.gz"
+FORMAT_VERSION = 1
+DELTA_REBUILD_FRACTION = 0.1   # 스냅샷 이후 바뀐 청크가 이 비율을 넘으면 CSR 스냅샷을 다시 만듦
+
+
+def default_tokenize(text: str) -> List[str]:
+    """BM25Retriever 기본 전처리와 같은 공백 분리"""
+    return text.split()
+
+
+def tokenizer_name(tokenize) -> str:
+    """저장 파일에 기록하는 토크나이저 이름 (다르면 로드하지 않고 다시 만듦)"""
+    return getattr(tokenize, "name", None) or getattr(tokenize, "__name__", "custom")
+
+
+def get_tokenizer(compounds=None):
+    """BM25_TOKENIZER 환경변수(korean 기본 / whitespace)에 맞는 토크나이저"""
+    if os.getenv("BM25_TOKENIZER", "korean").strip().lower() == "whitespace":
+        return default_tokenize
+    from korean_tokenizer import DEFAULT_COMPOUNDS, KoreanTokenizer
+    return KoreanTokenizer(list(DEFAULT_COMPOUNDS) + list(compounds or []))
+
+
+class BM25Index:
+    """chunk_id 단위 BM25 (Okapi, k1/b는 rank_bm25 기본값과 같음)"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, tokenize: Callable[[str], List[str]] = default_tokenize,
+                 keep_postings: bool = True):
+        self.k1 = k1
+        self.b = b
+        self.tokenize = tokenize
+        self._lock = threading.Lock()
+        self.doc_terms: Dict[str, Dict[str, int]] = {}   # chunk_id -> {단어: 빈도}
+        self.doc_len: Dict[str, int] = {}
+        # 단어 -> {chunk_id: 빈도}. search()용이라 CSR 엔진만 쓰면 None (drop_postings)
+        self.postings: Optional[Dict[str, Dict[str, int]]] = {} if keep_postings else None
+        self.df: Dict[str, int] = {}                     # 단어 -> 문서 빈도
+        self.total_len = 0
+        self.generation = 0   # 내용이 바뀔 때마다 증가 (CSR 스냅샷 갱신 판단용)
+        self.epoch = 0        # compact()마다 증가 (CSR 스냅샷을 처음부터)
+        # 마지막 CSR 스냅샷 이후 추가/삭제된 chunk_id (CSRBM25가 비움, SciPy가 없으면 기록 안 함)
+        self.journal: Optional[List[str]] = [] if CSR_AVAILABLE else None
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.doc_len
+
+    # --- 증분 갱신 ---
+    def _add_terms(self, chunk_id, terms: Dict[str, int]):
+        if chunk_id in self.doc_len:
+            self._remove(chunk_id)
+        self.doc_terms[chunk_id] = terms
+        self.generation += 1
+        length = sum(terms.values())
+        self.doc_len[chunk_id] = length
+        self.total_len += length
+        if self.journal is not None:
+            self.journal.append(chunk_id)
+        for term, tf in terms.items():
+            self.df[term] = self.df.get(term, 0) + 1
+            if self.postings is not None:
+                self.postings.setdefault(term, {})[chunk_id] = tf
+
+    def _remove(self, chunk_id):
+        terms = self.doc_terms.pop(chunk_id, None)
+        if terms is None:
+            return False
+        self.generation += 1
+        self.total_len -= self.doc_len.pop(chunk_id)
+        if self.journal is not None:
+            self.journal.append(chunk_id)
+        for term in terms:
+            if self.df.get(term, 0) > 1:
+                self.df[term] -= 1
+            else:
+                self.df.pop(term, None)
+            plist = self.postings.get(term) if self.postings is not None else None
+            if plist is not None:
+                plist.pop(chunk_id, None)
+                if not plist:
+                    del self.postings[term]
+        return True
+
+    def add(self, chunk_id: str, text: str):
+        terms = dict(Counter(self.tokenize(text or "")))
+        with self._lock:
+            self._add_terms(chunk_id, terms)
+
+    def add_documents(self, docs, id_key: str = "chunk_id"):
+        """Document 목록 추가 (metadata[id_key]를 chunk_id로 사용)"""
+        prepared = [(d.metadata[id_key], dict(Counter(self.tokenize(d.page_content or "")))) for d in docs]
+        with self._lock:
+            for chunk_id, terms in prepared:
+                self._add_terms(chunk_id, terms)
+
+    def delete(self, chunk_ids) -> int:
+        with self._lock:
+            return sum(1 for cid in chunk_ids if self._remove(cid))
+
+    def compact(self, docs, id_key: str = "chunk_id"):
+        """전체 재구축: 현재 코퍼스 기준으로 처음부터 다시 (토크나이저 변경/정합성 복구용)"""
+        fresh = BM25Index(self.k1, self.b, self.tokenize, keep_postings=self.postings is not None)
+        fresh.add_documents(docs, id_key)
+        with self._lock:
+            self.doc_terms, self.doc_len = fresh.doc_terms, fresh.doc_len
+            self.postings, self.df, self.total_len = fresh.postings, fresh.df, fresh.total_len
+            self.journal = [] if CSR_AVAILABLE else None
+            self.generation += 1
+            self.epoch += 1
+
+    def drop_postings(self):
+        """dict postings를 버림 (CSR 엔진이 doc_terms에서 스냅샷을 만들므로 search()는 못 씀)"""
+        with self._lock:
+            self.postings = None
+
+    # --- 검색 ---
+    def idf(self, df: int, n: int) -> float:
+        return math.log((n - df + 0.5) / (df + 0.5) + 1.0)
+
+    def search(self, query: str, k: int = 4):
+        """[(chunk_id, 점수), ...] 점수 내림차순 상위 k개"""
+        q_terms = Counter(self.tokenize(query or ""))
+        with self._lock:
+            if self.postings is None:
+                raise RuntimeError("postings를 버린 인덱스입니다 (CSRBM25로 검색)")
+            n = len(self.doc_len)
+            if not n:
+                return []
+            avgdl = self.total_len / n
+            scores: Dict[str, float] = {}
+            for term, qtf in q_terms.items():
+                plist = self.postings.get(term)
+                if not plist:
+                    continue
+                idf = self.idf(len(plist), n) * qtf
+                for cid, tf in plist.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[cid] / avgdl)
+                    scores[cid] = scores.get(cid, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return heapq.nlargest(k, scores.items(), key=lambda x: x[1])
+
+    # --- 저장/로드 ---
+    def save(self, directory: str):
+        path = os.path.join(directory, BM25_FILENAME)
+        with self._lock:
+            payload = {"version": FORMAT_VERSION, "tokenizer": tokenizer_name(self.tokenize),
+                       "k1": self.k1, "b": self.b, "doc_terms": self.doc_terms}
+            # 워커(프로세스)마다 다른 임시 파일, 같은 프로세스 안에서는 잠금으로 교체까지 한 번에
+            tmp = f"{path}.tmp.{os.getpid()}"
+            try:
+                with gzip.open(tmp, "wt", encoding="utf-8") as f:
+                    json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+                os.replace(tmp, path)  # 다른 워커가 반쯤 쓴 파일을 읽지 않도록
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+    @classmethod
+    def load(cls, directory: str, tokenize: Callable[[str], List[str]] = default_tokenize,
+             keep_postings: bool = True):
+        """저장된 인덱스 로드. 파일이 없거나 형식/토크나이저가 다르면 None"""
+        path = os.path.join(directory, BM25_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("version") != FORMAT_VERSION:
+            return None
+        if payload.get("tokenizer", "default_tokenize") != tokenizer_name(tokenize):
+            return None
+        index = cls(payload["k1"], payload["b"], tokenize, keep_postings=keep_postings)
+        for chunk_id, terms in payload["doc_terms"].items():
+            index._add_terms(chunk_id, terms)
+        if index.journal is not None:
+            index.journal = []   # 로드한 청크는 첫 CSR 스냅샷에 들어감
+        return index
+
+
+class BM25IndexRetriever(BaseRetriever):
+    """EnsembleRetriever에 BM25Retriever 대신 끼우는 리트리버 (chunk_id → Document 조회)"""
+
+    index: Any
+    docs: Any            # chunk_id -> Document (app3의 chunk_index.by_id)
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None):
+        return [self.docs[cid] for cid, _ in self.index.search(query, self.k) if cid in self.docs]
+
+
+class CSRBM25:
+    """BM25Index의 읽기 전용 스냅샷: 단어 × 청크 CSR 빈도 행렬 + 스냅샷 이후 바뀐 청크(delta)
+
+    weight[t, d] = idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+    가중치는 질의 단어 행에 대해서만 질의 때 계산하므로, 청크 추가/삭제로 문서 수·평균 길이·df가
+    바뀌어도 행렬을 다시 만들 필요가 없습니다. 스냅샷 이후 삭제/교체된 청크는 alive 마스크로 빼고,
+    새 청크는 delta postings(바뀐 청크만)로 점수를 더합니다. 점수는 BM25Index.search와 같습니다.
+    """
+
+    def __init__(self, index: BM25Index):
+        with index._lock:
+            self.epoch = index.epoch
+            self.tokenize = index.tokenize
+            self.k1, self.b = index.k1, index.b
+            self.ids = list(index.doc_terms)
+            self.vocab: Dict[str, int] = {}
+            rows, cols, tfs = [], [], []
+            for col, cid in enumerate(self.ids):
+                for term, tf in index.doc_terms[cid].items():
+                    rows.append(self.vocab.setdefault(term, len(self.vocab)))
+                    cols.append(col)
+                    tfs.append(tf)
+            n = len(self.ids)
+            self.dl = np.fromiter((index.doc_len[cid] for cid in self.ids), dtype=np.float64, count=n)
+            index.journal = []
+            self._take_stats(index)
+        self.tf = sp.csr_matrix((np.asarray(tfs, dtype=np.float64), (rows, cols)), shape=(len(self.vocab), n))
+        self.alive = np.ones(n, dtype=bool)
+        self.delta: Dict[str, Dict[str, int]] = {}    # 단어 -> {chunk_id: 빈도} (스냅샷 이후 추가된 청크)
+        self.delta_terms: Dict[str, Dict[str, int]] = {}
+        # chunk_id 해시 정렬 배열 → 열 (청크당 16바이트, 스냅샷 이후 변경이 처음 생길 때 만듦)
+        self._hashes: Optional[np.ndarray] = None
+        self._hash_cols: Optional[np.ndarray] = None
+
+    def _take_stats(self, index):
+        self.generation = index.generation
+        self.n, self.total_len = len(index.doc_len), index.total_len
+        self.df = dict(index.df)
+
+    @property
+    def changed(self) -> int:
+        """스냅샷 이후 바뀐 청크 수 (삭제된 스냅샷 열 + delta 청크)"""
+        return int(len(self.alive) - self.alive.sum()) + len(self.delta_terms)
+
+    def synced(self, index: BM25Index) -> "CSRBM25":
+        """index.journal의 변경만 반영한 새 엔진 (행렬은 공유, 기존 엔진은 그대로 둬 동시 질의에 안전)"""
+        engine = object.__new__(CSRBM25)
+        engine.__dict__.update(self.__dict__)
+        engine.alive = self.alive.copy()
+        engine.delta = {t: dict(p) for t, p in self.delta.items()}
+        engine.delta_terms = dict(self.delta_terms)
+        with index._lock:
+            changes, index.journal = index.journal, []
+            current = {cid: index.doc_terms.get(cid) for cid in dict.fromkeys(changes)}
+            engine._take_stats(index)
+        for cid, terms in current.items():
+            col = engine._col(cid)
+            if col is not None:
+                engine.alive[col] = False
+            for term in engine.delta_terms.pop(cid, {}):
+                plist = engine.delta.get(term)
+                if plist is not None:
+                    plist.pop(cid, None)
+                    if not plist:
+                        del engine.delta[term]
+            if terms is not None:
+                engine.delta_terms[cid] = terms
+                for term, tf in terms.items():
+                    engine.delta.setdefault(term, {})[cid] = tf
+        return engine
+
+    def _col(self, cid: str) -> Optional[int]:
+        """스냅샷에서 cid의 열 번호 (없으면 None)"""
+        if not self.ids:
+            return None
+        if self._hashes is None:
+            hashes = np.fromiter((hash(c) for c in self.ids), dtype=np.int64, count=len(self.ids))
+            self._hash_cols = np.argsort(hashes, kind="stable")
+            self._hashes = hashes[self._hash_cols]
+        h = hash(cid)
+        i = int(np.searchsorted(self._hashes, h))
+        while i < len(self._hashes) and self._hashes[i] == h:
+            col = int(self._hash_cols[i])
+            if self.ids[col] == cid:
+                return col
+            i += 1
+        return None
+
+    def _weights(self, tf, dl, idf):
+        avgdl = self.total_len / self.n
+        return idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * dl / avgdl))
+
+    def search(self, query: str, k: int = 4):
+        counts = Counter(t for t in self.tokenize(query or "") if self.df.get(t))
+        if not counts or not self.n:
+            return []
+        idf = {t: math.log((self.n - self.df[t] + 0.5) / (self.df[t] + 0.5) + 1.0) * qtf for t, qtf in counts.items()}
+        hits = []
+        terms = [t for t in counts if t in self.vocab]
+        if terms:
+            rows = np.fromiter((self.vocab[t] for t in terms), dtype=np.int64, count=len(terms))
+            sub = self.tf[rows]   # 질의 단어 행만, 일치한 청크만 값이 있음
+            row_idf = np.fromiter((idf[t] for t in terms), dtype=np.float64, count=len(terms))
+            entry_idf = np.repeat(row_idf, np.diff(sub.indptr))
+            data = self._weights(sub.data, self.dl[sub.indices], entry_idf)
+            summed = sp.csr_matrix((data, sub.indices, [0, len(data)]), shape=(1, len(self.ids)))
+            summed.sum_duplicates()   # 청크별 합 (단어 여러 개가 같은 청크에 걸린 경우)
+            cand, scores = summed.indices, summed.data
+            keep = self.alive[cand]
+            cand, scores = cand[keep], scores[keep]
+            if len(scores) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                cand, scores = cand[top], scores[top]
+            hits = [(int(c), self.ids[c], float(sc)) for c, sc in zip(cand, scores)]
+        if self.delta:
+            extra: Dict[str, float] = {}
+            for term, weight in idf.items():
+                for cid, tf in self.delta.get(term, {}).items():
+                    dl = sum(self.delta_terms[cid].values())
+                    extra[cid] = extra.get(cid, 0.0) + float(self._weights(tf, dl, weight))
+            # 동점 순서: 스냅샷 청크 먼저(저장 순서), delta는 그 뒤
+            hits.extend((len(self.ids) + i, cid, sc) for i, (cid, sc) in enumerate(extra.items()))
+        hits.sort(key=lambda h: (-h[2], h[0]))
+        return [(cid, score) for _, cid, score in hits[:k]]
+
+
+class CSRBM25Retriever(BaseRetriever):
+    """BM25Retriever 자리에 그대로 끼우는 CSR 행렬 BM25 리트리버
+
+    index가 바뀌면(add/delete) 다음 질의 때 바뀐 청크만 delta로 반영하고, compact() 뒤나 delta가
+    DELTA_REBUILD_FRACTION을 넘으면 CSR 스냅샷을 다시 만듭니다. 갱신은 한 스레드만 하고, 그동안 다른
+    질의는 이전 엔진으로 답합니다 (refresh()로 미리 해 둘 수도 있음). SciPy가 있으면 index의 dict
+    postings는 버립니다(search는 이 엔진으로만).
+    app2.py처럼 chunk_id가 없는 문서 목록은 from_documents로 만들면 됩니다.
+    """
+
+    index: Any
+    docs: Any            # chunk_id -> Document
+    k: int = 4
+    engine: Any = None
+    engine_lock: Any = Field(default_factory=threading.Lock, exclude=True)
+
+    @classmethod
+    def from_documents(cls, documents, k: int = 4, tokenize: Callable[[str], List[str]] = default_tokenize):
+        retriever = cls(index=BM25Index(tokenize=tokenize), docs={}, k=k)
+        retriever.add_documents(documents)
+        return retriever
+
+    def add_documents(self, documents):
+        """chunk_id가 없으면 저장 순번을 id로 사용"""
+        keyed = []
+        for d in documents:
+            cid = (d.metadata or {}).get("chunk_id") or f"#{len(self.docs)}"
+            self.docs[cid] = d
+            keyed.append((cid, d.page_content))
+        for cid, text in keyed:
+            self.index.add(cid, text)
+
+    def _engine(self):
+        engine = self.engine
+        if engine is not None and engine.generation == self.index.generation:
+            return engine
+        # 이전 스냅샷이 있으면 재생성 중인 스레드를 기다리지 않음 (O(코퍼스) 재생성을 요청마다 반복하지 않게)
+        if not self.engine_lock.acquire(blocking=engine is None):
+            return engine
+        try:
+            engine = self.engine
+            if engine is None or engine.epoch != self.index.epoch:
+                engine = self.engine = CSRBM25(self.index)
+                self.index.drop_postings()
+            elif engine.generation != self.index.generation:
+                engine = engine.synced(self.index)
+                if engine.changed > DELTA_REBUILD_FRACTION * max(len(engine.ids), 1):
+                    engine = CSRBM25(self.index)
+                self.engine = engine
+            return engine
+        finally:
+            self.engine_lock.release()
+
+    def refresh(self):
+        """인덱스가 바뀐 직후 CSR 스냅샷을 미리 만들어 첫 질의가 기다리지 않게 함"""
+        if sp is not None:
+            self._engine()
+
+    def search_with_scores(self, query: str):
+        """[(Document, BM25 점수)] 점수 내림차순 (HybridRetriever가 씀)"""
+        hits = self._engine().search(query, self.k) if sp is not None else self.index.search(query, self.k)
+        return [(self.docs[cid], score) for cid, score in hits if cid in self.docs]
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None):
+        return [d for d, _ in self.search_with_scores(query)]
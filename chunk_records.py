@@ -0,0 +1,216 @@
+"""서빙 프로세스용 압축 청크 metadata (ColumnarDocstore)
+
+청크 metadata를 청크마다 dict로 들고 있으면 source/source_file/group_key 같은 반복 문자열,
+section_ids 리스트, 날짜 문자열, 이전/다음 청크 uuid가 청크 수만큼 힙에 쌓입니다. 여기서는
+  - 반복 문자열은 StringTable에 한 번만 두고 int32 id로,
+  - section_ids는 섹션 비트마스크(uint64), doc_date(YYYY-MM-DD)는 정수 YYYYMMDD로,
+  - 이전/다음 청크는 uuid 대신 행 번호(int32)로,
+  - 그 밖의 드문 키(url 등)만 행별 dict(extras)로
+NumPy 구조화 배열 한 줄(RECORD_DTYPE, 청크당 수십 바이트)에 담고, metadata(row)가 호출될 때만
+원래 모양의 dict를 새로 만듭니다.
+청크 id(uuid 문자열)와 id → 행 dict는 그대로 Python 객체라, 청크당 힙 사용량은 레코드보다
+이쪽이 더 큽니다(memory_usage, bench/micro_bench.py --memory).
+"""
+import re
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# metadata 키별 존재 비트 (없던 키를 만들어 내지 않도록)
+KEY_BITS = {
+    "source": 1 << 0,
+    "source_file": 1 << 1,
+    "group_key": 1 << 2,
+    "section_ids": 1 << 3,
+    "doc_date": 1 << 4,
+    "feat_flags": 1 << 5,
+    "date_score": 1 << 6,
+    "chunk_id": 1 << 7,
+    "prev_chunk_id": 1 << 8,
+    "next_chunk_id": 1 << 9,
+}
+STRING_KEYS = ("source", "source_file", "group_key")
+INT_KEYS = ("feat_flags", "date_score")
+LINK_KEYS = ("prev_chunk_id", "next_chunk_id")
+
+RECORD_DTYPE = np.dtype([
+    ("keys", np.uint16),
+    ("source", np.int32), ("source_file", np.int32), ("group_key", np.int32),   # StringTable id, -1 = None
+    ("sections", np.uint64),
+    ("doc_date", np.int32),                                                   # YYYYMMDD, -1 = None
+    ("feat_flags", np.int64), ("date_score", np.int64),
+    ("prev_chunk_id", np.int32), ("next_chunk_id", np.int32),                 # 행 번호, -1 = None
+])
+
+_DATE_RE = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+class StringTable:
+    """문자열 ↔ 작은 정수 id (같은 문자열은 한 번만 저장)"""
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+    def id(self, s: Optional[str]) -> int:
+        if s is None:
+            return -1
+        i = self._ids.get(s)
+        if i is None:
+            i = self._ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def get(self, i: int) -> Optional[str]:
+        return None if i < 0 else self.strings[i]
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+
+def _container_size(items: list) -> int:
+    return sys.getsizeof(items) + sum(sys.getsizeof(x) for x in items)
+
+
+def _encode_date(value) -> Optional[int]:
+    if value is None:
+        return -1
+    m = _DATE_RE.match(value) if isinstance(value, str) else None
+    return int(m.group(1) + m.group(2) + m.group(3)) if m else None
+
+
+class ChunkRecords:
+    """청크 id 목록 + 행별 압축 metadata. append로 채운 뒤 finish()로 배열 고정"""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.row: Dict[str, int] = {}
+        self.strings = StringTable()
+        self.sections = StringTable()   # 섹션 이름 → 비트 번호 (64개까지)
+        self.extras: Dict[int, dict] = {}   # 행 -> 압축하지 못한 키
+        self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        self._pending: List[tuple] = []   # finish 전까지 인코딩된 행
+        self._links: List[tuple] = []   # (행, 키, 청크 id) — 모든 id를 읽은 뒤 행 번호로
+
+    def append(self, doc_id: str, metadata: dict):
+        self.row[doc_id] = len(self.ids)
+        self.ids.append(doc_id)
+        self._pending.append(self._encode(len(self.ids) - 1, metadata or {}))
+
+    def finish(self):
+        """인코딩해 둔 행을 구조화 배열로 옮기고 이전/다음 청크 id를 행 번호로 바꿈"""
+        records = np.array(self._pending, dtype=RECORD_DTYPE)
+        self._pending = []
+        self.records = np.concatenate([self.records, records]) if len(self.records) else records
+        self._resolve_links()
+        return self
+
+    def _resolve_links(self):
+        links, self._links = self._links, []
+        for row, key, target in links:
+            target_row = self.row.get(target)
+            if target_row is None:
+                # 이 저장본에 없는 청크를 가리킴 → 문자열 그대로 보존
+                self.records["keys"][row] = int(self.records["keys"][row]) & ~KEY_BITS[key] & 0xFFFF
+                self.extras.setdefault(row, {})[key] = target
+            else:
+                self.records[key][row] = target_row
+
+    def _encode(self, row: int, metadata: dict):
+        keys, extra = 0, {}
+        values = {"source": -1, "source_file": -1, "group_key": -1, "sections": 0, "doc_date": -1,
+                  "feat_flags": 0, "date_score": 0, "prev_chunk_id": -1, "next_chunk_id": -1}
+        for key, value in metadata.items():
+            bit = KEY_BITS.get(key)
+            if bit is None:
+                extra[key] = value
+            elif key in STRING_KEYS and (value is None or isinstance(value, str)):
+                values[key] = self.strings.id(value)
+                keys |= bit
+            elif key == "section_ids" and self._fits_sections(value):
+                values["sections"] = sum(1 << self.sections.id(s) for s in value)
+                keys |= bit
+            elif key == "doc_date" and _encode_date(value) is not None:
+                values["doc_date"] = _encode_date(value)
+                keys |= bit
+            elif key in INT_KEYS and isinstance(value, int) and _INT64_MIN <= value <= _INT64_MAX:
+                values[key] = value
+                keys |= bit
+            elif key == "chunk_id" and value == self.ids[row]:
+                keys |= bit
+            elif key in LINK_KEYS and (value is None or isinstance(value, str)):
+                if value is not None:
+                    self._links.append((row, key, value))
+                keys |= bit
+            else:
+                extra[key] = value
+        if extra:
+            self.extras[row] = extra
+        values["keys"] = keys
+        return tuple(values[name] for name in RECORD_DTYPE.names)
+
+    def _fits_sections(self, value) -> bool:
+        if not isinstance(value, list) or not all(isinstance(s, str) for s in value):
+            return False
+        new = {s for s in value if s not in self.sections._ids}
+        return len(self.sections) + len(new) <= 64
+
+    def metadata(self, row: int) -> dict:
+        """행 → 원래 모양의 metadata dict (매번 새로 만듦)"""
+        rec = self.records[row]
+        keys = int(rec["keys"])
+        m = {}
+        for key in STRING_KEYS:
+            if keys & KEY_BITS[key]:
+                m[key] = self.strings.get(int(rec[key]))
+        if keys & KEY_BITS["section_ids"]:
+            mask = int(rec["sections"])
+            m["section_ids"] = [s for bit, s in enumerate(self.sections.strings) if mask >> bit & 1]
+        if keys & KEY_BITS["doc_date"]:
+            d = int(rec["doc_date"])
+            m["doc_date"] = None if d < 0 else f"{d // 10000:04d}-{d // 100 % 100:02d}-{d % 100:02d}"
+        for key in INT_KEYS:
+            if keys & KEY_BITS[key]:
+                m[key] = int(rec[key])
+        if keys & KEY_BITS["chunk_id"]:
+            m["chunk_id"] = self.ids[row]
+        for key in LINK_KEYS:
+            if keys & KEY_BITS[key]:
+                target = int(rec[key])
+                m[key] = None if target < 0 else self.ids[target]
+        if row in self.extras:
+            m.update(self.extras[row])
+        return m
+
+    def has(self, row: int, key: str) -> bool:
+        return bool(int(self.records[row]["keys"]) & KEY_BITS[key]) or key in self.extras.get(row, ())
+
+    def update(self, row: int, metadata: dict):
+        """행의 metadata를 통째로 다시 기록 (특징 보충, 이전 인덱스 chunk_id 연결 등)"""
+        self.extras.pop(row, None)
+        self.records[row] = self._encode(row, metadata)
+        self._resolve_links()
+
+    def memory_usage(self) -> Dict[str, int]:
+        """항목별 힙 사용량 근사(바이트, sys.getsizeof 기준)
+
+        청크 id 문자열은 index_to_docstore_id / ChunkIndex.by_group과 같은 객체라 여기서 한 번만 셉니다
+        (그 dict/list 자체의 크기는 제외).
+        """
+        return {
+            "records": self.records.nbytes,
+            "strings": _container_size(self.strings.strings) + sys.getsizeof(self.strings._ids),
+            "ids": _container_size(self.ids),
+            # 257 이상 int는 행마다 객체 (작은 정수는 CPython이 공유)
+            "row": sys.getsizeof(self.row) + sum(sys.getsizeof(r) for r in self.row.values() if r > 256),
+            "extras": sys.getsizeof(self.extras) + sum(sys.getsizeof(e) for e in self.extras.values()),
+        }
+
+    def nbytes(self) -> int:
+        """힙 사용량 근사 합계 (압축 레코드 + 문자열 테이블 + 청크 id + id → 행 dict + extras)"""
+        return sum(self.memory_usage().values())
+
+    def __len__(self) -> int:
+        return len(self.ids)
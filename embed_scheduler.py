@@ -0,0 +1,176 @@
+"""인덱스 구축용 청크 임베딩 스케줄러 (app3.py)
+
+init_vectorstore는 JSON 5건씩 차례로 임베딩했고, 한 배치가 max_tokens_per_request를 넘으면
+전체를 chunk_size=100으로 다시 잘라 청크 수와 인덱스 크기가 폭증했습니다. 여기서는
+  - 청크를 실제 토큰 수(tiktoken, 없으면 추정)로 재서 요청당 토큰/입력 수 상한에 맞게 묶고,
+  - 여러 요청을 스레드풀에서 동시에 보내되 분당 요청 수(RPM)/토큰 수(TPM) 안에서만,
+  - 429/5xx/타임아웃은 Retry-After 또는 지수 백오프로 같은 묶음을 다시 보냅니다(청크는 그대로).
+입력 하나가 모델 한도를 넘으면 잘라 내지 않고 오류로 알립니다.
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional
+
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+MAX_INPUT_TOKENS = 8191   # OpenAI 임베딩 입력 하나의 한도
+
+
+def make_token_counter(model: Optional[str] = None) -> Callable[[str], int]:
+    """tiktoken이 있으면 모델 토크나이저, 없으면(또는 인코딩 파일을 못 받으면) 대략치"""
+    try:
+        import tiktoken
+        try:
+            enc = tiktoken.encoding_for_model(model or "text-embedding-ada-002")
+        except KeyError:
+            enc = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(enc.encode(text or "", disallowed_special=()))
+    except Exception:
+        from offline_llm import estimate_tokens
+        return estimate_tokens
+
+
+class RateLimiter:
+    """최근 60초 동안의 요청 수/토큰 수가 RPM/TPM을 넘지 않도록 대기"""
+
+    def __init__(self, rpm: int, tpm: int, window: float = 60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self._lock = threading.Lock()
+        self._events = deque()   # (시각, 토큰 수)
+        self._tokens = 0
+
+    def acquire(self, tokens: int):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._events and now - self._events[0][0] >= self.window:
+                    self._tokens -= self._events.popleft()[1]
+                fits = len(self._events) < self.rpm and self._tokens + tokens <= self.tpm
+                if fits or not self._events:   # 혼자서 TPM을 넘는 요청도 창이 비면 보냄
+                    self._events.append((now, tokens))
+                    self._tokens += tokens
+                    return
+                wait = self.window - (now - self._events[0][0])
+            time.sleep(max(0.05, wait))
+
+
+def _retry_after(exc) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        value = headers.get("retry-after")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc) -> bool:
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    if status in RETRYABLE_STATUS:
+        return True
+    try:
+        import openai
+        return isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError))
+    except ImportError:
+        return False
+
+
+class EmbeddingScheduler:
+    """texts → 벡터. 토큰 기준 묶음 + 동시 요청 + RPM/TPM 제한 + 429 재시도"""
+
+    def __init__(self, embed_batch: Callable[[List[str]], List[List[float]]],
+                 count_tokens: Optional[Callable[[str], int]] = None, model: Optional[str] = None,
+                 max_tokens_per_request: int = 100_000, max_inputs_per_request: int = 1000,
+                 concurrency: int = 4, rpm: int = 3000, tpm: int = 1_000_000,
+                 max_retries: int = 6, backoff_base: float = 1.0, backoff_max: float = 60.0):
+        self.embed_batch = embed_batch
+        self.count_tokens = count_tokens   # 없으면 첫 사용 때 model로 만듦 (tiktoken 로드 지연)
+        self.model = model
+        self.max_tokens_per_request = max_tokens_per_request
+        self.max_inputs_per_request = max_inputs_per_request
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rpm, tpm)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.tokens = 0
+
+    def pack(self, texts: List[str]):
+        """[(입력 인덱스 목록, 토큰 합)] — 입력 순서대로 요청 한도까지 채움"""
+        if self.count_tokens is None:
+            self.count_tokens = make_token_counter(self.model)
+        batches, current, current_tokens = [], [], 0
+        for i, text in enumerate(texts):
+            n = self.count_tokens(text)
+            if n > MAX_INPUT_TOKENS:
+                raise ValueError(f"청크 {i}가 임베딩 입력 한도를 넘습니다 ({n} > {MAX_INPUT_TOKENS} 토큰). 청크 크기를 확인하세요.")
+            if current and (current_tokens + n > self.max_tokens_per_request
+                            or len(current) >= self.max_inputs_per_request):
+                batches.append((current, current_tokens))
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += n
+        if current:
+            batches.append((current, current_tokens))
+        return batches
+
+    def _send(self, texts: List[str], tokens: int):
+        attempt = 0
+        while True:
+            self.limiter.acquire(tokens)
+            try:
+                vectors = self.embed_batch(texts)
+                with self._lock:
+                    self.requests += 1
+                    self.tokens += tokens
+                return vectors
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * (0.5 + random.random())
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                print(f"⏳ 임베딩 요청 재시도 {attempt}/{self.max_retries} ({delay:.1f}초 후): {e}")
+                time.sleep(delay)
+
+    def embed(self, texts: List[str], on_batch: Optional[Callable[[List[int], List[List[float]]], None]] = None):
+        """입력 순서대로 벡터 목록. on_batch(인덱스 목록, 벡터 목록)는 요청이 끝날 때마다 호출"""
+        batches = self.pack(texts)
+        if not batches:
+            return []
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        started = time.perf_counter()
+        workers = max(1, min(self.concurrency, len(batches)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as pool:
+            futures = {pool.submit(self._send, [texts[i] for i in idx], tokens): idx for idx, tokens in batches}
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    idx = futures[future]
+                    vectors = future.result()
+                    for i, v in zip(idx, vectors):
+                        results[i] = v
+                    if on_batch is not None:
+                        on_batch(idx, vectors)
+                    if len(batches) > 1:
+                        print(f"🧮 임베딩 {done}/{len(batches)} 요청 완료 ({len(idx)}개 청크)")
+            except Exception:
+                for f in futures:
+                    f.cancel()
+                raise
+        print(f"🧮 임베딩 완료: 청크 {len(texts)}개, 요청 {len(batches)}건(동시 {workers}), "
+              f"{time.perf_counter() - started:.1f}초")
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'retries': self.retries, 'tokens': self.tokens}
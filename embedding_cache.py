@@ -0,0 +1,360 @@
+"""질의 임베딩 LRU 캐시 (app3.py)
+
+FAISS 검색(get_relevant_documents)과 시맨틱 답변 캐시가 같은 질문을 각각 임베딩하고,
+사용자가 바뀌어도 같은 질문을 다시 OpenAI로 보내던 부분을 줄입니다.
+벡터스토어에 넘기는 embeddings 객체를 감싸서
+  - 메모리 LRU: 바이트 상한(QUERY_EMBED_CACHE_MB)과 개수 상한 중 먼저 닿는 쪽에서 오래된 것부터 제거,
+  - 같은 질문이 동시에 들어오면 한 번만 API 호출(나머지는 결과를 기다림),
+  - (선택) SQLite 영구 저장: 워커 간 공유/재시작 후 유지, 메모리에 없을 때 조회
+합니다.
+
+문서(청크) 임베딩은 ChunkEmbeddingStore를 붙이면 hash(모델, 청크 본문)로 찾아
+벡터스토어를 재구축해도 새로 생기거나 바뀐 청크만 API로 보냅니다.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+ENTRY_OVERHEAD_BYTES = 200   # 키 문자열/OrderedDict 노드 등 벡터 외 대략적인 비용
+SQLITE_BATCH = 500           # IN (...) 한 번에 넣는 키 수 (SQLite 변수 개수 제한)
+
+
+def normalize_query(text: str) -> str:
+    """캐시 키: 호환 문자 통일 + 앞뒤/연속 공백 정리 (임베딩 입력과 같은 의미의 문자열만 같은 키)"""
+    return " ".join(unicodedata.normalize("NFKC", text or "").split())
+
+
+class ChunkEmbeddingStore:
+    """내용 주소 청크 임베딩 저장소: sha256(모델, 청크 본문) -> 벡터 (SQLite)
+
+    벡터스토어 디렉토리 밖에 두어 admin_rebuild_vectorstore의 rmtree에도 남습니다.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""CREATE TABLE IF NOT EXISTS chunk_embeddings (
+            key TEXT PRIMARY KEY,
+            vec BLOB NOT NULL,
+            created REAL)""")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        # gunicorn --preload: 마스터에서 연 연결은 fork 이후 쓰지 않고 워커에서 새로 엶
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def key(namespace: str, text: str) -> str:
+        return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        keys = list(keys)
+        found = {}
+        conn = self._conn()
+        for i in range(0, len(keys), SQLITE_BATCH):
+            part = keys[i:i + SQLITE_BATCH]
+            rows = conn.execute(
+                f"SELECT key, vec FROM chunk_embeddings WHERE key IN ({','.join('?' * len(part))})", part)
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items):
+        """items: [(key, 벡터)]"""
+        now = time.time()
+        conn = self._conn()
+        conn.executemany("INSERT OR REPLACE INTO chunk_embeddings (key, vec, created) VALUES (?, ?, ?)",
+                         [(k, np.asarray(v, dtype=np.float32).tobytes(), now) for k, v in items])
+        conn.commit()
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM chunk_embeddings").fetchone()[0]
+
+
+class BuildEmbeddingStats:
+    """인덱스 구축 한 번 동안의 청크 임베딩 캐시 적중/절감량"""
+
+    def __init__(self, cost_per_1m_tokens: float):
+        self.cost_per_1m_tokens = cost_per_1m_tokens
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self.tokens_embedded = 0
+
+    def report(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'chunks': total,
+            'cache_hits': self.hits,
+            'embedded': self.misses,
+            'hit_rate': round(self.hits / total * 100, 1) if total else 0.0,
+            'tokens_saved': self.tokens_saved,
+            'tokens_embedded': self.tokens_embedded,
+            'cost_saved_usd': round(self.tokens_saved / 1_000_000 * self.cost_per_1m_tokens, 4),
+        }
+
+    def summary(self) -> str:
+        r = self.report()
+        return (f"청크 {r['chunks']}개 중 캐시 {r['cache_hits']}개({r['hit_rate']}%), 새로 임베딩 {r['embedded']}개 / "
+                f"절감 약 {r['tokens_saved']:,} 토큰 (${r['cost_saved_usd']})")
+
+
+def _count_tokens(text: str) -> int:
+    from offline_llm import estimate_tokens
+    return estimate_tokens(text)
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """embed_query 결과를 캐시하는 Embeddings 래퍼 (FAISS에 그대로 넘김)"""
+
+    def __init__(self, base: Embeddings, max_bytes: int = 64 * 1024 * 1024, max_entries: int = 50000,
+                 path: Optional[str] = None, max_disk_entries: int = 200000,
+                 chunk_store: Optional[ChunkEmbeddingStore] = None, cost_per_1m_tokens: float = 0.10,
+                 scheduler: Any = None):
+        self.base = base
+        self.chunk_store = chunk_store
+        self.scheduler = scheduler   # EmbeddingScheduler: 문서 임베딩을 토큰 기준 묶음 + 동시 요청으로
+        self.cost_per_1m_tokens = cost_per_1m_tokens
+        self._builds: List[BuildEmbeddingStats] = []
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        # 모델이 바뀌면 다른 벡터 → 저장 키에 모델 이름을 넣음
+        self.namespace = f"{type(base).__name__}:{getattr(base, 'model', '')}"
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._local = threading.local()
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._disk_writes = 0
+        if path:
+            conn = self._conn()
+            conn.execute("""CREATE TABLE IF NOT EXISTS query_embeddings (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                vec BLOB NOT NULL,
+                created REAL,
+                PRIMARY KEY (namespace, key))""")
+            conn.commit()
+
+    # --- Embeddings 인터페이스 ---
+    def embed_query(self, text: str) -> List[float]:
+        return self.get(text).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """청크 저장소가 있으면 저장된 벡터를 쓰고, 없는(새/변경) 청크만 API로"""
+        if self.chunk_store is None:
+            return self._embed_texts(texts)
+        keys = [ChunkEmbeddingStore.key(self.namespace, t) for t in texts]
+        try:
+            found = self.chunk_store.get_many(set(keys))
+        except sqlite3.Error as e:
+            print(f"청크 임베딩 캐시 조회 오류: {e}")
+            found = {}
+        pending = {}   # 키 -> 본문 (같은 본문이 여러 번 나오면 한 번만)
+        for k, t in zip(keys, texts):
+            if k not in found:
+                pending.setdefault(k, t)
+        if pending:
+            pending_keys = list(pending)
+
+            def store(idx, vectors):
+                # 요청이 끝날 때마다 저장 → 구축이 중간에 실패해도 받은 벡터는 남음
+                try:
+                    self.chunk_store.put_many([(pending_keys[i], v) for i, v in zip(idx, vectors)])
+                except sqlite3.Error as e:
+                    print(f"청크 임베딩 캐시 저장 오류: {e}")
+
+            vectors = self._embed_texts(list(pending.values()), store)
+            found.update((k, np.asarray(v, dtype=np.float32)) for k, v in zip(pending_keys, vectors))
+        if self._builds:
+            hit_tokens = sum(_count_tokens(t) for k, t in zip(keys, texts) if k not in pending)
+            new_tokens = sum(_count_tokens(t) for t in pending.values())
+            for stats in self._builds:
+                stats.hits += len(texts) - len(pending)
+                stats.misses += len(pending)
+                stats.tokens_saved += hit_tokens
+                stats.tokens_embedded += new_tokens
+        return [found[k].tolist() for k in keys]
+
+    def _embed_texts(self, texts: List[str], on_batch=None):
+        if self.scheduler is not None:
+            return self.scheduler.embed(texts, on_batch)
+        vectors = self.base.embed_documents(texts)
+        if on_batch is not None:
+            on_batch(list(range(len(texts))), vectors)
+        return vectors
+
+    def begin_build(self) -> BuildEmbeddingStats:
+        """이후 embed_documents 적중/절감량 집계 시작 (end_build로 끝냄)"""
+        stats = BuildEmbeddingStats(self.cost_per_1m_tokens)
+        with self._lock:
+            self._builds.append(stats)
+        return stats
+
+    def end_build(self, stats: BuildEmbeddingStats):
+        with self._lock:
+            if stats in self._builds:
+                self._builds.remove(stats)
+
+    @contextmanager
+    def track_build(self):
+        stats = self.begin_build()
+        try:
+            yield stats
+        finally:
+            self.end_build(stats)
+
+    # --- 캐시 ---
+    def get(self, text: str) -> np.ndarray:
+        """질의 벡터(float32, 읽기 전용)"""
+        key = normalize_query(text)
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vec
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        if not owner:
+            return future.result()
+        try:
+            vec = self._load(key)
+            with self._lock:
+                if vec is not None:
+                    self.disk_hits += 1
+                else:
+                    self.misses += 1
+            if vec is None:
+                vec = np.asarray(self.base.embed_query(key), dtype=np.float32)
+                vec.setflags(write=False)
+                self._save(key, vec)
+            self._put(key, vec)
+            future.set_result(vec)
+            return vec
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _put(self, key: str, vec: np.ndarray):
+        size = vec.nbytes + len(key.encode("utf-8")) + ENTRY_OVERHEAD_BYTES
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = vec
+            self.bytes += size
+            while self._entries and (self.bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                old_key, old_vec = self._entries.popitem(last=False)
+                self.bytes -= old_vec.nbytes + len(old_key.encode("utf-8")) + ENTRY_OVERHEAD_BYTES
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    # --- 영구 저장 (SQLite) ---
+    def _conn(self):
+        # sqlite 연결은 스레드별로 하나씩 (워커끼리는 파일 잠금으로 공유)
+        conn = getattr(self._local, "conn", None)
+        # gunicorn --preload: 마스터에서 연 연결은 fork 이후 쓰지 않고 워커에서 새로 엶
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _load(self, key: str) -> Optional[np.ndarray]:
+        if not self.path:
+            return None
+        try:
+            row = self._conn().execute(
+                "SELECT vec FROM query_embeddings WHERE namespace = ? AND key = ?", (self.namespace, key)).fetchone()
+        except sqlite3.Error as e:
+            print(f"질의 임베딩 캐시 조회 오류: {e}")
+            return None
+        return np.frombuffer(row[0], dtype=np.float32) if row else None  # frombuffer 결과는 읽기 전용
+
+    def _save(self, key: str, vec: np.ndarray):
+        if not self.path:
+            return
+        try:
+            conn = self._conn()
+            conn.execute("INSERT OR REPLACE INTO query_embeddings (namespace, key, vec, created) VALUES (?, ?, ?, ?)",
+                         (self.namespace, key, vec.tobytes(), time.time()))
+            self._disk_writes += 1
+            if self._disk_writes % 1000 == 0:
+                # 가끔씩 오래된 항목 정리 (디스크 상한)
+                conn.execute("""DELETE FROM query_embeddings WHERE rowid IN (
+                    SELECT rowid FROM query_embeddings ORDER BY created DESC LIMIT -1 OFFSET ?)""",
+                             (self.max_disk_entries,))
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"질의 임베딩 캐시 저장 오류: {e}")
+
+    # --- 지표 ---
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'lookups': lookups,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups * 100, 1) if lookups else 0.0,
+                'persistent': bool(self.path),
+            }
+
+    def render_metrics(self, prefix: str = "rag_query_embedding_cache") -> str:
+        """Prometheus 텍스트 포맷 (프로세스 단위)"""
+        s = self.stats()
+        return "\n".join([
+            f"# HELP {prefix}_lookups_total Query embedding cache lookups",
+            f"# TYPE {prefix}_lookups_total counter",
+            f'{prefix}_lookups_total{{result="hit"}} {s["hits"]}',
+            f'{prefix}_lookups_total{{result="disk_hit"}} {s["disk_hits"]}',
+            f'{prefix}_lookups_total{{result="miss"}} {s["misses"]}',
+            f"# HELP {prefix}_evictions_total Entries evicted by the memory cap",
+            f"# TYPE {prefix}_evictions_total counter",
+            f"{prefix}_evictions_total {s['evictions']}",
+            f"# HELP {prefix}_bytes Approximate in-memory cache size",
+            f"# TYPE {prefix}_bytes gauge",
+            f"{prefix}_bytes {s['bytes']}",
+            f"# HELP {prefix}_entries In-memory cache entries",
+            f"# TYPE {prefix}_entries gauge",
+            f"{prefix}_entries {s['entries']}",
+        ])
@@ -0,0 +1,250 @@
+"""FAISS 인덱스 팩토리: Flat / IVF-Flat / IVF-PQ / HNSW (app3.py)
+
+FAISS.from_documents는 항상 IndexFlatL2를 만들어, 질의마다 전체 벡터를 훑습니다. 청크 2천 개면
+충분하지만 아카이브 코퍼스(수십만~수백만 청크)에서는 질의 지연이 청크 수에 비례합니다. 여기서는
+  - FAISS_INDEX(flat | ivf | ivfpq | hnsw 또는 "IVF1024,PQ64" 같은 팩토리 문자열)로 인덱스를 고르고,
+  - IVF/PQ 학습 결과(빈 학습 인덱스)를 벡터스토어와 별도 디렉터리에 저장해, 전체 재구축 때
+    같은 팩토리/차원이면 다시 학습하지 않으며,
+  - 질의 시점 정확도/속도 조절값(IVF nprobe, HNSW efSearch)을 로드 후·관리자 API에서 바꿉니다.
+L2 거리(FAISS 기본)를 그대로 쓰므로 점수/MMR 동작은 flat과 같고, 근사 검색이라 재현율만 달라집니다.
+정확도는 bench/ann_bench.py로 flat 대비 recall@k와 지연을 재서 고릅니다.
+"""
+import hashlib
+import json
+import math
+import os
+import time
+from typing import Optional
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+INDEX_KINDS = ("flat", "ivf", "ivfpq", "hnsw")
+TRAINED_FILE = "trained.faiss"
+TRAINED_META_FILE = "trained.json"
+MIN_POINTS_PER_CENTROID = 39   # faiss가 이보다 적으면 경고하는 클러스터당 학습 벡터 수
+MAX_TRAIN_POINTS = 256 * 1000
+EMBED_SHARD_SIZE = 4096        # 재구축 때 한 번에 임베딩해 float32로 바꾸는 청크 수
+CORPUS_SKETCH_SIZE = 256       # 학습 코퍼스 지문: 청크 본문 해시 중 가장 작은 값 N개
+MIN_CORPUS_OVERLAP = 0.5       # 학습 때 청크가 이 비율 이상 남아 있어야 학습 결과 재사용
+
+
+def default_nlist(n: int) -> int:
+    """IVF 클러스터 수: 4·√n, 클러스터당 학습 벡터가 모자라지 않게"""
+    return max(1, min(int(4 * math.sqrt(max(n, 1))), n // MIN_POINTS_PER_CENTROID))
+
+
+def default_pq_m(dim: int) -> int:
+    """PQ 서브벡터 수: 차원을 나누는 64 이하 최댓값 (1536차원 → 64바이트/벡터)"""
+    return max(m for m in range(1, min(64, dim) + 1) if dim % m == 0)
+
+
+def factory_string(kind: str, n: int, dim: int, nlist: Optional[int] = None,
+                   pq_m: Optional[int] = None, hnsw_m: int = 32) -> str:
+    """INDEX_KINDS 이름 → faiss.index_factory 문자열 (이미 팩토리 문자열이면 그대로)"""
+    kind = (kind or "flat").strip()
+    if kind.lower() not in INDEX_KINDS:
+        return kind
+    kind = kind.lower()
+    if kind == "flat":
+        return "Flat"
+    if kind == "hnsw":
+        return f"HNSW{hnsw_m},Flat"
+    nlist = nlist or default_nlist(n)
+    if kind == "ivf":
+        return f"IVF{nlist},Flat"
+    # PQ 코드북(2^nbits 중심)도 학습 벡터가 충분해야 하므로 작은 코퍼스에서는 비트 수를 줄임
+    ntrain = min(n, MAX_TRAIN_POINTS)
+    nbits = max(4, min(8, int(math.log2(max(ntrain // MIN_POINTS_PER_CENTROID, 1)))))
+    return f"IVF{nlist},PQ{pq_m or default_pq_m(dim)}x{nbits}"
+
+
+def _ivf(index):
+    try:
+        return faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return None
+
+
+def make_reconstructable(index):
+    """IVF는 id → 벡터 역조회(direct map)가 있어야 MMR(reconstruct)과 삭제가 됨"""
+    ivf = _ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+
+def embedding_namespace(embeddings) -> str:
+    """임베딩 모델 식별자 (ChunkEmbeddingStore와 같은 '타입:모델', 캐시 래퍼면 그 namespace)"""
+    return getattr(embeddings, "namespace", None) or f"{type(embeddings).__name__}:{getattr(embeddings, 'model', '')}"
+
+
+def corpus_hashes(texts) -> set:
+    """청크 본문 해시 집합 (학습 코퍼스 지문 비교용)"""
+    return {hashlib.sha1(t.encode("utf-8")).hexdigest()[:16] for t in texts}
+
+
+def train_index(spec: str, vectors, trained_dir: Optional[str] = None,
+                hnsw_ef_construction: int = 80, seed: int = 0,
+                dim: Optional[int] = None, n: Optional[int] = None,
+                embedding: Optional[str] = None, corpus: Optional[set] = None):
+    """빈(학습된) 인덱스. trained_dir에 같은 팩토리/차원/임베딩 모델로 학습한 결과가 있으면 재사용
+
+    vectors는 학습 벡터 배열, 또는 학습이 필요할 때만 부르는 함수(이때 dim과 코퍼스 크기 n을 함께 줌)
+    embedding은 embedding_namespace, corpus는 corpus_hashes — 주면 모델이 바뀌었거나 코퍼스가
+    대부분 바뀐 학습 결과는 다시 학습합니다.
+    """
+    dim = dim or vectors.shape[1]
+    n = n or len(vectors)
+    meta = {"factory": spec, "dim": dim, "metric": "L2"}
+    if embedding:
+        meta["embedding"] = embedding
+    if trained_dir:
+        index = _load_trained(trained_dir, meta, n, corpus)
+        if index is not None:
+            return index
+    index = faiss.index_factory(dim, spec, faiss.METRIC_L2)
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efConstruction = hnsw_ef_construction
+    if not index.is_trained:
+        if callable(vectors):
+            vectors = vectors()
+        started = time.perf_counter()
+        sample = vectors
+        if len(vectors) > MAX_TRAIN_POINTS:
+            rng = np.random.default_rng(seed)
+            sample = vectors[rng.choice(len(vectors), MAX_TRAIN_POINTS, replace=False)]
+        index.train(np.ascontiguousarray(sample, dtype="float32"))
+        print(f"🎓 FAISS 인덱스 학습: {spec}, 벡터 {len(sample)}개 ({time.perf_counter() - started:.1f}초)")
+        if trained_dir:
+            sketch = sorted(corpus)[:CORPUS_SKETCH_SIZE] if corpus else None
+            _save_trained(trained_dir, index, {**meta, "train_size": len(sample), "corpus_sketch": sketch})
+    return make_reconstructable(index)
+
+
+def _load_trained(trained_dir, meta, n, corpus=None):
+    try:
+        with open(os.path.join(trained_dir, TRAINED_META_FILE), "r", encoding="utf-8") as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None
+    changed = [k for k, v in meta.items() if stored.get(k) != v]
+    if changed:
+        if stored.get("factory") == meta["factory"]:
+            print(f"🎓 저장된 FAISS 학습 결과와 {', '.join(changed)}가 달라 다시 학습")
+        return None
+    # 코퍼스가 학습 때보다 많이 커졌으면 클러스터가 치우치므로 다시 학습
+    if stored.get("train_size", 0) * 2 < min(n, MAX_TRAIN_POINTS):
+        return None
+    if corpus is not None:
+        # 학습 때 청크(지문 표본)가 지금 코퍼스에 얼마나 남아 있는지 — 코퍼스를 갈아 끼웠으면 다시 학습
+        sketch = stored.get("corpus_sketch") or []
+        overlap = sum(h in corpus for h in sketch) / len(sketch) if sketch else 0.0
+        if overlap < MIN_CORPUS_OVERLAP:
+            print(f"🎓 학습 때 코퍼스와 겹치는 청크 {overlap:.0%} → 다시 학습")
+            return None
+    index = faiss.read_index(os.path.join(trained_dir, TRAINED_FILE))
+    index.reset()   # 혹시 벡터가 들어 있어도 학습 결과만 사용
+    print(f"🎓 저장된 FAISS 학습 결과 재사용: {meta['factory']} (학습 벡터 {stored['train_size']}개)")
+    return make_reconstructable(index)
+
+
+def _save_trained(trained_dir, index, meta):
+    from faiss_store import _replace
+    os.makedirs(trained_dir, exist_ok=True)
+    _replace(os.path.join(trained_dir, TRAINED_FILE), lambda tmp: faiss.write_index(index, tmp))
+
+    def write_meta(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({**meta, "trained_at": time.strftime("%Y-%m-%d %H:%M:%S")}, f, ensure_ascii=False, indent=2)
+    _replace(os.path.join(trained_dir, TRAINED_META_FILE), write_meta)
+
+
+def _embed_float32(embeddings, texts, shard_size, head=None) -> np.ndarray:
+    """texts를 shard_size개씩 임베딩해 float32 배열 하나로 (Python float 리스트는 샤드 하나 분량만)
+
+    head는 이미 임베딩한 앞부분 (다시 임베딩하지 않음)
+    """
+    out, start = None, 0
+    if head is not None:
+        out = np.empty((len(texts), head.shape[1]), dtype="float32")
+        out[:len(head)] = head
+        start = len(head)
+    for start in range(start, len(texts), shard_size):
+        shard = np.asarray(embeddings.embed_documents(texts[start:start + shard_size]), dtype="float32")
+        if out is None:
+            out = np.empty((len(texts), shard.shape[1]), dtype="float32")
+        out[start:start + len(shard)] = shard
+    return out
+
+
+def build_vectorstore(documents, embeddings, ids, kind: str = "flat",
+                      trained_dir: Optional[str] = None, shard_size: int = EMBED_SHARD_SIZE,
+                      seed: int = 0, **factory_options) -> FAISS:
+    """FAISS.from_documents와 같은 결과를 팩토리 인덱스로, 임베딩은 shard_size개씩
+
+    전체 코퍼스의 임베딩을 Python 리스트로 한 번에 받지 않고 샤드마다 float32로 바꿔 바로 추가합니다.
+    IVF/PQ 학습이 필요하면 무작위 표본(최대 MAX_TRAIN_POINTS개)을 먼저 임베딩해 학습하고,
+    코퍼스가 표본 한도 이하면 그 배열을 그대로 추가해 다시 임베딩하지 않습니다.
+    factory_options는 factory_string의 nlist/pq_m/hnsw_m (차원은 첫 샤드를 임베딩한 뒤 결정)
+    """
+    texts = [d.page_content for d in documents]
+    n = len(texts)
+    first = _embed_float32(embeddings, texts[:shard_size], shard_size)
+    spec = factory_string(kind, n, first.shape[1], **factory_options)
+    held = {"vectors": first if n <= shard_size else None}
+
+    def training_sample():
+        if n <= MAX_TRAIN_POINTS:
+            held["vectors"] = _embed_float32(embeddings, texts, shard_size, head=first)
+            return held["vectors"]
+        picked = np.sort(np.random.default_rng(seed).choice(n, MAX_TRAIN_POINTS, replace=False))
+        return _embed_float32(embeddings, [texts[i] for i in picked], shard_size)
+
+    index = train_index(spec, training_sample, trained_dir, seed=seed, dim=first.shape[1], n=n,
+                        embedding=embedding_namespace(embeddings),
+                        corpus=corpus_hashes(texts) if trained_dir else None)
+    vs = FAISS(embedding_function=embeddings, index=index, docstore=InMemoryDocstore(),
+               index_to_docstore_id={})
+    for start in range(0, n, shard_size):
+        end = min(start + shard_size, n)
+        if held["vectors"] is not None:
+            vectors = held["vectors"][start:end]
+        elif start == 0:
+            vectors = first
+        else:
+            vectors = _embed_float32(embeddings, texts[start:end], shard_size)
+        vs.add_embeddings(list(zip(texts[start:end], vectors)),
+                          metadatas=[d.metadata for d in documents[start:end]],
+                          ids=ids[start:end] if ids is not None else None)
+    return vs
+
+
+def set_search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> dict:
+    """질의 시점 조절값 적용. 해당 인덱스에 없는 값은 무시하고 적용된 것만 반환"""
+    applied = {}
+    ivf = _ivf(index)
+    if nprobe and ivf is not None:
+        ivf.nprobe = max(1, min(int(nprobe), ivf.nlist))
+        applied["nprobe"] = ivf.nprobe
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if ef_search and hnsw is not None:
+        hnsw.efSearch = int(ef_search)
+        applied["efSearch"] = hnsw.efSearch
+    return applied
+
+
+def describe(index) -> dict:
+    """관리자 API/로그용 인덱스 요약"""
+    info = {"type": type(faiss.downcast_index(index)).__name__, "ntotal": int(index.ntotal),
+            "dim": int(index.d), "is_trained": bool(index.is_trained)}
+    ivf = _ivf(index)
+    if ivf is not None:
+        info.update(nlist=int(ivf.nlist), nprobe=int(ivf.nprobe))
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        info.update(efSearch=int(hnsw.efSearch), efConstruction=int(hnsw.efConstruction))
+    return info
@@ -0,0 +1,390 @@
+"""FAISS 벡터스토어 로드/저장 (app3.py)
+
+FAISS.load_local은 index.faiss 전체와 pickle docstore를 워커마다 자기 힙으로 읽어서,
+gunicorn 워커 N개면 메모리와 로드 시간이 N배가 됩니다. 여기서는
+  - index.faiss를 읽기 전용 mmap(IO_FLAG_MMAP)으로 열어 벡터를 페이지 캐시로 공유하고
+    (워커 시작 비용이 인덱스 크기에 비례하지 않음),
+  - 저장은 임시 파일에 쓴 뒤 os.replace로 바꿔, 다른 워커가 mmap 중인 파일을 덮어쓰지 않게 하고
+    (기존 워커는 이전 inode를 계속 보고, 다음 로드부터 새 파일),
+  - 벡터를 추가해야 할 때만 mmap 인덱스를 힙으로 복사합니다(ensure_writable).
+gunicorn --preload로 마스터에서 한 번 로드하면 docstore도 fork 이후 copy-on-write로 공유됩니다.
+
+docstore는 pickle(InMemoryDocstore) 대신 컬럼형 파일(ColumnarDocstore)로 저장합니다.
+  - 본문: 청크 본문을 이어 붙인 UTF-8 한 덩어리(mmap) + 바이트 오프셋 배열(.npy, mmap),
+  - metadata: 청크당 한 줄 JSONL (chunk_id/group_key 등은 시작할 때 필요해 읽어서
+    chunk_records.ChunkRecords의 압축 레코드로 들고 있음),
+  - docstore.json: 위 파일 이름과 건수. 데이터 파일은 저장마다 새 이름으로 쓰고 이 파일만 바꿔 끼움.
+본문은 search(id)로 조회될 때(프롬프트에 들어갈 몇 개 청크) 그 청크만 디코드하므로, 시작 비용이
+본문 크기와 무관하고 allow_dangerous_deserialization도 필요 없습니다.
+기존 디렉터리 변환: python faiss_store.py convert vectorstore/
+"""
+import argparse
+import json
+import mmap as _mmap
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from chunk_records import ChunkRecords
+from faiss_index import _ivf, describe, make_reconstructable, set_search_params
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "index.pkl"          # 이전 형식 (app.py~app2.py의 FAISS.load_local이 읽음)
+MANIFEST_FILE = "docstore.json"
+COLUMNAR_VERSION = 1
+# IO_FLAG_MMAP만으로는 IVF 역리스트만 mmap되고 flat/HNSW 벡터 코드는 힙으로 읽힘
+MMAP_FLAT_CODES = hasattr(faiss, "IO_FLAG_MMAP_IFC")
+
+
+class ColumnarDocstore(Docstore, AddableMixin):
+    """본문 mmap + 오프셋 + 압축 metadata 레코드로 된 읽기 위주 docstore
+
+    FAISS가 쓰는 search/add/delete 외에 chunk_id(= docstore id) → Document 매핑처럼도 쓸 수 있어
+    ChunkIndex.by_id와 BM25 결과 조회에 그대로 넘깁니다. 저장 이후 추가/삭제된 청크는
+    메모리에만 있다가 다음 save_vectorstore 때 파일에 합쳐집니다.
+    """
+
+    def __init__(self, text, offsets, records: ChunkRecords, cache_size: int = 4096):
+        self._text = text              # mmap(또는 bytes)
+        self._offsets = offsets        # int64[n + 1], 행 i의 본문 = text[offsets[i]:offsets[i + 1]]
+        self._records = records        # 행 i의 id / 압축 metadata
+        self._row = records.row
+        self._added = {}               # 저장 이후 추가된 id -> Document
+        self._deleted = set()
+        self.cache_size = cache_size
+        self._cache = OrderedDict()    # 최근 만든 Document (같은 청크는 같은 객체)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, directory: str):
+        """(docstore, index_to_docstore_id). 컬럼형 파일이 없으면 None"""
+        path = os.path.join(directory, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return None
+        for attempt in range(3):
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            try:
+                return cls._open_files(directory, manifest)
+            except FileNotFoundError:
+                # 읽는 사이 다른 프로세스가 새로 저장하고 이전 데이터 파일을 지움 → 새 목록으로 다시
+                if attempt == 2:
+                    raise
+                time.sleep(0.05)
+
+    @classmethod
+    def _open_files(cls, directory, manifest):
+        if manifest.get("version") != COLUMNAR_VERSION:
+            raise ValueError(f"지원하지 않는 docstore 버전: {manifest.get('version')}")
+        offsets = np.load(os.path.join(directory, manifest["offsets"]), mmap_mode="r")
+        with open(os.path.join(directory, manifest["text"]), "rb") as f:
+            # 빈 파일은 mmap할 수 없음
+            text = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ) if int(offsets[-1]) else b""
+        records, index_to_docstore_id = ChunkRecords(), {}
+        with open(os.path.join(directory, manifest["meta"]), "r", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                index_to_docstore_id[row["pos"]] = row["id"]
+                records.append(row["id"], row["metadata"])
+        records.finish()
+        if len(records) != manifest["count"] or len(offsets) != len(records) + 1:
+            raise ValueError(f"docstore 파일이 서로 맞지 않습니다: {directory}")
+        return cls(text, offsets, records), index_to_docstore_id
+
+    # --- 조회 ---
+    def text(self, doc_id: str) -> str:
+        if doc_id in self._added:
+            return self._added[doc_id].page_content
+        row = self._row[doc_id]
+        return bytes(self._text[int(self._offsets[row]):int(self._offsets[row + 1])]).decode("utf-8")
+
+    def metadata(self, doc_id: str) -> dict:
+        """본문을 읽지 않고 metadata만 (압축 레코드에서 새로 만든 dict, 고치려면 update_metadata)"""
+        if doc_id in self._added:
+            return self._added[doc_id].metadata
+        return self._records.metadata(self._row[doc_id])
+
+    def has_metadata(self, doc_id: str, key: str) -> bool:
+        if doc_id in self._added:
+            return key in (self._added[doc_id].metadata or {})
+        return self._records.has(self._row[doc_id], key)
+
+    def update_metadata(self, doc_id: str, metadata: dict):
+        """metadata를 레코드에 다시 기록 (다음 저장에 반영)"""
+        if doc_id in self._added:
+            self._added[doc_id].metadata = metadata
+            return
+        self._records.update(self._row[doc_id], metadata)
+        with self._lock:
+            self._cache.pop(doc_id, None)
+
+    def nbytes(self) -> int:
+        """힙에 있는 청크 id/압축 레코드 크기 근사 (본문/오프셋은 mmap이라 제외)"""
+        return self._records.nbytes()
+
+    def memory_usage(self) -> dict:
+        """ChunkRecords.memory_usage (항목별 바이트)"""
+        return self._records.memory_usage()
+
+    def iter_metadata(self):
+        """(id, metadata) — 저장 순서, 추가된 청크는 뒤에"""
+        for doc_id in self:
+            yield doc_id, self.metadata(doc_id)
+
+    def search(self, search: str):
+        if search not in self:
+            return f"ID {search} not found."
+        if search in self._added:
+            return self._added[search]
+        with self._lock:
+            doc = self._cache.get(search)
+            if doc is not None:
+                self._cache.move_to_end(search)
+                return doc
+        # Document는 검색 결과로 나갈 청크만 만듦 (평소에는 압축 레코드뿐)
+        doc = Document(page_content=self.text(search), metadata=self.metadata(search))
+        with self._lock:
+            doc = self._cache.setdefault(search, doc)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return doc
+
+    # --- FAISS가 쓰는 추가/삭제 ---
+    def add(self, texts):
+        for doc_id, doc in texts.items():
+            self._deleted.discard(doc_id)
+            self._added[doc_id] = doc
+            with self._lock:
+                self._cache.pop(doc_id, None)
+
+    def delete(self, ids):
+        for doc_id in ids:
+            if doc_id not in self:
+                raise ValueError(f"ID {doc_id} not found.")
+            self._added.pop(doc_id, None)
+            self._deleted.add(doc_id)
+            with self._lock:
+                self._cache.pop(doc_id, None)
+
+    # --- chunk_id -> Document 매핑처럼 ---
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self._added or (doc_id in self._row and doc_id not in self._deleted)
+
+    def __getitem__(self, doc_id):
+        if doc_id not in self:
+            raise KeyError(doc_id)
+        return self.search(doc_id)
+
+    def __setitem__(self, doc_id, doc):
+        if doc_id not in self:
+            self.add({doc_id: doc})
+
+    def get(self, doc_id, default=None):
+        return self[doc_id] if doc_id is not None and doc_id in self else default
+
+    def __iter__(self):
+        for doc_id in self._records.ids:
+            if doc_id not in self._deleted and doc_id not in self._added:
+                yield doc_id
+        yield from list(self._added)
+
+    def __len__(self) -> int:
+        return sum(1 for doc_id in self._records.ids if doc_id not in self._deleted and doc_id not in self._added) \
+            + len(self._added)
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        """모든 청크를 Document로 (BM25 전체 재구성 같은 드문 작업용, 본문을 전부 읽음)"""
+        return (self.search(doc_id) for doc_id in self)
+
+
+def mmap_flags() -> int:
+    """읽기 전용 mmap 플래그 (flat 코드 mmap 플래그 IO_FLAG_MMAP_IFC는 이를 지원하는 faiss에서만)"""
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return flags | faiss.IO_FLAG_MMAP_IFC if MMAP_FLAT_CODES else flags
+
+
+def load_vectorstore(directory: str, embeddings, mmap: bool = True) -> FAISS:
+    """FAISS.load_local과 같은 인덱스를 읽되, mmap=True면 인덱스를 mmap으로 엶
+
+    docstore는 컬럼형 파일이 있으면 그것을(본문은 지연 로드), 없으면 이전 pickle을 읽습니다.
+    """
+    index_path = os.path.join(directory, INDEX_FILE)
+    loaded_file = _file_id(index_path)
+    try:
+        index = faiss.read_index(index_path, mmap_flags()) if mmap else faiss.read_index(index_path)
+    except RuntimeError as e:
+        # mmap으로 열 수 없는 인덱스 형식이면 힙으로 읽음
+        print(f"⚠️ FAISS 인덱스 mmap 실패, 힙으로 로드: {e}")
+        index, mmap = faiss.read_index(index_path), False
+    if mmap and not MMAP_FLAT_CODES and _ivf(index) is None:
+        # 읽기는 됐지만 벡터 코드가 힙에 있음 → 워커끼리 공유되지 않고, ensure_writable 복사도 불필요
+        print(f"⚠️ 이 faiss에는 IO_FLAG_MMAP_IFC가 없어 {type(faiss.downcast_index(index)).__name__} "
+              f"인덱스는 mmap되지 않음 (워커마다 힙에 로드)")
+        mmap = False
+    make_reconstructable(index)   # IVF: MMR의 reconstruct용 id → 벡터 조회
+    opened = ColumnarDocstore.open(directory)
+    if opened is not None:
+        docstore, index_to_docstore_id = opened
+    else:
+        # 저장 파일은 이 앱이 직접 만든 것 (FAISS.load_local의 allow_dangerous_deserialization과 같은 전제)
+        with open(os.path.join(directory, DOCSTORE_FILE), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+    vs = FAISS(embedding_function=embeddings, index=index, docstore=docstore,
+               index_to_docstore_id=index_to_docstore_id)
+    vs._mmap = mmap   # ensure_writable 판단용
+    vs._index_path, vs._index_file = index_path, loaded_file
+    return vs
+
+
+def _file_id(path):
+    st = os.stat(path)
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def ensure_writable(vs: FAISS):
+    """mmap(읽기 전용)으로 연 인덱스면 같은 파일을 힙으로 다시 읽어 add가 가능하게 함
+
+    clone_index는 mmap된 IVF 역리스트(OnDiskInvertedLists)를 복사하지 못하므로 파일에서 다시 읽습니다.
+    """
+    if not getattr(vs, "_mmap", False):
+        return vs
+    if _file_id(vs._index_path) != vs._index_file:
+        # 다른 워커가 저장해 파일이 바뀜 → 이 인덱스와 id 매핑이 맞지 않음
+        raise RuntimeError(f"{vs._index_path}가 로드 이후 바뀌었습니다. 벡터스토어를 다시 로드한 뒤 추가하세요.")
+    index = faiss.read_index(vs._index_path)
+    if index.ntotal != vs.index.ntotal:
+        raise RuntimeError(f"{vs._index_path}의 벡터 수({index.ntotal})가 로드한 인덱스({vs.index.ntotal})와 다릅니다.")
+    current = describe(vs.index)   # 로드 후 바꾼 nprobe/efSearch 유지
+    set_search_params(index, current.get("nprobe"), current.get("efSearch"))
+    vs.index = make_reconstructable(index)
+    vs._mmap = False
+    return vs
+
+
+def _replace(path: str, write):
+    tmp = f"{path}.tmp.{os.getpid()}"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _row_of(docstore, doc_id):
+    """(본문, metadata) — 컬럼형이면 Document를 만들지 않고 바로"""
+    if isinstance(docstore, ColumnarDocstore):
+        return docstore.text(doc_id), docstore.metadata(doc_id)
+    doc = docstore.search(doc_id)
+    if not isinstance(doc, Document):
+        raise ValueError(f"docstore에 없는 id: {doc_id}")
+    return doc.page_content, doc.metadata or {}
+
+
+def write_columnar(directory: str, docstore, index_to_docstore_id):
+    """컬럼형 docstore 파일 쓰기. 데이터 파일은 새 이름으로 쓰고 docstore.json을 바꾼 뒤 이전 파일 삭제"""
+    tag = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{threading.get_ident() % 10000}"
+    names = {"text": f"docstore-{tag}.text", "offsets": f"docstore-{tag}.offsets.npy",
+             "meta": f"docstore-{tag}.meta.jsonl"}
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+
+    offsets = [0]
+    try:
+        with open(os.path.join(directory, names["text"]), "wb") as text_f, \
+                open(os.path.join(directory, names["meta"]), "w", encoding="utf-8") as meta_f:
+            for pos in sorted(index_to_docstore_id):
+                doc_id = index_to_docstore_id[pos]
+                text, metadata = _row_of(docstore, doc_id)
+                data = text.encode("utf-8")
+                text_f.write(data)
+                offsets.append(offsets[-1] + len(data))
+                meta_f.write(json.dumps({"pos": pos, "id": doc_id, "metadata": metadata},
+                                        ensure_ascii=False, default=str) + "\n")
+        with open(os.path.join(directory, names["offsets"]), "wb") as f:
+            np.save(f, np.asarray(offsets, dtype=np.int64))
+
+        manifest = {"version": COLUMNAR_VERSION, "count": len(offsets) - 1, **names}
+
+        def write_manifest(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+        _replace(manifest_path, write_manifest)
+    except BaseException:
+        for name in names.values():
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+    # 이전 파일을 mmap 중인 워커는 inode가 남아 있어 계속 읽을 수 있음
+    for key in names:
+        old = previous.get(key)
+        if old and old != names[key] and os.path.exists(os.path.join(directory, old)):
+            os.remove(os.path.join(directory, old))
+    return manifest
+
+
+def save_vectorstore(vs: FAISS, directory: str, legacy_pickle: bool = True):
+    """인덱스 + 컬럼형 docstore 저장. 파일별로 임시 파일 → os.replace (mmap 중인 워커 보호)
+
+    legacy_pickle=True면 같은 디렉터리를 FAISS.load_local로 읽는 app.py~app2.py를 위해
+    index.pkl도 함께 씁니다 (이때는 본문을 전부 읽음).
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    # docstore를 먼저 바꿔, 새 인덱스가 보일 때는 항상 그 id를 아는 docstore가 있도록
+    write_columnar(directory, vs.docstore, vs.index_to_docstore_id)
+    if legacy_pickle:
+        def write_docstore(tmp):
+            docstore = vs.docstore
+            if isinstance(docstore, ColumnarDocstore):
+                docstore = InMemoryDocstore({doc_id: docstore.search(doc_id) for doc_id in docstore})
+            with open(tmp, "wb") as f:
+                pickle.dump((docstore, vs.index_to_docstore_id), f, protocol=pickle.HIGHEST_PROTOCOL)
+        _replace(os.path.join(directory, DOCSTORE_FILE), write_docstore)
+    _replace(os.path.join(directory, INDEX_FILE), lambda tmp: faiss.write_index(vs.index, tmp))
+
+
+def convert(directory: str, drop_pickle: bool = False):
+    """이전 벡터스토어 디렉터리(index.pkl)에 컬럼형 docstore 파일을 추가 (인덱스는 그대로)"""
+    started = time.perf_counter()
+    with open(os.path.join(directory, DOCSTORE_FILE), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    manifest = write_columnar(directory, docstore, index_to_docstore_id)
+    size = sum(os.path.getsize(os.path.join(directory, manifest[k])) for k in ("text", "offsets", "meta"))
+    print(f"✅ 변환 완료: {directory} — 청크 {manifest['count']}개, {size / 1e6:.1f} MB "
+          f"({time.perf_counter() - started:.1f}초)")
+    if drop_pickle:
+        os.remove(os.path.join(directory, DOCSTORE_FILE))
+        print(f"🗑️ {DOCSTORE_FILE} 삭제 (app.py~app2.py는 이 디렉터리를 더 이상 읽지 못함)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAISS 벡터스토어 docstore 도구")
+    sub = parser.add_subparsers(dest="command", required=True)
+    conv = sub.add_parser("convert", help="pickle docstore(index.pkl) → 컬럼형 docstore")
+    conv.add_argument("directories", nargs="+", help="벡터스토어 디렉터리 (예: vectorstore/)")
+    conv.add_argument("--drop-pickle", action="store_true", help="변환 후 index.pkl 삭제")
+    args = parser.parse_args()
+    for directory in args.directories:
+        convert(directory, drop_pickle=args.drop_pickle)
+
+
+if __name__ == "__main__":
+    main()
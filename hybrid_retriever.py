@@ -0,0 +1,103 @@
+"""BM25 + FAISS 동시 검색 + 가중 RRF 하이브리드 리트리버 (app3.py)
+
+EnsembleRetriever는 BM25와 FAISS MMR을 차례로 돌리고 문서만 돌려줘서, 뒤 단계
+(generic_rerank, evidence_guard)가 검색 신뢰도를 쓸 수 없었습니다. 여기서는
+  - 키워드(BM25) 검색을 스레드풀에서, 의미(FAISS) 검색을 호출 스레드에서 동시에 돌리고,
+  - 가중 RRF(score = Σ weight / (rank + c), EnsembleRetriever와 같은 식)로 합쳐,
+  - (문서, 합친 점수, 검색기별 순위, 검색기별 원점수) 를 돌려줍니다.
+원점수는 BM25 점수 / FAISS L2 거리(작을수록 가까움)이고, 얻을 수 없으면 None입니다.
+"""
+import contextvars
+from contextlib import nullcontext
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from langchain_core.retrievers import BaseRetriever
+
+
+class ScoredDoc(NamedTuple):
+    doc: Any
+    score: float                      # 가중 RRF 점수
+    ranks: Dict[str, int]             # 검색기 이름 -> 1부터 시작하는 순위 (검색되지 않았으면 없음)
+    scores: Dict[str, Optional[float]]  # 검색기 이름 -> 원점수
+
+
+def doc_key(d):
+    """중복 판단 키: chunk_id가 있으면 chunk_id, 없으면 본문 (EnsembleRetriever 기본과 같음)"""
+    return (d.metadata or {}).get("chunk_id") or d.page_content
+
+
+def is_decisive(hits: Sequence[ScoredDoc]) -> bool:
+    """1위 문서를 모든 검색기가 1위로 찾았으면 확정적인 결과로 봄"""
+    if not hits:
+        return False
+    top = hits[0]
+    return len(top.ranks) > 1 and all(r == 1 for r in top.ranks.values())
+
+
+class HybridRetriever(BaseRetriever):
+    """EnsembleRetriever 자리에 그대로 쓰면서 점수까지 주는 하이브리드 리트리버"""
+
+    lexical: Any
+    dense: Any
+    weights: List[float] = [0.45, 0.55]
+    names: List[str] = ["bm25", "faiss_mmr"]
+    c: int = 60
+    executor: Any = None   # 없으면 두 검색을 차례로 실행
+    timer: Any = None      # 검색기 이름 -> 컨텍스트 매니저 (app3의 stage_timer)
+
+    def _timed(self, name):
+        return self.timer(name) if self.timer is not None else nullcontext()
+
+    def lexical_hits(self, query: str):
+        """[(doc, BM25 점수)]"""
+        with self._timed(self.names[0]):
+            if hasattr(self.lexical, "search_with_scores"):
+                return self.lexical.search_with_scores(query)
+            return [(d, None) for d in self.lexical.invoke(query)]
+
+    def dense_hits(self, query: str):
+        """[(doc, L2 거리)] — MMR 결과 순서 그대로"""
+        with self._timed(self.names[1]):
+            vs = getattr(self.dense, "vectorstore", None)
+            kwargs = dict(getattr(self.dense, "search_kwargs", None) or {})
+            search_type = getattr(self.dense, "search_type", None)
+            if search_type == "mmr" and hasattr(vs, "max_marginal_relevance_search_with_score_by_vector"):
+                return vs.max_marginal_relevance_search_with_score_by_vector(vs._embed_query(query), **kwargs)
+            if search_type == "similarity" and hasattr(vs, "similarity_search_with_score"):
+                return vs.similarity_search_with_score(query, **kwargs)
+            return [(d, None) for d in self.dense.invoke(query)]
+
+    def search_components(self, query: str):
+        """(키워드 결과, 의미 결과)를 동시에 받아 옴"""
+        if self.executor is None:
+            return self.lexical_hits(query), self.dense_hits(query)
+        # 메트릭 contextvars를 이어받아 스레드풀에서 실행
+        future = self.executor.submit(contextvars.copy_context().run, self.lexical_hits, query)
+        try:
+            dense = self.dense_hits(query)
+        except Exception:
+            future.cancel()
+            raise
+        return future.result(), dense
+
+    def fuse(self, *result_lists) -> List[ScoredDoc]:
+        """가중 RRF. 동점은 먼저 나온 문서 우선"""
+        fused: Dict[Any, list] = {}
+        for name, weight, hits in zip(self.names, self.weights, result_lists):
+            for rank, (d, raw) in enumerate(hits, 1):
+                entry = fused.get(doc_key(d))
+                if entry is None:
+                    entry = fused[doc_key(d)] = [d, 0.0, {}, {}]
+                if name in entry[2]:
+                    continue
+                entry[1] += weight / (rank + self.c)
+                entry[2][name] = rank
+                entry[3][name] = None if raw is None else float(raw)
+        ordered = sorted(fused.values(), key=lambda e: e[1], reverse=True)
+        return [ScoredDoc(*e) for e in ordered]
+
+    def search(self, query: str) -> List[ScoredDoc]:
+        return self.fuse(*self.search_components(query))
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None):
+        return [hit.doc for hit in self.search(query)]
@@ -0,0 +1,79 @@
+"""BM25용 한국어 토크나이저 (외부 형태소 분석기/모델 다운로드 없음)
+
+공백 분리만 하면 "본인부담률은", "복지용구를"처럼 조사가 붙은 어절이 질문과 문서에서
+서로 다른 단어가 되어 BM25가 거의 맞히지 못합니다. 여기서는 어절마다
+  - 조사/어미를 떼어 낸 어간 ("본인부담률은" → "본인부담률"),
+  - 어간의 글자 2-gram ("본인", "인부", "부담", "담률") → 띄어쓰기/복합어 차이 흡수,
+  - 복합어 사전(SECTION_PATTERNS 용어 등): 공백을 뺀 본문에 나오면 붙여 쓴 형태와 구성 단어를 추가
+    ("신청 절차" ↔ "신청절차")
+를 토큰으로 냅니다. 어절 분석은 LRU 캐시로 재사용하고, 청크별 결과는 BM25Index가
+인덱싱 시점에 단어 빈도로 저장하므로 질의 때 다시 토큰화하지 않습니다.
+"""
+import hashlib
+import re
+from functools import lru_cache
+from typing import Iterable, List
+
+# 길이가 긴 것부터 떼어 냄 ("에서"가 "서"보다 먼저)
+PARTICLES = sorted({
+    "은", "는", "이", "가", "을", "를", "의", "에", "에서", "에게", "께서", "한테", "으로", "로",
+    "와", "과", "도", "만", "까지", "부터", "마다", "처럼", "보다", "이나", "나", "이란", "란",
+    "이며", "하고", "으로서", "로서", "으로써", "로써", "에는", "에서는", "으로는", "로는", "과의", "와의",
+    "입니다", "인가요", "인지", "이요", "이에요", "예요", "이고", "이면", "이라", "이라도", "라도",
+    "은요", "는요", "요",
+}, key=len, reverse=True)
+
+# app2.py / app3.py 공통 도메인 복합어 (app3는 SECTION_PATTERNS 용어를 더해 씀)
+DEFAULT_COMPOUNDS = (
+    "복지용구", "본인부담률", "본인 부담금", "공단부담금", "급여결정신청", "급여 대상 품목",
+    "연 한도액", "급여가격", "내구연한", "예비급여", "시범사업", "장기요양",
+)
+
+_WORD_RE = re.compile(r"[0-9a-z가-힣%]+")
+_HANGUL_RE = re.compile(r"^[가-힣]+$")
+
+
+class KoreanTokenizer:
+    """어간 + 글자 2-gram + 복합어 확장. BM25Index(tokenize=...)에 그대로 넘김"""
+
+    def __init__(self, compounds: Iterable[str] = DEFAULT_COMPOUNDS, ngram: int = 2, cache_size: int = 65536):
+        self.ngram = ngram
+        self.compounds = []
+        for term in dict.fromkeys(c.lower() for c in compounds):
+            compact, parts = term.replace(" ", ""), term.split()
+            if len(compact) >= 2:
+                self.compounds.append((compact, [p for p in parts if len(p) >= 2] if len(parts) > 1 else []))
+        self._word = lru_cache(maxsize=cache_size)(self._analyze_word)
+        # 저장된 BM25 인덱스와 토크나이저(복합어 사전 포함)가 같은지 확인하는 용도
+        digest = hashlib.sha1("|".join(c for c, _ in self.compounds).encode("utf-8")).hexdigest()[:8]
+        self.name = f"korean-v1-ng{ngram}-{digest}"
+
+    def strip_particle(self, word: str) -> str:
+        if not _HANGUL_RE.match(word):
+            return word
+        for p in PARTICLES:
+            if word.endswith(p) and len(word) - len(p) >= 2:
+                return word[: -len(p)]
+        return word
+
+    def _analyze_word(self, word: str):
+        stem = self.strip_particle(word)
+        tokens = [stem]
+        if self.ngram and len(stem) > self.ngram and _HANGUL_RE.match(stem):
+            tokens.extend(stem[i:i + self.ngram] for i in range(len(stem) - self.ngram + 1))
+        return tuple(tokens)
+
+    def __call__(self, text: str) -> List[str]:
+        text = (text or "").lower()
+        tokens = []
+        for word in _WORD_RE.findall(text):
+            tokens.extend(self._word(word))
+        if self.compounds:
+            compact = text.replace(" ", "")
+            for term, parts in self.compounds:
+                n = compact.count(term)
+                if n:
+                    tokens.extend([term] * n)
+                    for p in parts:
+                        tokens.extend([p] * n)
+        return tokens
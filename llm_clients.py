@@ -0,0 +1,147 @@
+"""OpenAI LLM/임베딩 클라이언트 레지스트리 (app.py ~ app3.py 공용)
+
+호출할 때마다 ChatOpenAI를 새로 만들면 HTTP 클라이언트 생성 + TLS 핸드셰이크 비용을
+매번 치르게 됩니다. 여기서는 (모델, 파라미터)별로 오래 사는 클라이언트를 하나씩 만들어
+두고, 모든 클라이언트가 keep-alive 커넥션 풀을 가진 httpx.Client 하나를 공유합니다.
+ChatOpenAI / OpenAIEmbeddings 인스턴스는 여러 스레드에서 동시에 써도 안전합니다.
+gunicorn --preload로 fork된 워커는 마스터의 커넥션 풀(소켓)을 쓰지 않도록 프로세스 id가 바뀌면
+클라이언트와 레지스트리를 새로 만듭니다.
+
+환경변수:
+    LLM_POOL_SIZE            커넥션 풀 최대 크기 (기본 20)
+    LLM_KEEPALIVE_SECONDS    유휴 커넥션 유지 시간 (기본 60초)
+    LLM_WARMUP_CONNECTIONS   시작 시 미리 열어 둘 커넥션 수 (기본 2, 0이면 생략)
+    LLM_BACKEND              openai(기본) | offline — offline이면 offline_llm의 결정적 대역 사용
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+LLM_WARMUP_CONNECTIONS = int(os.getenv("LLM_WARMUP_CONNECTIONS", "2"))
+
+_lock = threading.Lock()
+_http_client = None
+_chat_models = {}
+_embeddings = {}
+_pid = os.getpid()
+_warmed_pid = None
+
+
+def _registry_key(name, params):
+    # model_kwargs 같은 dict 파라미터도 키로 쓸 수 있게 repr로 고정
+    return (name, tuple(sorted((k, repr(v)) for k, v in params.items())))
+
+
+def is_offline_backend() -> bool:
+    """LLM_BACKEND=offline 여부 (load_dotenv 이후 값을 보도록 호출 시점에 읽음)"""
+    return os.getenv("LLM_BACKEND", "openai").strip().lower() == "offline"
+
+
+def _reset_after_fork():
+    """fork된 워커면 마스터에서 만든 클라이언트를 버리고 새로 만들게 함"""
+    global _http_client, _pid
+    if _pid == os.getpid():
+        return
+    with _lock:
+        if _pid != os.getpid():
+            # close()하지 않음: 소켓은 마스터와 공유라 TLS 종료를 보내면 마스터 쪽 커넥션이 깨짐
+            _http_client = None
+            _chat_models.clear()
+            _embeddings.clear()
+            _pid = os.getpid()
+
+
+def get_http_client() -> httpx.Client:
+    """모든 OpenAI 호출이 공유하는 keep-alive 커넥션 풀 (프로세스마다 하나)"""
+    global _http_client
+    _reset_after_fork()
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=LLM_POOL_SIZE,
+                    max_keepalive_connections=LLM_POOL_SIZE,
+                    keepalive_expiry=LLM_KEEPALIVE_SECONDS,
+                ),
+                timeout=httpx.Timeout(60.0, connect=5.0),
+            )
+        return _http_client
+
+
+def get_chat_model(model_name: str, **params) -> ChatOpenAI:
+    """(모델, 파라미터)별 공유 ChatOpenAI 인스턴스"""
+    _reset_after_fork()
+    key = _registry_key(model_name, params)
+    llm = _chat_models.get(key)
+    if llm is None:
+        http_client = get_http_client()
+        with _lock:
+            llm = _chat_models.get(key)
+            if llm is None:
+                if is_offline_backend():
+                    from offline_llm import OfflineChatModel
+                    llm = OfflineChatModel(model_name=model_name, **params)
+                else:
+                    llm = ChatOpenAI(model_name=model_name, http_client=http_client, **params)
+                _chat_models[key] = llm
+    return llm
+
+
+def get_embeddings(**params) -> OpenAIEmbeddings:
+    """파라미터별 공유 OpenAIEmbeddings 인스턴스"""
+    _reset_after_fork()
+    key = _registry_key("embeddings", params)
+    emb = _embeddings.get(key)
+    if emb is None:
+        http_client = get_http_client()
+        with _lock:
+            emb = _embeddings.get(key)
+            if emb is None:
+                if is_offline_backend():
+                    from offline_llm import HashingEmbeddings
+                    emb = HashingEmbeddings(**params)
+                else:
+                    emb = OpenAIEmbeddings(http_client=http_client, **params)
+                _embeddings[key] = emb
+    return emb
+
+
+def warm_up_connections(count: int = LLM_WARMUP_CONNECTIONS):
+    """토큰을 쓰지 않는 GET /models 요청을 동시에 보내 TLS 커넥션을 미리 풀에 채워 둠"""
+    if count <= 0 or is_offline_backend():
+        return
+    base_url = (os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1").rstrip("/")
+    headers = {"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY', '')}"}
+    client = get_http_client()
+
+    def ping(_):
+        try:
+            client.get(f"{base_url}/models", headers=headers, timeout=5.0)
+            return True
+        except Exception:
+            return False
+
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        opened = sum(pool.map(ping, range(count)))
+    print(f"🔌 OpenAI 커넥션 워밍업 완료 ({opened}/{count})")
+
+
+def warm_up_in_background(count: int = LLM_WARMUP_CONNECTIONS):
+    """서버 시작을 막지 않도록 백그라운드에서 워밍업 (프로세스마다 한 번)
+
+    gunicorn --preload면 마스터에서 부르지 말고 워커의 첫 요청에서 불러야 워커 풀이 채워짐
+    """
+    global _warmed_pid
+    if _warmed_pid == os.getpid():   # 요청마다 불려도 잠금 없이 바로 반환
+        return
+    _reset_after_fork()
+    with _lock:
+        if _warmed_pid == os.getpid():
+            return
+        _warmed_pid = os.getpid()
+    threading.Thread(target=warm_up_connections, args=(count,), daemon=True).start()
@@ -0,0 +1,185 @@
+"""네트워크/API 키 없이 돌아가는 결정적(deterministic) LLM·임베딩 대역 (부하 테스트/벤치마크용)
+
+LLM_BACKEND=offline 이면 llm_clients가 ChatOpenAI / OpenAIEmbeddings 대신 이 모듈의
+클래스를 돌려줍니다. 같은 입력에는 항상 같은 출력이 나오므로 처리량 측정을 재현할 수 있습니다.
+
+- HashingEmbeddings: 단어 + 글자 2-gram을 해싱한 고정 차원 벡터 (L2 정규화)
+- OfflineChatModel: 프롬프트 종류(관련성 YES/NO, 검증 PASS, 키워드, RAG 답변)에 맞춘
+  템플릿 응답 + 인위적 지연 + 토큰 사용량(usage_metadata) 보고
+
+환경변수:
+    OFFLINE_EMBEDDING_DIM        임베딩 차원 (기본 1536, text-embedding-ada-002와 동일)
+    OFFLINE_LLM_LATENCY          호출당 지연(초, 스트리밍은 첫 토큰까지, 기본 0)
+    OFFLINE_LLM_TOKEN_LATENCY    출력 토큰당 추가 지연(초, 기본 0)
+    OFFLINE_LLM_COMPLETION_TOKENS  보고할 출력 토큰 수 고정 (기본: 응답 길이로 추정)
+    OFFLINE_LLM_RESPONSES        정규식 → 응답 템플릿 JSON 파일 경로 (기본 규칙보다 우선)
+"""
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from openai import APITimeoutError
+from pydantic import Field
+
+_WORD_RE = re.compile(r"[0-9A-Za-z가-힣%]+")
+_QUESTION_RE = re.compile(r'질문:\s*"(.*?)"', re.S)
+
+
+def estimate_tokens(text: str) -> int:
+    """tiktoken 없이 대충 맞추는 토큰 수 (한국어는 대략 2글자당 1토큰)"""
+    return max(1, len(text) // 2) if text else 0
+
+
+class HashingEmbeddings(Embeddings):
+    """단어/글자 2-gram 해싱 임베딩. 프로세스가 달라도 같은 텍스트 → 같은 벡터"""
+
+    def __init__(self, dim: Optional[int] = None, **_ignored):
+        self.dim = dim or int(os.getenv("OFFLINE_EMBEDDING_DIM", "1536"))
+
+    def _features(self, text: str):
+        for word in _WORD_RE.findall(text.lower()):
+            yield word
+            # 한국어는 띄어쓰기가 들쭉날쭉해 글자 2-gram을 같이 넣어야 비슷한 문장끼리 가까워짐
+            for i in range(len(word) - 1):
+                yield word[i:i + 2]
+
+    def _embed(self, text: str) -> List[float]:
+        vec = np.zeros(self.dim, dtype="float32")
+        for feat in self._features(text):
+            h = int.from_bytes(hashlib.blake2b(feat.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        norm = float(np.linalg.norm(vec))
+        if norm > 0:
+            vec /= norm
+        return vec.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def load_canned_responses(path: Optional[str] = None) -> List[Dict[str, str]]:
+    """[{"match": "정규식", "response": "템플릿({question}, {context} 치환)"}, ...]"""
+    path = path or os.getenv("OFFLINE_LLM_RESPONSES")
+    if not path:
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class OfflineChatModel(BaseChatModel):
+    """ChatOpenAI 자리에 끼우는 결정적 채팅 모델 (invoke / stream / bind(timeout=) 지원)"""
+
+    model_name: str = "gpt-3.5-turbo"
+    temperature: float = 0
+    max_tokens: Optional[int] = None
+    model_kwargs: Dict[str, Any] = Field(default_factory=dict)
+    stream_usage: bool = False
+    max_retries: int = 2   # ChatOpenAI와 같은 인자를 받기 위한 자리 (오프라인은 재시도 없음)
+    latency: float = Field(default_factory=lambda: float(os.getenv("OFFLINE_LLM_LATENCY", "0")))
+    token_latency: float = Field(default_factory=lambda: float(os.getenv("OFFLINE_LLM_TOKEN_LATENCY", "0")))
+    completion_tokens: Optional[int] = Field(
+        default_factory=lambda: int(os.getenv("OFFLINE_LLM_COMPLETION_TOKENS", "0")) or None)
+    responses: List[Dict[str, str]] = Field(default_factory=load_canned_responses)
+
+    @property
+    def _llm_type(self) -> str:
+        return "offline-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "temperature": self.temperature}
+
+    # --- 응답 만들기 ---
+    def _respond(self, prompt: str) -> str:
+        m = _QUESTION_RE.search(prompt)
+        question = m.group(1) if m else ""
+        context = ""
+        if "#Context:" in prompt:
+            context = prompt.split("#Context:", 1)[1].split("#Question:", 1)[0].strip()
+            question = prompt.split("#Question:", 1)[1].split("#Answer:", 1)[0].strip() if "#Question:" in prompt else question
+
+        for rule in self.responses:
+            if re.search(rule["match"], prompt):
+                return rule["response"].replace("{question}", question).replace("{context}", context[:500])
+
+        if '"관련있음"' in prompt:
+            return "관련있음"
+        if '"YES"' in prompt:
+            return "YES"
+        if '"PASS"' in prompt:
+            return "PASS"
+        if prompt.rstrip().endswith("키워드:"):
+            words = []
+            for w in _WORD_RE.findall(question):
+                if len(w) >= 2 and w not in words:
+                    words.append(w)
+            return ", ".join(words[:5])
+        if context:
+            lines = [ln.strip() for ln in context.splitlines() if ln.strip()][:3]
+            bullets = "\n".join(f"- {ln[:120]}" for ln in lines)
+            return f"**[오프라인 응답]** {question}\n\n참고 자료:\n{bullets}"
+        return f"[오프라인 응답] {question}"
+
+    def _usage(self, prompt: str, text: str) -> Dict[str, int]:
+        out = self.completion_tokens or estimate_tokens(text)
+        if self.max_tokens:
+            out = min(out, self.max_tokens)
+        inp = estimate_tokens(prompt)
+        return {"input_tokens": inp, "output_tokens": out, "total_tokens": inp + out}
+
+    def _sleep(self, seconds: float, timeout: Optional[float], started: float):
+        """지연을 흉내내되, timeout을 넘기면 실제 OpenAI 클라이언트처럼 APITimeoutError"""
+        if timeout is not None and (time.monotonic() - started) + seconds > timeout:
+            time.sleep(max(0.0, timeout - (time.monotonic() - started)))
+            raise APITimeoutError(request=httpx.Request("POST", "offline://chat/completions"))
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def _metadata(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "finish_reason": "stop"}
+
+    @staticmethod
+    def _prompt_text(messages) -> str:
+        return "\n".join(str(m.content) for m in messages)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        started = time.monotonic()
+        prompt = self._prompt_text(messages)
+        text = self._respond(prompt)
+        usage = self._usage(prompt, text)
+        self._sleep(self.latency + self.token_latency * usage["output_tokens"], kwargs.get("timeout"), started)
+        message = AIMessage(content=text, usage_metadata=usage, response_metadata=self._metadata())
+        return ChatResult(generations=[ChatGeneration(message=message)],
+                          llm_output={"token_usage": {"prompt_tokens": usage["input_tokens"],
+                                                      "completion_tokens": usage["output_tokens"],
+                                                      "total_tokens": usage["total_tokens"]},
+                                      "model_name": self.model_name})
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        started = time.monotonic()
+        timeout = kwargs.get("timeout")
+        prompt = self._prompt_text(messages)
+        text = self._respond(prompt)
+        usage = self._usage(prompt, text)
+        self._sleep(self.latency, timeout, started)  # 첫 토큰까지의 지연
+        for piece in re.findall(r"\S+\s*|\s+", text):
+            self._sleep(self.token_latency * estimate_tokens(piece), timeout, started)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+        if self.stream_usage:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="", usage_metadata=usage, response_metadata=self._metadata()))